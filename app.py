@@ -1,14 +1,18 @@
 import streamlit as st
 
-from core.db import init_db
+from core import perf
+from core.cache import cache_stats
 from core.migrations import ensure_schema_migrations
+from core.settings import SHOW_CACHE_STATS, PERF_PANEL
+from graph.lru import all_cache_stats
 from core.scroll import ensure_router_state, soft_scroll_top, go
 
 from ui_pages.line_page import render_line_page
 from ui_pages.product_page import render_product_page
 from ui_pages.admin_page import render_admin_page
+from ui_pages.perf_panel import render_perf_panel
 from repo.lines import list_lines_sorted
-from repo.products import get_product
+from repo.products import get_product_brief
 from repo.lines import get_line
 
 
@@ -36,9 +40,9 @@ def apply_pending_navigation():
 
     # 同步产品下拉显示值
     if st.session_state.page == "产品详情" and st.session_state.product:
-        pr = get_product(st.session_state.product)
+        pr = get_product_brief(st.session_state.product)
         if pr:
-            st.session_state["product_selectbox"] = f'{pr["code"]} | {pr["name"]}'
+            st.session_state["product_selectbox"] = pr["code"]
 
     st.session_state.pending = None
 
@@ -46,7 +50,6 @@ def apply_pending_navigation():
 def main():
     st.set_page_config(page_title="产品关系展示（工程化）", layout="wide")
 
-    init_db()
     ensure_schema_migrations()
     ensure_router_state()
 
@@ -68,6 +71,10 @@ def main():
 
     chosen = st.sidebar.radio("页面", pages, key="nav_radio")
 
+    if SHOW_CACHE_STATS:
+        with st.sidebar.expander("缓存统计"):
+            st.json({"repo": cache_stats(), **all_cache_stats()})
+
     # 统一用 chosen 驱动 page
     if chosen != st.session_state.page:
         go(chosen, line_id=st.session_state.line_id, product_code=st.session_state.product)
@@ -77,13 +84,20 @@ def main():
     if chosen != st.session_state.page:
         go(chosen, line_id=st.session_state.line_id, product_code=st.session_state.product)
 
-    # Render
-    if st.session_state.page == "产品线":
-        render_line_page()
-    elif st.session_state.page == "产品详情":
-        render_product_page()
-    else:
-        render_admin_page()
+    # Render（st.rerun() 以异常跳出时也要结束本次 trace）
+    perf.start_trace(st.session_state.page)
+    try:
+        if st.session_state.page == "产品线":
+            render_line_page()
+        elif st.session_state.page == "产品详情":
+            render_product_page()
+        else:
+            render_admin_page()
+    finally:
+        trace = perf.end_trace()
+
+    if PERF_PANEL:
+        render_perf_panel(trace)
 
 
 if __name__ == "__main__":
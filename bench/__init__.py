@@ -0,0 +1,12 @@
+"""
+基准测试（不随应用加载）。
+
+每个脚本都在临时数据库上运行，不会改动项目里的 data.sqlite3：
+
+    python -m bench.reorder
+    python -m bench.relations
+    python -m bench.rel_index                # 内存关系索引：构建计时 + 补丁一致性检查
+    python -m bench.catalog out.sqlite3      # 生成合成目录
+    python -m bench.suite                    # 全量计时 / 基线对比
+    python -m bench.load                     # AppTest 并发会话压测（多进程）
+"""
@@ -0,0 +1,206 @@
+"""
+合成产品目录生成器：产品 / 产品线 / 关系的度数都服从幂律（少数枢纽，长尾大量）。
+
+    python -m bench.catalog out.sqlite3 [--products 10000] [--lines 100] [--relations 100000] [--images 50]
+
+- 产品线规模、线内枢纽产品都按 Zipf 权重抽样；约 15% 产品同时属于第二条线（跨线上下游）
+- strength / directed / relation_type / edge_label 混合取值
+- --images：用 Pillow 生成若干张小 PNG（与数据库同目录的 img/ 下，绝对路径入库），产品轮流引用
+- 先删掉触发器和二级索引，一个事务 + executemany 批量写入（synchronous=OFF），
+  再重放迁移步骤（全部幂等）补回触发器 / 索引并重建搜索索引
+"""
+import argparse
+import itertools
+import random
+import sqlite3
+import time
+from collections import Counter
+from pathlib import Path
+
+from core import db
+from core.migrations import MIGRATIONS, ensure_schema_migrations
+
+RELATION_TYPES = ("compatible", "requires", "optional", "replaces")
+EDGE_LABELS = ("RS485", "24V", "水路", "气路", "CAN", "USB")
+
+
+def _zipf_cum(n: int, s: float) -> list[float]:
+    """1..n 的 Zipf 累积权重（给 random.choices 的 cum_weights）。"""
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def _make_images(img_dir: Path, n: int, rnd: random.Random) -> list[str]:
+    try:
+        from PIL import Image
+    except ImportError:
+        return []
+    img_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n):
+        p = img_dir / f"bench_{i:05d}.png"
+        color = (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+        Image.new("RGB", (320 + (i % 5) * 40, 240), color).save(p)
+        paths.append(str(p.resolve()))
+    return paths
+
+
+def generate(
+    path,
+    products: int = 10000,
+    lines: int = 100,
+    relations: int = 100000,
+    images: int = 0,
+    seed: int = 42,
+    skew: float = 1.1,
+) -> dict:
+    """
+    生成目录到 path（已存在则覆盖）。
+
+    Returns:
+        统计：products / lines / members / relations / images / seconds，
+        以及 hub_line（成员最多的线）和 hub_product（关系最多的产品）
+    """
+    t0 = time.perf_counter()
+    path = Path(path)
+    for suffix in ("", "-wal", "-shm"):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+
+    rnd = random.Random(seed)
+    db.close_pools()
+    db.use_database(str(path))
+    ensure_schema_migrations()
+    db.close_pools()
+
+    codes = [f"P{i:07d}" for i in range(products)]
+    image_paths = _make_images(path.parent / "img", images, rnd)
+
+    # 产品 -> 主线（线规模幂律），约 15% 再进第二条线
+    line_cum = _zipf_cum(lines, skew)
+    line_ids = list(range(1, lines + 1))
+    members: dict[int, list[str]] = {lid: [] for lid in line_ids}
+    for code, lid in zip(codes, rnd.choices(line_ids, cum_weights=line_cum, k=products)):
+        members[lid].append(code)
+    for code in rnd.sample(codes, int(products * 0.15)):
+        lid = rnd.choice(line_ids)
+        if code not in members[lid][-50:]:
+            members[lid].append(code)
+    for lid in line_ids:
+        if not members[lid]:
+            members[lid].append(rnd.choice(codes))
+        # 去重且保序
+        members[lid] = list(dict.fromkeys(members[lid]))
+
+    # 关系按线成员数分配；线内端点按 Zipf 抽（靠前的成员是枢纽）
+    sizes = [len(members[lid]) for lid in line_ids]
+    per_line = Counter(rnd.choices(line_ids, weights=sizes, k=relations))
+    member_cum = _zipf_cum(max(sizes), skew)
+
+    def rel_rows():
+        for lid, cnt in per_line.items():
+            ms = members[lid]
+            n = len(ms)
+            if n < 2:
+                continue
+            idx = rnd.choices(range(n), cum_weights=member_cum[:n], k=2 * cnt)
+            for a, b in zip(idx[0::2], idx[1::2]):
+                if a == b:
+                    b = (b + 1) % n
+                r = rnd.random()
+                yield (
+                    lid,
+                    ms[a],
+                    ms[b],
+                    "strong" if r < 0.7 else "weak",
+                    1 if r < 0.85 or r >= 0.95 else 0,
+                    RELATION_TYPES[int(r * 1000) % len(RELATION_TYPES)],
+                    EDGE_LABELS[int(r * 10000) % len(EDGE_LABELS)] if r < 0.3 else None,
+                )
+
+    c = sqlite3.connect(str(path))
+    c.row_factory = sqlite3.Row  # 迁移步骤按列名取值
+    try:
+        c.execute("PRAGMA synchronous=OFF")
+        c.execute("PRAGMA foreign_keys=OFF")
+        with c:
+            # 触发器（变更日志 / 全文索引）和二级索引都会把每行插入放大几倍：先删，导完再补
+            for (name,) in c.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall():
+                c.execute(f'DROP TRIGGER "{name}"')
+            for (name,) in c.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL").fetchall():
+                c.execute(f'DROP INDEX "{name}"')
+
+            c.executemany(
+                "INSERT INTO product_lines(id, name, description, display_order) VALUES (?,?,?,?)",
+                ((lid, f"产品线 {lid:04d}", f"bench line {lid}", lid) for lid in line_ids),
+            )
+            c.executemany(
+                "INSERT INTO products(code, name, category, intro, detail, image_path) VALUES (?,?,?,?,?,?)",
+                (
+                    (
+                        code,
+                        f"产品 {code}",
+                        f"类别{i % 20:02d}",
+                        f"{code} 简介 " * 5,
+                        f"{code} 详细介绍 " * 40,
+                        image_paths[i % len(image_paths)] if image_paths else None,
+                    )
+                    for i, code in enumerate(codes)
+                ),
+            )
+            c.executemany(
+                "INSERT INTO line_products(line_id, product_code, sort_order, y_pos, is_main) VALUES (?,?,?,?,?)",
+                (
+                    (lid, code, float(i % 40), float(rnd.randrange(3)), 1 if i % 3 == 0 else 0)
+                    for lid in line_ids
+                    for i, code in enumerate(members[lid])
+                ),
+            )
+            c.executemany(
+                """
+                INSERT INTO relations(line_id, from_code, to_code, strength, directed, relation_type, edge_label)
+                VALUES (?,?,?,?,?,?,?)
+                """,
+                rel_rows(),
+            )
+        # 迁移步骤全部幂等（CREATE ... IF NOT EXISTS / 先检查再改），重放即补回触发器与索引
+        with c:
+            for _version, _desc, step, _fk_off in MIGRATIONS:
+                step(c)
+        c.execute("ANALYZE")
+        stats = {
+            "products": products,
+            "lines": lines,
+            "members": c.execute("SELECT COUNT(*) FROM line_products").fetchone()[0],
+            "relations": c.execute("SELECT COUNT(*) FROM relations").fetchone()[0],
+            "images": len(image_paths),
+            "hub_line": c.execute(
+                "SELECT line_id FROM line_products GROUP BY line_id ORDER BY COUNT(*) DESC LIMIT 1"
+            ).fetchone()[0],
+            "hub_product": c.execute(
+                "SELECT from_code FROM relations GROUP BY from_code ORDER BY COUNT(*) DESC LIMIT 1"
+            ).fetchone()[0],
+        }
+    finally:
+        c.close()
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("out", help="输出数据库文件")
+    ap.add_argument("--products", type=int, default=10000)
+    ap.add_argument("--lines", type=int, default=100)
+    ap.add_argument("--relations", type=int, default=100000)
+    ap.add_argument("--images", type=int, default=0)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    stats = generate(args.out, args.products, args.lines, args.relations, args.images, args.seed)
+    print(
+        f"{stats['products']} products / {stats['lines']} lines / {stats['members']} members / "
+        f"{stats['relations']} relations / {stats['images']} images in {stats['seconds']:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+端到端并发会话压测：用 streamlit.testing 的 AppTest 驱动 app.py，模拟多个会话同时浏览 / 编辑。
+
+    python -m bench.load [--sessions 24] [--actions 30] [--scale small] [--db path] [--out result.json]
+
+- 每个会话一个进程（ProcessPoolExecutor）：AppTest 每次 run 都会创建 / 销毁进程级的 Runtime，
+  同一进程里多线程并发跑会互相拆台，所以只能用进程池；各进程连同一个数据库副本，锁竞争是真实的
+- 会话动作按权重随机：产品线页（切换下拉）、产品详情页（搜索 + 选择）、后台编辑（改线内产品的 Y 并保存）
+- 统计：每次 rerun（at.run()）的耗时按动作汇总 p50 / p95 / p99；首次加载单独列出；
+  各进程峰值 RSS（ru_maxrss）；连接池等待 + BEGIN IMMEDIATE 拿写锁的等待时间
+- 数据库：--db 指定时先复制一份；否则按 --scale 生成合成目录（bench.catalog），都在临时目录里，原库不动
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from bench.suite import SCALES
+
+APP_FILE = Path(__file__).resolve().parent.parent / "app.py"
+
+# 动作：名称 -> 权重
+ACTIONS = {"line": 5, "detail": 4, "admin_edit": 1}
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _nav(at, page: str, rec) -> None:
+    radio = at.sidebar.radio(key="nav_radio")
+    if radio.value != page:
+        rec(radio.set_value(page))
+
+
+def _do_line(at, rnd, rec) -> None:
+    _nav(at, "产品线", rec)
+    box = at.selectbox(key="line_selectbox")
+    rec(box.set_value(rnd.choice(box.options)))
+
+
+def _do_detail(at, rnd, rec, codes: list[str]) -> None:
+    _nav(at, "产品详情", rec)
+    code = rnd.choice(codes)
+    rec(at.text_input(key="product_selectbox_q").set_value(code))
+    box = at.selectbox(key="product_selectbox")
+    if code in box.options:
+        rec(box.set_value(code))
+
+
+def _do_admin_edit(at, rnd, rec) -> None:
+    _nav(at, "后台管理", rec)
+    module = at.radio(key="admin_module_radio")
+    if module.value != "产品线内容管理":
+        rec(module.set_value("产品线内容管理"))
+    line_box = at.selectbox(key="admin_manage_line")
+    rec(line_box.set_value(rnd.choice(line_box.options)))
+    y_inputs = [n for n in at.number_input if str(n.key).startswith("lp_new_y_")]
+    if not y_inputs:
+        return
+    y_inputs[0].set_value(float(rnd.randrange(-2, 3)))
+    rec(at.button(key="lp_save_sort").click())
+
+
+def _session(idx: int, db_path: str, derived_dir: str, actions: int, think_ms: float, seed: int, barrier) -> dict:
+    """一个会话（在子进程里运行）：首次加载后等所有会话就绪，再执行 actions 个随机动作。"""
+    from streamlit.testing.v1 import AppTest
+
+    from core import db
+    from graph import thumbs
+
+    thumbs.DERIVED_DIR = Path(derived_dir)
+    db.use_database(db_path)
+    codes = [r["code"] for r in db.q_all("SELECT code FROM products")]
+    rnd = random.Random(seed + idx)
+
+    latencies: dict[str, list[float]] = {name: [] for name in ACTIONS}
+    errors: list[str] = []
+    at = AppTest.from_file(str(APP_FILE), default_timeout=120)
+    t0 = time.perf_counter()
+    at.run()
+    first_load = (time.perf_counter() - t0) * 1000
+
+    barrier.wait()
+    names = list(ACTIONS)
+    weights = list(ACTIONS.values())
+    for _ in range(actions):
+        name = rnd.choices(names, weights=weights)[0]
+
+        def rec(element, _name=name):
+            t = time.perf_counter()
+            element.run()
+            latencies[_name].append((time.perf_counter() - t) * 1000)
+            if at.exception:
+                errors.append(f"{_name}: {at.exception[0].message}")
+
+        try:
+            if name == "line":
+                _do_line(at, rnd, rec)
+            elif name == "detail":
+                _do_detail(at, rnd, rec, codes)
+            else:
+                _do_admin_edit(at, rnd, rec)
+        except Exception as e:  # noqa: BLE001 压测要跑完，错误计数即可
+            errors.append(f"{name}: {type(e).__name__}: {e}")
+        if think_ms:
+            time.sleep(rnd.uniform(0, 2 * think_ms) / 1000)
+
+    stats = db.pool_stats()
+    db.close_pools()
+    return {
+        "session": idx,
+        "first_load_ms": first_load,
+        "latencies": latencies,
+        "errors": errors,
+        "peak_rss_mb": _peak_rss_mb(),
+        "pool_wait_seconds": stats.get("wait_seconds", 0.0),
+        "write_locks": stats.get("write_locks", 0),
+        "write_lock_wait_seconds": stats.get("write_lock_wait_seconds", 0.0),
+    }
+
+
+def _percentiles(xs: list[float]) -> dict:
+    if not xs:
+        return {"n": 0}
+    if len(xs) == 1:
+        return {"n": 1, "p50": xs[0], "p95": xs[0], "p99": xs[0], "max": xs[0]}
+    q = statistics.quantiles(xs, n=100, method="inclusive")
+    return {"n": len(xs), "p50": q[49], "p95": q[94], "p99": q[98], "max": max(xs)}
+
+
+def summarize(results: list[dict], wall_seconds: float) -> dict:
+    """把各会话结果汇总成 rerun 延迟分位数 / 峰值 RSS / 锁等待。"""
+    per_action: dict[str, list[float]] = {name: [] for name in ACTIONS}
+    for r in results:
+        for name, xs in r["latencies"].items():
+            per_action[name].extend(xs)
+    every = [x for xs in per_action.values() for x in xs]
+    rss = [r["peak_rss_mb"] for r in results if r["peak_rss_mb"] is not None]
+    return {
+        "sessions": len(results),
+        "wall_seconds": wall_seconds,
+        "reruns": len(every),
+        "reruns_per_second": len(every) / wall_seconds if wall_seconds > 0 else 0.0,
+        "rerun_ms": _percentiles(every),
+        "per_action_ms": {name: _percentiles(xs) for name, xs in per_action.items()},
+        "first_load_ms": _percentiles([r["first_load_ms"] for r in results]),
+        "peak_rss_mb": {"max": max(rss), "sum": sum(rss)} if rss else None,
+        "pool_wait_seconds": sum(r["pool_wait_seconds"] for r in results),
+        "write_locks": sum(r["write_locks"] for r in results),
+        "write_lock_wait_seconds": sum(r["write_lock_wait_seconds"] for r in results),
+        "errors": [e for r in results for e in r["errors"]],
+    }
+
+
+def _print_summary(s: dict) -> None:
+    def row(label: str, p: dict) -> None:
+        if not p.get("n"):
+            print(f"  {label:<12} {'-':>6}")
+            return
+        print(
+            f"  {label:<12} {p['n']:6d} {p['p50']:9.1f} {p['p95']:9.1f} {p['p99']:9.1f} {p['max']:9.1f}"
+        )
+
+    print(
+        f"{s['sessions']} sessions, {s['reruns']} reruns in {s['wall_seconds']:.1f}s "
+        f"({s['reruns_per_second']:.1f} reruns/s)"
+    )
+    print(f"  {'rerun ms':<12} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    row("all", s["rerun_ms"])
+    for name, p in s["per_action_ms"].items():
+        row(name, p)
+    row("first load", s["first_load_ms"])
+    if s["peak_rss_mb"]:
+        print(f"peak RSS: {s['peak_rss_mb']['max']:.0f} MB per session process, {s['peak_rss_mb']['sum']:.0f} MB total")
+    print(
+        f"lock wait: pool {s['pool_wait_seconds'] * 1000:.1f} ms, "
+        f"BEGIN IMMEDIATE {s['write_lock_wait_seconds'] * 1000:.1f} ms over {s['write_locks']} write transactions"
+    )
+    if s["errors"]:
+        print(f"errors ({len(s['errors'])}):")
+        for e in s["errors"][:20]:
+            print(f"  {e}")
+
+
+def run(db_path: str, sessions: int, actions: int, think_ms: float = 0.0, seed: int = 42) -> dict:
+    """在 db_path 的临时副本上跑一轮压测，返回汇总结果。"""
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = str(Path(tmp) / "load.sqlite3")
+        with sqlite3.connect(db_path) as a, sqlite3.connect(copy) as b:
+            a.backup(b)
+        derived = str(Path(tmp) / "img_derived")
+        with multiprocessing.Manager() as mgr:
+            barrier = mgr.Barrier(sessions)
+            with ProcessPoolExecutor(max_workers=sessions) as pool:
+                t0 = time.perf_counter()
+                futures = [
+                    pool.submit(_session, i, copy, derived, actions, think_ms, seed, barrier)
+                    for i in range(sessions)
+                ]
+                results = [f.result() for f in futures]
+                wall = time.perf_counter() - t0
+    # 墙钟时间含各进程的导入与首次加载；吞吐按动作阶段估算会偏低，只作参考
+    return summarize(results, wall)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sessions", type=int, default=24)
+    ap.add_argument("--actions", type=int, default=30, help="每个会话执行的随机动作数")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="动作之间的平均停顿（毫秒）")
+    ap.add_argument("--db", help="用该数据库的副本（默认按 --scale 生成合成目录）")
+    ap.add_argument("--scale", default="small", help=f"合成目录规模：{', '.join(SCALES)}")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="把汇总结果写到 JSON 文件")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db:
+            src = args.db
+        else:
+            if args.scale not in SCALES:
+                ap.error(f"unknown scale {args.scale!r}")
+            from bench.catalog import generate
+            from core import db
+
+            src = str(Path(tmp) / "catalog.sqlite3")
+            stats = generate(src, **SCALES[args.scale], seed=args.seed)
+            db.close_pools()
+            print(
+                f"[{args.scale}] {stats['products']} products / {stats['lines']} lines / "
+                f"{stats['relations']} relations generated in {stats['seconds']:.1f}s"
+            )
+        summary = run(src, args.sessions, args.actions, args.think_ms, args.seed)
+        summary["meta"] = {
+            "db": args.db or f"catalog:{args.scale}",
+            "actions_per_session": args.actions,
+            "think_ms": args.think_ms,
+            "cpus": os.cpu_count(),
+            "created_at": time.time(),
+        }
+
+    _print_summary(summary)
+    if args.out:
+        Path(args.out).write_text(json.dumps(summary, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
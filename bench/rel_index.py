@@ -0,0 +1,123 @@
+"""
+内存关系索引（repo.rel_index）基准 + 补丁一致性检查。
+
+    python -m bench.rel_index [--products 5000] [--relations 50000] [--writes 500] [--seed 42]
+
+- 在临时目录生成合成目录（bench.catalog），计时整体构建
+- 随机执行新增 / 删除 / 修改关系（含先新增后删除、同一条反复修改），每步之后打补丁，
+  定期与重新 build() 的索引比较：关系数、每个产品的出边 / 入边集合都必须一致
+- 不一致时打印差异并返回码 1
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.catalog import generate
+from core import db
+from repo import rel_index
+from repo.relations import create_relation, delete_relation, update_relation
+
+
+def _edges(index: rel_index.RelationIndex) -> dict[str, set]:
+    """按产品 code 汇总出边 / 入边（rel_id, 对端 code, line_id, strong, directed），与产品 id 编号无关。"""
+    codes = index.codes
+    out = {}
+    for u, code in enumerate(codes):
+        out[code] = (
+            {(e[0], codes[e[2]], e[3], e[4], e[5]) for e in index.out_edges(u)},
+            {(e[0], codes[e[1]], e[3], e[4], e[5]) for e in index.in_edges(u)},
+        )
+    return {k: v for k, v in out.items() if v[0] or v[1]}
+
+
+def _compare(patched: rel_index.RelationIndex) -> list[str]:
+    fresh = rel_index.RelationIndex.build(patched.db_path, patched.rev)
+    problems = []
+    if len(patched) != len(fresh):
+        problems.append(f"len: patched={len(patched)} fresh={len(fresh)}")
+    a, b = _edges(patched), _edges(fresh)
+    for code in sorted(set(a) | set(b)):
+        if a.get(code) != b.get(code):
+            problems.append(f"edges of {code}: patched={a.get(code)} fresh={b.get(code)}")
+            if len(problems) > 10:
+                break
+    return problems
+
+
+def _write(rnd: random.Random, codes: list[str], line_ids: list[int], mine: list[int]) -> None:
+    """一次随机写入；mine 记下本轮新增的关系 id，优先对它们做删除 / 修改（覆盖叠加层里的边）。"""
+    op = rnd.random()
+    if op < 0.45 or not mine:
+        a, b = rnd.sample(codes, 2)
+        try:
+            create_relation(rnd.choice(line_ids), a, b, rnd.choice(["strong", "weak"]), rnd.randrange(2), "bench", None)
+        except Exception:  # noqa: BLE001 唯一约束冲突：跳过
+            return
+        mine.append(int(db.q_one("SELECT MAX(id) AS id FROM relations")["id"]))
+        return
+    own = rnd.random() < 0.5
+    rid = mine.pop(rnd.randrange(len(mine))) if own else int(
+        db.q_one("SELECT id FROM relations ORDER BY random() LIMIT 1")["id"]
+    )
+    if op < 0.75:
+        delete_relation(rid)
+        return
+    try:
+        update_relation(rid, rnd.choice(["strong", "weak"]), rnd.randrange(2), f"bench{rnd.randrange(3)}", None)
+    except Exception:  # noqa: BLE001
+        pass
+    if own:
+        mine.append(rid)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--products", type=int, default=5000)
+    ap.add_argument("--relations", type=int, default=50000)
+    ap.add_argument("--writes", type=int, default=500)
+    ap.add_argument("--check-every", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "rel_index.sqlite3")
+        generate(path, products=args.products, lines=20, relations=args.relations, seed=args.seed)
+        db.close_pools()
+        db.use_database(path)
+        rel_index.invalidate()
+
+        t0 = time.perf_counter()
+        index = rel_index.get_index()
+        print(f"build: {time.perf_counter() - t0:.2f}s  {index.stats()}")
+
+        rnd = random.Random(args.seed)
+        codes = [r["code"] for r in db.q_all("SELECT code FROM products")]
+        line_ids = [r["id"] for r in db.q_all("SELECT id FROM product_lines")]
+        mine: list[int] = []
+        problems = []
+        patch_s = 0.0
+        for i in range(1, args.writes + 1):
+            _write(rnd, codes, line_ids, mine)
+            t = time.perf_counter()
+            index = rel_index.get_index()
+            patch_s += time.perf_counter() - t
+            if i % args.check_every == 0 or i == args.writes:
+                problems = _compare(index)
+                print(f"after {i} writes: overlay={index.overlay_size()} len={len(index)} "
+                      f"{'OK' if not problems else 'MISMATCH'}")
+                if problems:
+                    break
+        print(f"patch: {patch_s / max(1, i) * 1000:.2f} ms per write")
+        db.close_pools()
+
+    if problems:
+        for p in problems:
+            print(f"  {p}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+线内关系过滤基准：IN (?,?,...) 参数列表 vs JOIN line_products vs json_each 子集。
+
+    python -m bench.relations [--members 10000] [--relations 100000] [--repeat 3]
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from core import db
+from core.migrations import ensure_schema_migrations
+from repo.relations import list_relations_filtered, list_relations_of_members
+
+LINE_ID = 1
+
+
+def _seed(members: int, relations: int, seed: int = 42) -> list[str]:
+    rnd = random.Random(seed)
+    codes = [f"P{i:07d}" for i in range(members)]
+    with db.transaction():
+        db.exec_sql("INSERT INTO product_lines(id, name, description, display_order) VALUES (?,?,?,?)", (LINE_ID, "bench", "", 1))
+        db.exec_many("INSERT INTO products(code, name) VALUES (?,?)", [(c, c) for c in codes])
+        db.exec_many(
+            "INSERT INTO line_products(line_id, product_code, sort_order, y_pos, is_main) VALUES (?,?,?,?,?)",
+            [(LINE_ID, c, float(i % 50), 0.0, 0) for i, c in enumerate(codes)],
+        )
+        db.exec_many(
+            "INSERT INTO relations(line_id, from_code, to_code, strength, directed) VALUES (?,?,?,?,?)",
+            [(LINE_ID, rnd.choice(codes), rnd.choice(codes), "strong", 1) for _ in range(relations)],
+        )
+    return codes
+
+
+def _legacy_filtered(line_id: int, codes: list[str]) -> list[sqlite3.Row]:
+    """旧实现：成员列表绑定两次。"""
+    ph = ",".join(["?"] * len(codes))
+    return db.q_all(
+        f"""
+        SELECT *
+        FROM relations
+        WHERE line_id=?
+          AND from_code IN ({ph})
+          AND to_code IN ({ph})
+        """,
+        tuple([line_id] + codes + codes),
+    )
+
+
+def _time(fn, repeat: int) -> tuple[float, int]:
+    best, n = float("inf"), 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        n = len(fn())
+        best = min(best, time.perf_counter() - t0)
+    return best, n
+
+
+def _run(label: str, fn, repeat: int) -> None:
+    try:
+        t, n = _time(fn, repeat)
+    except sqlite3.OperationalError as e:
+        print(f"  {label:<28}: {'failed':>10}   ({e})")
+        return
+    print(f"  {label:<28}: {t * 1000:10.1f} ms   rows={n}")
+
+
+def _suite(codes: list[str], repeat: int) -> None:
+    # 旧写法在复合索引下会退化成 codes×codes 逐对查找（数十秒），只跑一次
+    half = codes[: len(codes) // 2]
+    _run("IN list (all members) x1", lambda: _legacy_filtered(LINE_ID, codes), 1)
+    _run("JOIN line_products", lambda: list_relations_of_members.uncached(LINE_ID), repeat)
+    _run("json_each (all members)", lambda: list_relations_filtered.uncached(LINE_ID, codes), repeat)
+    _run("IN list (half) x1", lambda: _legacy_filtered(LINE_ID, half), 1)
+    _run("json_each (half)", lambda: list_relations_filtered.uncached(LINE_ID, half), repeat)
+    _run("plain SELECT by line_id", lambda: db.q_all("SELECT * FROM relations WHERE line_id=?", (LINE_ID,)), repeat)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--members", type=int, default=10000)
+    ap.add_argument("--relations", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.use_database(str(Path(tmp) / "bench.sqlite3"))
+        ensure_schema_migrations()
+        codes = _seed(args.members, args.relations)
+
+        print(f"{args.members} members / {args.relations} relations (best of {args.repeat})")
+        print("with idx_rel_line_pair(line_id, from_code, to_code):")
+        _suite(codes, args.repeat)
+
+        db.exec_sql("DROP INDEX idx_rel_line_pair")
+        db.exec_sql("CREATE INDEX idx_rel_line ON relations(line_id)")
+        print("with idx_rel_line(line_id) only:")
+        _suite(codes, args.repeat)
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
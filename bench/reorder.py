@@ -0,0 +1,71 @@
+"""
+产品线重排基准：逐条提交 vs 单事务 executemany。
+
+    python -m bench.reorder [--lines 5000] [--repeat 3]
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from core import db
+from core.migrations import ensure_schema_migrations
+from repo.lines import move_line_rank
+
+
+def _seed(n: int) -> None:
+    db.exec_many(
+        "INSERT INTO product_lines(name, description, display_order) VALUES (?,?,?)",
+        [(f"L{i:06d}", "", i) for i in range(1, n + 1)],
+    )
+
+
+def _legacy_move(db_path: str, line_id: int, new_rank: int) -> None:
+    """旧实现：每条 UPDATE 新开连接 + 单独提交。"""
+    with sqlite3.connect(db_path) as c:
+        ids = [r[0] for r in c.execute("SELECT id FROM product_lines ORDER BY COALESCE(display_order, 999999), id")]
+    ids.remove(line_id)
+    ids.insert(new_rank - 1, line_id)
+    for i, lid in enumerate(ids, start=1):
+        c = sqlite3.connect(db_path)
+        c.execute("PRAGMA foreign_keys=ON;")
+        c.execute("UPDATE product_lines SET display_order=? WHERE id=?", (i, lid))
+        c.commit()
+        c.close()
+
+
+def _time(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--lines", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "bench.sqlite3")
+        db.use_database(path)
+        ensure_schema_migrations()
+        _seed(args.lines)
+
+        n = args.lines
+        legacy = _time(lambda: _legacy_move(path, n, 1), args.repeat)
+        batched = _time(lambda: move_line_rank(n, 1), args.repeat)
+        db.close_pools()
+
+    print(f"reorder {n} lines (best of {args.repeat})")
+    print(f"  per-statement commit : {legacy * 1000:10.1f} ms")
+    print(f"  single transaction   : {batched * 1000:10.1f} ms")
+    print(f"  speedup              : {legacy / batched:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
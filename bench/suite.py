@@ -0,0 +1,197 @@
+"""
+基准套件：在几种规模的合成目录上给 repo/* 与图构建计时，可保存 / 对比基线 JSON。
+
+    python -m bench.suite [--scales small,medium] [--repeat 5] [--out result.json]
+    python -m bench.suite --save-baseline bench/baseline.json
+    python -m bench.suite --baseline bench/baseline.json [--tolerance 0.25] [--fail]
+
+- 读函数：repo.explain.read_functions() 里的全部函数（绕过读缓存，测的是 SQL + 取行）
+- 写函数：repo.explain.write_steps() 一整组，重复 --repeat 轮
+- 图：build_line_graph / build_product_graph_global（冷：清空读缓存与 graph/ 缓存；热：直接再调一次）、
+  node_for_product（带图片）
+- 对比：中位数比基线慢超过 tolerance 且绝对差超过 --min-delta-ms 记为回归；--fail 时返回码 1
+- bench/baseline.json 是提交在仓库里的参考基线（small + medium，meta 里记着机器 / Python / SQLite 版本）；
+  基线与机器相关，meta 与本机不同时对比会先提示，换机器后先 --save-baseline 重新生成
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.catalog import generate
+from core import db
+from core.cache import repo_cache
+
+SCALES = {
+    "small": dict(products=1_000, lines=20, relations=10_000, images=20),
+    "medium": dict(products=10_000, lines=100, relations=100_000, images=50),
+    "large": dict(products=50_000, lines=200, relations=1_000_000, images=100),
+}
+
+
+def _measure(fn, repeat: int, before=None) -> dict:
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "n": len(samples)}
+
+
+def _cold() -> None:
+    from graph.lru import clear_all_caches
+
+    repo_cache.invalidate()
+    clear_all_caches()
+
+
+def run_scale(name: str, repeat: int, log=print) -> dict:
+    """生成一个规模的目录并计时；返回 {"catalog": 统计, "timings": {名称: 结果}}。"""
+    from graph import thumbs
+    from graph.build_line import build_line_graph
+    from graph.build_product_global import build_product_graph_global
+    from graph.nodes import node_for_product
+    from repo.explain import call_args, read_functions, sample_values, write_steps
+
+    timings: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = generate(Path(tmp) / "bench.sqlite3", **SCALES[name])
+        log(
+            f"[{name}] {stats['products']} products / {stats['lines']} lines / "
+            f"{stats['relations']} relations generated in {stats['seconds']:.1f}s"
+        )
+        # 派生图片写到临时目录，不碰项目里的 img_derived/
+        thumbs.DERIVED_DIR = Path(tmp) / "img_derived"
+        db.use_database(str(Path(tmp) / "bench.sqlite3"))
+        try:
+            samples = sample_values()
+            line_id = stats["hub_line"]
+            code = stats["hub_product"]
+
+            for label, fn in read_functions():
+                kwargs = call_args(fn, samples)
+                timings[label] = _measure(lambda: fn(**kwargs), repeat)
+
+            steps = write_steps(samples)
+            per_step: dict[str, list[float]] = {label: [] for label, _, _ in steps}
+            for _ in range(repeat):
+                for label, fn, kwargs in steps:
+                    t0 = time.perf_counter()
+                    fn(**kwargs)
+                    per_step[label].append((time.perf_counter() - t0) * 1000)
+            for label, xs in per_step.items():
+                timings[label] = {"median_ms": statistics.median(xs), "min_ms": min(xs), "n": len(xs)}
+
+            # 先跑一遍生成派生图片，之后的“冷”只指进程内缓存为空
+            build_line_graph(line_id)
+            build_product_graph_global(code)
+            timings["graph.build_line_graph[cold]"] = _measure(lambda: build_line_graph(line_id), repeat, _cold)
+            timings["graph.build_line_graph[warm]"] = _measure(lambda: build_line_graph(line_id), repeat)
+            timings["graph.build_product_graph_global[cold]"] = _measure(
+                lambda: build_product_graph_global(code), repeat, _cold
+            )
+            timings["graph.build_product_graph_global[warm]"] = _measure(
+                lambda: build_product_graph_global(code), repeat
+            )
+
+            img = db.q_one("SELECT code, name, image_path FROM products WHERE image_path IS NOT NULL LIMIT 1")
+            if img is not None:
+                args = (img["code"], img["name"], img["image_path"])
+                timings["graph.node_for_product[cold]"] = _measure(lambda: node_for_product(*args), repeat, _cold)
+                timings["graph.node_for_product[warm]"] = _measure(lambda: node_for_product(*args), repeat)
+        finally:
+            db.close_pools()
+            _cold()
+    return {"catalog": stats, "timings": timings}
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list[str]:
+    """逐项对比中位数，打印表格；返回回归项。"""
+    regressions = []
+    for scale, cur in current["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if base is None:
+            print(f"[{scale}] not in baseline")
+            continue
+        print(f"[{scale}] {'name':<58} {'base ms':>10} {'now ms':>10} {'ratio':>7}")
+        for name, t in cur["timings"].items():
+            b = base["timings"].get(name)
+            if b is None:
+                print(f"  {name:<58} {'-':>10} {t['median_ms']:10.2f}     new")
+                continue
+            ratio = t["median_ms"] / b["median_ms"] if b["median_ms"] > 0 else float("inf")
+            slower = t["median_ms"] > b["median_ms"] * (1 + tolerance) and t["median_ms"] - b["median_ms"] > min_delta_ms
+            mark = "  !! slower" if slower else ""
+            print(f"  {name:<58} {b['median_ms']:10.2f} {t['median_ms']:10.2f} {ratio:7.2f}{mark}")
+            if slower:
+                regressions.append(f"{scale}: {name} {b['median_ms']:.2f} -> {t['median_ms']:.2f} ms")
+        for name in base["timings"].keys() - cur["timings"].keys():
+            print(f"  {name:<58} (missing)")
+    return regressions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--scales", default="small,medium", help=f"逗号分隔：{', '.join(SCALES)}")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", help="把本次结果写到 JSON 文件")
+    ap.add_argument("--save-baseline", help="把本次结果保存为基线")
+    ap.add_argument("--baseline", help="与该基线对比")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="允许变慢的比例（默认 25%%）")
+    ap.add_argument("--min-delta-ms", type=float, default=0.5, help="绝对差小于此值不算回归（过滤噪声）")
+    ap.add_argument("--fail", action="store_true", help="有回归时返回码 1")
+    args = ap.parse_args()
+
+    result = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": args.repeat,
+            "created_at": time.time(),
+        },
+        "scales": {},
+    }
+    for name in [s.strip() for s in args.scales.split(",") if s.strip()]:
+        if name not in SCALES:
+            ap.error(f"unknown scale {name!r}")
+        result["scales"][name] = run_scale(name, args.repeat)
+
+    for path in filter(None, [args.out, args.save_baseline]):
+        Path(path).write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"saved {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        base_meta = baseline.get("meta", {})
+        diff = [k for k in ("python", "sqlite", "platform", "machine", "cpus") if base_meta.get(k) != result["meta"][k]]
+        if diff:
+            print("note: baseline was recorded on a different setup (" + ", ".join(
+                f"{k}: {base_meta.get(k)} vs {result['meta'][k]}" for k in diff
+            ) + "); ratios are only indicative\n")
+        regressions = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\nregressions ({len(regressions)}):")
+            for r in regressions:
+                print(f"  {r}")
+            if args.fail:
+                sys.exit(1)
+    elif not args.save_baseline:
+        for scale, r in result["scales"].items():
+            print(f"[{scale}]")
+            for name, t in r["timings"].items():
+                print(f"  {name:<58} {t['median_ms']:10.2f} ms  (min {t['min_ms']:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import functools
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from core import db
+from core.settings import REPO_CACHE_MAX_ENTRIES
+
+
+class _DataVersionWatcher:
+    """
+    每个数据库文件一条专用连接，只用来读 PRAGMA data_version。
+
+    data_version 在“其他连接”提交后变化：本进程连接池里的写、其他进程
+    （命令行工具、另一个 Streamlit 实例）的写都能被发现。
+    """
+
+    def __init__(self):
+        self._conns: dict[str, sqlite3.Connection] = {}
+        self._lock = threading.Lock()
+
+    def version(self, db_path: str) -> int:
+        with self._lock:
+            c = self._conns.get(db_path)
+            if c is None:
+                c = self._conns[db_path] = sqlite3.connect(db_path, check_same_thread=False)
+            return int(c.execute("PRAGMA data_version").fetchone()[0])
+
+
+class QueryCache:
+    """
+    进程级 LRU 读缓存：key=(数据库, 函数, 参数)。
+
+    失效：每次读取前比较全局版本 (本进程写入计数, data_version)，
+    有任何变化就整体清空——写少读多，整体失效足够简单且不会读到旧数据。
+    """
+
+    def __init__(self, max_entries: int = REPO_CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, int(max_entries))
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._watcher = _DataVersionWatcher()
+        self._version = None
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def current_version(self) -> tuple:
+        path = db.current_db_path()
+        return (path, db.write_seq(), self._watcher.version(path))
+
+    def _sync_version(self, version: tuple) -> None:
+        # 调用方持有 self._lock
+        if version != self._version:
+            if self._data:
+                self._stats["invalidations"] += 1
+            self._data.clear()
+            self._version = version
+
+    def get_or_load(self, key, loader: Callable):
+        version = self.current_version()
+        with self._lock:
+            self._sync_version(version)
+            if key in self._data:
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._data[key]
+            self._stats["misses"] += 1
+
+        value = loader()
+
+        # 加载期间若有写入，结果可能已过期：不入缓存
+        if self.current_version() != version:
+            return value
+        with self._lock:
+            if self._version == version:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._version = None
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._data), "max_entries": self.max_entries}
+
+
+repo_cache = QueryCache()
+
+
+def _freeze(v):
+    """把 list/set/dict 参数转成可哈希的 key。"""
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    if isinstance(v, (set, frozenset)):
+        return frozenset(_freeze(x) for x in v)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    return v
+
+
+def cached_read(fn: Callable) -> Callable:
+    """
+    repo 读函数装饰器：结果进入进程级读缓存。
+
+    注意：
+    - 返回值在会话之间共享，调用方不得原地修改（需要排序/增删时先复制）
+    - 写操作（exec_sql / exec_many / transaction）提交后自动失效
+    - 事务内调用直接查库，能看到本事务尚未提交的写入
+    """
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if db.in_transaction():
+            return fn(*args, **kwargs)
+        key = (name, _freeze(args), _freeze(kwargs))
+        return repo_cache.get_or_load(key, lambda: fn(*args, **kwargs))
+
+    wrapper.uncached = fn
+    return wrapper
+
+
+def cache_stats() -> dict:
+    """读缓存统计：hits / misses / evictions / invalidations / entries。"""
+    return repo_cache.stats()
@@ -1,117 +1,398 @@
 import sqlite3
-from typing import Optional
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
 
-from core.settings import DB_PATH
+from core import slowlog
+from core.settings import (
+    DB_PATH,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_BUSY_TIMEOUT_MS,
+    DB_SYNCHRONOUS,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    SLOW_QUERY_MS,
+)
 
 
-def conn() -> sqlite3.Connection:
+def _open_connection(db_path: str) -> sqlite3.Connection:
     """
-    创建并返回 SQLite 连接（带 row_factory + foreign_keys）。
+    打开一条新连接并设置 PRAGMA（每条连接只做一次）。
 
     约定：
-    - 所有 SQL 使用 ? 参数，占位避免注入
+    - WAL：读写互不阻塞，多会话并发时不再被回滚日志锁住
     - foreign_keys 必须每连接开启一次（SQLite 特性）
+    - check_same_thread=False：连接会在线程间复用，但同一时刻只借给一个线程
     """
-    c = sqlite3.connect(DB_PATH)
+    c = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False)
     c.row_factory = sqlite3.Row
+    c.execute("PRAGMA journal_mode=WAL;")
+    c.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)};")
+    c.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS};")
+    c.execute(f"PRAGMA cache_size={-int(DB_CACHE_SIZE_KB)};")
+    c.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)};")
     c.execute("PRAGMA foreign_keys=ON;")
     return c
 
 
+class ConnectionPool:
+    """
+    单个数据库文件的有界连接池。
+
+    - 空闲连接 LIFO 复用（最近用过的页缓存最热）
+    - 打开数达到 max_size 后借用方等待，超时抛 OperationalError
+    """
+
+    def __init__(self, db_path: str, max_size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max(1, int(max_size))
+        self.timeout = float(timeout)
+        self._idle: list[sqlite3.Connection] = []
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "acquired": 0,
+            "reused": 0,
+            "opened": 0,
+            "closed": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "peak_in_use": 0,
+            "write_locks": 0,
+            "write_lock_wait_seconds": 0.0,
+        }
+
+    def acquire(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + self.timeout
+        waited_from = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    c = self._idle.pop()
+                    self._stats["reused"] += 1
+                    break
+                if self._open < self.max_size:
+                    # 先占位，真正 connect 放到锁外
+                    self._open += 1
+                    c = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"connection pool exhausted ({self.max_size} connections to {self.db_path})"
+                    )
+                if waited_from is None:
+                    waited_from = time.monotonic()
+                    self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+            if waited_from is not None:
+                self._stats["wait_seconds"] += time.monotonic() - waited_from
+            self._in_use += 1
+            self._stats["acquired"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._in_use)
+
+        if c is None:
+            try:
+                c = _open_connection(self.db_path)
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["opened"] += 1
+        return c
+
+    def release(self, c: sqlite3.Connection) -> None:
+        # 借用方异常退出时可能残留未结束事务：归还前回滚，避免下一个借用方继承锁
+        try:
+            if c.in_transaction:
+                c.rollback()
+            broken = False
+        except sqlite3.Error:
+            broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._open -= 1
+                self._stats["closed"] += 1
+            else:
+                self._idle.append(c)
+            self._cond.notify()
+
+        if broken:
+            try:
+                c.close()
+            except sqlite3.Error:
+                pass
+
+    def record_write_lock(self, seconds: float) -> None:
+        """记录一次 BEGIN IMMEDIATE 拿写锁的耗时（被其他写事务占用时即为等锁时间）。"""
+        with self._cond:
+            self._stats["write_locks"] += 1
+            self._stats["write_lock_wait_seconds"] += seconds
+
+    def close_idle(self) -> None:
+        """关闭所有空闲连接（借出中的连接归还后仍会进入池）。"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._stats["closed"] += len(idle)
+        for c in idle:
+            try:
+                c.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "db_path": self.db_path,
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+            }
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_db_path = str(DB_PATH)
+
+# 本进程写入计数：每次有行变更的连接归还（已提交或已回滚）后 +1，供读缓存判断失效
+_write_seq = 0
+_write_seq_lock = threading.Lock()
+
+# 线程当前借用的连接：{db_path: [connection, depth]}，用于同线程嵌套 conn() 时复用
+_local = threading.local()
+
+# SQL 观察者：每条 q_all / q_one / exec_sql / exec_many 执行后回调 hook(sql, params, seconds, rows)
+_query_hooks: list[Callable[[str, object, float, int], None]] = []
+
+
+def use_database(db_path) -> None:
+    """
+    切换当前进程使用的数据库文件（给命令行工具 / 基准测试用；应用本身不需要调用）。
+    """
+    global _db_path
+    _db_path = str(db_path)
+
+
+def current_db_path() -> str:
+    """当前使用的数据库文件路径。"""
+    return _db_path
+
+
+def get_pool(db_path: Optional[str] = None) -> ConnectionPool:
+    """按数据库文件取连接池（进程内单例）。"""
+    path = db_path or _db_path
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path)
+    return pool
+
+
+def _bump_write_seq() -> None:
+    global _write_seq
+    with _write_seq_lock:
+        _write_seq += 1
+
+
+def write_seq() -> int:
+    """本进程写入计数（只增不减）。"""
+    return _write_seq
+
+
+def in_transaction() -> bool:
+    """当前线程是否持有连接且处于未提交事务中（此时读缓存必须绕过）。"""
+    entry = getattr(_local, "held", {}).get(_db_path)
+    return entry is not None and entry[0].in_transaction
+
+
+def add_query_hook(hook: Callable[[str, object, float, int], None]) -> None:
+    """
+    注册 SQL 观察者（诊断 / 性能追踪用）。
+
+    hook(sql, params, seconds, rows) 在语句执行完、连接仍被当前线程持有时同步调用；
+    rows 为返回行数（查询）或受影响行数（写）；exec_many 的 params 是参数组列表。
+    hook 抛出的异常会被忽略。
+    """
+    if hook not in _query_hooks:
+        _query_hooks.append(hook)
+
+
+def remove_query_hook(hook: Callable[[str, object, float, int], None]) -> None:
+    """注销 SQL 观察者（未注册时忽略）。"""
+    try:
+        _query_hooks.remove(hook)
+    except ValueError:
+        pass
+
+
+def _notify(sql: str, params, seconds: float, rows: int) -> None:
+    for hook in list(_query_hooks):
+        try:
+            hook(sql, params, seconds, rows)
+        except Exception:
+            pass
+
+
+def _slow_query_hook(sql: str, params, seconds: float, rows: int) -> None:
+    """超过 SLOW_QUERY_MS 的语句交给后台慢查询日志（core.slowlog）。"""
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        slowlog.submit(_db_path, sql, params, seconds, rows)
+
+
+if SLOW_QUERY_MS is not None:
+    add_query_hook(_slow_query_hook)
+
+
+def pool_stats() -> dict:
+    """当前数据库连接池统计（acquired/reused/opened/waits/in_use 等）。"""
+    return get_pool().stats()
+
+
+def close_pools() -> None:
+    """关闭所有连接池的空闲连接（进程退出 / 切换数据库后调用）。"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+@contextmanager
+def conn() -> Iterator[sqlite3.Connection]:
+    """
+    从连接池借一条连接（带 row_factory + foreign_keys + WAL）。
+
+    约定：
+    - 所有 SQL 使用 ? 参数，占位避免注入
+    - 最外层 with 正常退出时提交，异常时回滚，然后归还连接池
+    - 同一线程内嵌套 conn() 复用同一条连接，由最外层负责提交
+    """
+    path = _db_path
+    held = getattr(_local, "held", None)
+    if held is None:
+        held = _local.held = {}
+
+    entry = held.get(path)
+    if entry is not None:
+        entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[1] -= 1
+        return
+
+    pool = get_pool(path)
+    c = pool.acquire()
+    held[path] = [c, 1]
+    changes_before = c.total_changes
+    try:
+        with c:
+            yield c
+    finally:
+        del held[path]
+        wrote = c.total_changes != changes_before
+        pool.release(c)
+        if wrote:
+            _bump_write_seq()
+
+
 def q_all(sql: str, params: tuple = ()) -> list[sqlite3.Row]:
     """查询多行。"""
     with conn() as c:
-        return c.execute(sql, params).fetchall()
+        if not _query_hooks:
+            return c.execute(sql, params).fetchall()
+        t0 = time.perf_counter()
+        rows = c.execute(sql, params).fetchall()
+        _notify(sql, params, time.perf_counter() - t0, len(rows))
+        return rows
 
 
 def q_one(sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
     """查询单行，查不到返回 None。"""
     with conn() as c:
-        return c.execute(sql, params).fetchone()
+        if not _query_hooks:
+            return c.execute(sql, params).fetchone()
+        t0 = time.perf_counter()
+        row = c.execute(sql, params).fetchone()
+        _notify(sql, params, time.perf_counter() - t0, 0 if row is None else 1)
+        return row
+
+
+def _begin_write(c: sqlite3.Connection) -> None:
+    """
+    不在事务里时用 BEGIN IMMEDIATE 开事务：开头即拿写锁，等锁时间（busy_timeout 内）计入连接池统计。
+
+    单条写也这样开，而不是让 sqlite3 模块隐式 BEGIN（DEFERRED）：
+    否则等锁时间混在语句执行时间里，无法单独统计。
+    """
+    if c.in_transaction:
+        return
+    t0 = time.perf_counter()
+    c.execute("BEGIN IMMEDIATE")
+    get_pool().record_write_lock(time.perf_counter() - t0)
 
 
 def exec_sql(sql: str, params: tuple = ()) -> int:
     """
-    执行写操作并提交。
+    执行写操作并提交（提交由 conn() 在最外层退出时完成）。
 
     Returns:
         lastrowid（INSERT 时有意义）
     """
     with conn() as c:
+        _begin_write(c)
+        t0 = time.perf_counter()
         cur = c.execute(sql, params)
-        c.commit()
+        if _query_hooks:
+            _notify(sql, params, time.perf_counter() - t0, cur.rowcount)
         return cur.lastrowid
 
 
-def init_db() -> None:
+def exec_many(sql: str, seq_of_params) -> int:
     """
-    初始化表结构（只负责 CREATE IF NOT EXISTS，不做迁移）。
+    同一条 SQL 批量绑定多组参数（executemany），整批一次提交。
+
+    Returns:
+        受影响行数
+    """
+    if _query_hooks:
+        seq_of_params = list(seq_of_params)
+    with conn() as c:
+        _begin_write(c)
+        t0 = time.perf_counter()
+        cur = c.executemany(sql, seq_of_params)
+        if _query_hooks:
+            _notify(sql, seq_of_params, time.perf_counter() - t0, cur.rowcount)
+        return cur.rowcount
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    工作单元：块内所有 q_all / q_one / exec_sql / exec_many 共用同一连接和同一事务。
+
+    用法：
+        with transaction():
+            exec_sql(...)
+            exec_many(...)
 
-    注意：
-    - SQL 注释只用 -- 或 /* ... */
+    - 正常退出一次提交（一次 fsync），异常则整体回滚
+    - BEGIN IMMEDIATE：开头即拿写锁，避免读后升级写锁时死锁
+    - 嵌套调用复用外层事务，由最外层负责提交
     """
     with conn() as c:
-        c.executescript(
-            """
-            PRAGMA foreign_keys=ON;
-
-            -- -------------------------
-            -- 全局产品库
-            -- -------------------------
-            CREATE TABLE IF NOT EXISTS products (
-              code TEXT PRIMARY KEY,
-              name TEXT NOT NULL,
-              category TEXT,
-              intro TEXT,
-              detail TEXT,
-              image_path TEXT
-            );
-
-            -- -------------------------
-            -- 产品线表
-            -- -------------------------
-            CREATE TABLE IF NOT EXISTS product_lines (
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              name TEXT NOT NULL UNIQUE,
-              description TEXT,
-              display_order INTEGER
-            );
-
-            -- -------------------------
-            -- 产品线成员
-            -- -------------------------
-            CREATE TABLE IF NOT EXISTS line_products (
-              line_id INTEGER NOT NULL,
-              product_code TEXT NOT NULL,
-              sort_order REAL DEFAULT 0,
-              y_pos REAL,
-              is_main INTEGER NOT NULL DEFAULT 0 CHECK(is_main IN (0,1)),
-              PRIMARY KEY(line_id, product_code),
-              FOREIGN KEY(line_id) REFERENCES product_lines(id) ON DELETE CASCADE,
-              FOREIGN KEY(product_code) REFERENCES products(code) ON DELETE CASCADE
-            );
-
-            -- -------------------------
-            -- 关系表（按 line_id 隔离）
-            -- -------------------------
-            CREATE TABLE IF NOT EXISTS relations (
-              id INTEGER PRIMARY KEY AUTOINCREMENT,
-              line_id INTEGER NOT NULL,
-              from_code TEXT NOT NULL,
-              to_code TEXT NOT NULL,
-              strength TEXT NOT NULL CHECK(strength IN ('strong','weak')),
-              directed INTEGER NOT NULL DEFAULT 1 CHECK(directed IN (0,1)),
-              relation_type TEXT DEFAULT 'compatible',
-              edge_label TEXT,  -- 边上显示的文字（例如 RS485/24V/水路）
-              FOREIGN KEY(line_id) REFERENCES product_lines(id) ON DELETE CASCADE,
-              FOREIGN KEY(from_code) REFERENCES products(code) ON DELETE CASCADE,
-              FOREIGN KEY(to_code) REFERENCES products(code) ON DELETE CASCADE
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_rel_line ON relations(line_id);
-            CREATE INDEX IF NOT EXISTS idx_rel_from ON relations(from_code);
-            CREATE INDEX IF NOT EXISTS idx_rel_to ON relations(to_code);
-            CREATE INDEX IF NOT EXISTS idx_lp_line ON line_products(line_id);
-            """
-        )
-        c.commit()
+        _begin_write(c)
+        yield c
@@ -1,82 +1,439 @@
-from core.db import q_all, exec_sql, conn
+import sqlite3
+import threading
+from typing import Callable
 
+from core.db import conn, current_db_path
 
-def ensure_schema_migrations() -> None:
+
+# -----------------------
+# 基础表结构（v1）
+# 注意：SQL 注释只用 -- 或 /* ... */
+# -----------------------
+BASE_SCHEMA_SQL = """
+    -- -------------------------
+    -- 全局产品库
+    -- -------------------------
+    CREATE TABLE IF NOT EXISTS products (
+      code TEXT PRIMARY KEY,
+      name TEXT NOT NULL,
+      category TEXT,
+      intro TEXT,
+      detail TEXT,
+      image_path TEXT
+    );
+
+    -- -------------------------
+    -- 产品线表
+    -- -------------------------
+    CREATE TABLE IF NOT EXISTS product_lines (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      name TEXT NOT NULL UNIQUE,
+      description TEXT,
+      display_order INTEGER
+    );
+
+    -- -------------------------
+    -- 产品线成员
+    -- -------------------------
+    CREATE TABLE IF NOT EXISTS line_products (
+      line_id INTEGER NOT NULL,
+      product_code TEXT NOT NULL,
+      sort_order REAL DEFAULT 0,
+      y_pos REAL,
+      is_main INTEGER NOT NULL DEFAULT 0 CHECK(is_main IN (0,1)),
+      PRIMARY KEY(line_id, product_code),
+      FOREIGN KEY(line_id) REFERENCES product_lines(id) ON DELETE CASCADE,
+      FOREIGN KEY(product_code) REFERENCES products(code) ON DELETE CASCADE
+    );
+
+    -- -------------------------
+    -- 关系表（按 line_id 隔离）
+    -- -------------------------
+    CREATE TABLE IF NOT EXISTS relations (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      line_id INTEGER NOT NULL,
+      from_code TEXT NOT NULL,
+      to_code TEXT NOT NULL,
+      strength TEXT NOT NULL CHECK(strength IN ('strong','weak')),
+      directed INTEGER NOT NULL DEFAULT 1 CHECK(directed IN (0,1)),
+      relation_type TEXT DEFAULT 'compatible',
+      edge_label TEXT,  -- 边上显示的文字（例如 RS485/24V/水路）
+      FOREIGN KEY(line_id) REFERENCES product_lines(id) ON DELETE CASCADE,
+      FOREIGN KEY(from_code) REFERENCES products(code) ON DELETE CASCADE,
+      FOREIGN KEY(to_code) REFERENCES products(code) ON DELETE CASCADE
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_rel_line ON relations(line_id);
+    CREATE INDEX IF NOT EXISTS idx_rel_from ON relations(from_code);
+    CREATE INDEX IF NOT EXISTS idx_rel_to ON relations(to_code);
+    CREATE INDEX IF NOT EXISTS idx_lp_line ON line_products(line_id);
+"""
+
+
+def _run_script(c: sqlite3.Connection, script: str) -> None:
     """
-    轻量迁移：兼容旧库缺字段/类型不一致。
+    逐条执行多语句 SQL（不用 executescript：它会先隐式 COMMIT，破坏迁移步骤的原子性）。
+    """
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            c.execute(buf)
+            buf = ""
+    if buf.strip():
+        c.execute(buf)
+
 
-    覆盖范围：
-    - line_products：补 is_main / y_pos
-    - product_lines：补 display_order 并初始化
-    - line_products.sort_order / y_pos：若不是 REAL，采用“重建表迁移”方式修正类型
+def _column_names(c: sqlite3.Connection, table: str) -> set[str]:
+    return {r["name"] for r in c.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _m001_base_schema(c: sqlite3.Connection) -> None:
+    """建表（CREATE IF NOT EXISTS：对旧库无副作用）。"""
+    _run_script(c, BASE_SCHEMA_SQL)
+
+
+def _m002_legacy_columns(c: sqlite3.Connection) -> None:
+    """
+    旧库补列：
+    - line_products：is_main / y_pos
+    - product_lines：display_order（按 id 初始化为 1..n）
+    - relations：edge_label
     """
+    lp_cols = _column_names(c, "line_products")
+    if "is_main" not in lp_cols:
+        c.execute("ALTER TABLE line_products ADD COLUMN is_main INTEGER NOT NULL DEFAULT 0")
+    if "y_pos" not in lp_cols:
+        c.execute("ALTER TABLE line_products ADD COLUMN y_pos REAL")
 
-    def _rebuild_line_products_to_real():
-        # SQLite 不支持 ALTER COLUMN TYPE：用重建表迁移
-        with conn() as c:
-            c.executescript(
-                """
-                PRAGMA foreign_keys=OFF;
+    if "display_order" not in _column_names(c, "product_lines"):
+        c.execute("ALTER TABLE product_lines ADD COLUMN display_order INTEGER")
+        rows = c.execute("SELECT id FROM product_lines ORDER BY id").fetchall()
+        c.executemany(
+            "UPDATE product_lines SET display_order=? WHERE id=?",
+            [(i, r["id"]) for i, r in enumerate(rows, start=1)],
+        )
+    c.execute("UPDATE product_lines SET display_order=id WHERE display_order IS NULL")
 
-                ALTER TABLE line_products RENAME TO line_products_old;
+    if "edge_label" not in _column_names(c, "relations"):
+        c.execute("ALTER TABLE relations ADD COLUMN edge_label TEXT")
 
-                CREATE TABLE line_products (
-                  line_id INTEGER NOT NULL,
-                  product_code TEXT NOT NULL,
-                  sort_order REAL DEFAULT 0,
-                  y_pos REAL,
-                  is_main INTEGER NOT NULL DEFAULT 0 CHECK(is_main IN (0,1)),
-                  PRIMARY KEY(line_id, product_code),
-                  FOREIGN KEY(line_id) REFERENCES product_lines(id) ON DELETE CASCADE,
-                  FOREIGN KEY(product_code) REFERENCES products(code) ON DELETE CASCADE
-                );
 
-                INSERT INTO line_products(line_id, product_code, sort_order, y_pos, is_main)
-                SELECT line_id, product_code, sort_order, y_pos, is_main
-                FROM line_products_old;
+def _m003_line_products_real(c: sqlite3.Connection) -> None:
+    """
+    line_products.sort_order / y_pos 若不是 REAL，用“重建表迁移”修正类型
+    （SQLite 不支持 ALTER COLUMN TYPE）。
+    """
+    types = {
+        r["name"]: (r["type"] or "").upper()
+        for r in c.execute("PRAGMA table_info(line_products)").fetchall()
+    }
+    if "REAL" in types.get("sort_order", "") and "REAL" in types.get("y_pos", ""):
+        return
 
-                DROP TABLE line_products_old;
+    _run_script(
+        c,
+        """
+        ALTER TABLE line_products RENAME TO line_products_old;
+
+        CREATE TABLE line_products (
+          line_id INTEGER NOT NULL,
+          product_code TEXT NOT NULL,
+          sort_order REAL DEFAULT 0,
+          y_pos REAL,
+          is_main INTEGER NOT NULL DEFAULT 0 CHECK(is_main IN (0,1)),
+          PRIMARY KEY(line_id, product_code),
+          FOREIGN KEY(line_id) REFERENCES product_lines(id) ON DELETE CASCADE,
+          FOREIGN KEY(product_code) REFERENCES products(code) ON DELETE CASCADE
+        );
+
+        INSERT INTO line_products(line_id, product_code, sort_order, y_pos, is_main)
+        SELECT line_id, product_code, sort_order, y_pos, is_main
+        FROM line_products_old;
+
+        DROP TABLE line_products_old;
+
+        CREATE INDEX IF NOT EXISTS idx_lp_line ON line_products(line_id);
+        """,
+    )
+
+
+def _m004_line_change_log(c: sqlite3.Connection) -> None:
+    """
+    线内变更日志：由触发器写入，图缓存据此判断“哪条线的哪个成员/关系变了”。
+
+    - kind=member：单个成员（X/Y/Main 或产品本身字段）变化，ref=product_code
+    - kind=members：成员增删，需要整线重建
+    - kind=relation：单条关系增删改，ref=relation id
+    - 每 1000 条自动裁剪，只保留最近 5000 条
+    """
+    _run_script(
+        c,
+        """
+        CREATE TABLE IF NOT EXISTS line_changes (
+          seq INTEGER PRIMARY KEY AUTOINCREMENT,
+          line_id INTEGER NOT NULL,
+          kind TEXT NOT NULL,
+          ref TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_lc_line_seq ON line_changes(line_id, seq);
+
+        CREATE TRIGGER IF NOT EXISTS trg_lc_prune AFTER INSERT ON line_changes
+        WHEN NEW.seq % 1000 = 0
+        BEGIN
+          DELETE FROM line_changes WHERE seq <= NEW.seq - 5000;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lp_ins AFTER INSERT ON line_products
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (NEW.line_id, 'members', NULL);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lp_del AFTER DELETE ON line_products
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (OLD.line_id, 'members', NULL);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lp_upd AFTER UPDATE ON line_products
+        WHEN OLD.line_id = NEW.line_id AND OLD.product_code = NEW.product_code
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (NEW.line_id, 'member', NEW.product_code);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_lp_move AFTER UPDATE ON line_products
+        WHEN OLD.line_id <> NEW.line_id OR OLD.product_code <> NEW.product_code
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (OLD.line_id, 'members', NULL);
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (NEW.line_id, 'members', NULL);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_prod_upd AFTER UPDATE ON products
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref)
+          SELECT line_id, 'member', NEW.code FROM line_products WHERE product_code=NEW.code;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rel_ins AFTER INSERT ON relations
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (NEW.line_id, 'relation', NEW.id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rel_upd AFTER UPDATE ON relations
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (OLD.line_id, 'relation', OLD.id);
+          INSERT INTO line_changes(line_id, kind, ref)
+          SELECT NEW.line_id, 'relation', NEW.id WHERE NEW.line_id IS NOT OLD.line_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_rel_del AFTER DELETE ON relations
+        BEGIN
+          INSERT INTO line_changes(line_id, kind, ref) VALUES (OLD.line_id, 'relation', OLD.id);
+        END;
+        """,
+    )
+
+
+def fts5_available(c: sqlite3.Connection) -> bool:
+    """当前 SQLite 是否编译了 FTS5（没有则产品搜索退回 LIKE）。"""
+    opts = {r[0] for r in c.execute("PRAGMA compile_options").fetchall()}
+    return "ENABLE_FTS5" in opts
 
-                PRAGMA foreign_keys=ON;
-                """
-            )
-            c.commit()
 
-    # ---- line_products 补列
-    cols = q_all("PRAGMA table_info(line_products)")
-    col_names = {c["name"] for c in cols}
+def _m005_products_fts(c: sqlite3.Connection) -> None:
+    """
+    产品全文/前缀搜索索引（FTS5 外部内容表，触发器同步 products）。
+
+    注意：
+    - products 没有 INTEGER PRIMARY KEY，VACUUM 可能重排 rowid；VACUUM 后需
+      repo.products.rebuild_search_index()
+    - SQLite 未编译 FTS5 时跳过（搜索退回 LIKE）
+    """
+    if not fts5_available(c):
+        return
+    _run_script(
+        c,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+          code, name, category, intro, detail,
+          content='products',
+          tokenize='unicode61 remove_diacritics 2',
+          prefix='1 2 3'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_ins AFTER INSERT ON products
+        BEGIN
+          INSERT INTO products_fts(rowid, code, name, category, intro, detail)
+          VALUES (NEW.rowid, NEW.code, NEW.name, NEW.category, NEW.intro, NEW.detail);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_del AFTER DELETE ON products
+        BEGIN
+          INSERT INTO products_fts(products_fts, rowid, code, name, category, intro, detail)
+          VALUES ('delete', OLD.rowid, OLD.code, OLD.name, OLD.category, OLD.intro, OLD.detail);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_products_fts_upd AFTER UPDATE ON products
+        BEGIN
+          INSERT INTO products_fts(products_fts, rowid, code, name, category, intro, detail)
+          VALUES ('delete', OLD.rowid, OLD.code, OLD.name, OLD.category, OLD.intro, OLD.detail);
+          INSERT INTO products_fts(rowid, code, name, category, intro, detail)
+          VALUES (NEW.rowid, NEW.code, NEW.name, NEW.category, NEW.intro, NEW.detail);
+        END;
+
+        INSERT INTO products_fts(products_fts) VALUES ('rebuild');
+        """,
+    )
+
+
+def _m006_keyset_indexes(c: sqlite3.Connection) -> None:
+    """后台分页（keyset）用的排序索引。"""
+    _run_script(
+        c,
+        """
+        CREATE INDEX IF NOT EXISTS idx_products_name ON products(name, code);
+        CREATE INDEX IF NOT EXISTS idx_lp_line_sort ON line_products(line_id, sort_order, product_code);
+        """,
+    )
+
+
+def _m007_relation_pair_index(c: sqlite3.Connection) -> None:
+    """
+    线内关系按 (line_id, from_code, to_code) 建复合索引。
+
+    作图时“两端都是成员”的过滤可以只走索引；原 idx_rel_line 是它的前缀，删除。
+    """
+    _run_script(
+        c,
+        """
+        CREATE INDEX IF NOT EXISTS idx_rel_line_pair ON relations(line_id, from_code, to_code);
+        DROP INDEX IF EXISTS idx_rel_line;
+        """,
+    )
+
+
+def _m008_access_path_indexes(c: sqlite3.Connection) -> None:
+    """
+    跨线上下游 / 图片引用的访问路径索引（python -m repo.explain 可查看实际查询计划）。
+
+    - (to_code, directed, from_code, line_id)：global_upstream、undirected 的 to 分支；
+      作为前缀同时服务外键级联删除，替换单列 idx_rel_to
+    - (from_code, directed, to_code, line_id)：global_downstream、undirected 的 from 分支；替换 idx_rel_from
+    - products(image_path)：delete_product 的“图片是否仍被引用”、list_image_paths
+    - line_products(product_code, line_id)：list_lines_for_product、删除产品时的级联；
+      idx_lp_line 与主键 (line_id, product_code) 前缀重复，删除
+    """
+    _run_script(
+        c,
+        """
+        CREATE INDEX IF NOT EXISTS idx_rel_to_dir ON relations(to_code, directed, from_code, line_id);
+        CREATE INDEX IF NOT EXISTS idx_rel_from_dir ON relations(from_code, directed, to_code, line_id);
+        DROP INDEX IF EXISTS idx_rel_to;
+        DROP INDEX IF EXISTS idx_rel_from;
+        CREATE INDEX IF NOT EXISTS idx_products_image ON products(image_path);
+        CREATE INDEX IF NOT EXISTS idx_lp_product ON line_products(product_code, line_id);
+        DROP INDEX IF EXISTS idx_lp_line;
+        """,
+    )
 
-    if "is_main" not in col_names:
-        exec_sql("ALTER TABLE line_products ADD COLUMN is_main INTEGER NOT NULL DEFAULT 0")
 
-    if "y_pos" not in col_names:
-        exec_sql("ALTER TABLE line_products ADD COLUMN y_pos REAL")
+def _m009_member_sort_expr_index(c: sqlite3.Connection) -> None:
+    """
+    线内成员分页按 COALESCE(sort_order, 0) 排序（旧数据的 sort_order 可能是 NULL），
+    排序索引换成同一表达式，keyset 分页仍只走索引。
+    """
+    _run_script(
+        c,
+        """
+        CREATE INDEX IF NOT EXISTS idx_lp_line_sort0 ON line_products(line_id, COALESCE(sort_order, 0), product_code);
+        DROP INDEX IF EXISTS idx_lp_line_sort;
+        """,
+    )
+
+
+def _m010_refresh_member_stats(c: sqlite3.Connection) -> None:
+    """
+    库里已有 ANALYZE 统计时，给 line_products 重新统计（补上 idx_lp_line_sort0）。
 
-    # ---- product_lines 补 display_order
-    cols2 = q_all("PRAGMA table_info(product_lines)")
-    col2_names = {c["name"] for c in cols2}
+    只缺新索引的统计时，规划器会把它当成高选择性索引，线内关系作图
+    （list_relations_of_members）改成成员 × 成员的嵌套循环，大产品线上慢两个数量级。
+    没有统计的库不新建统计，规划器行为不变。
+    """
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'").fetchone():
+        c.execute("ANALYZE line_products")
+
+
+# (版本号, 说明, 步骤函数, 是否需要关闭外键检查)
+# 规则：只追加、不修改已发布的步骤；版本号严格递增
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None], bool]] = [
+    (1, "基础表结构", _m001_base_schema, False),
+    (2, "旧库补列", _m002_legacy_columns, False),
+    (3, "line_products 坐标列改为 REAL", _m003_line_products_real, True),
+    (4, "线内变更日志（图缓存增量更新）", _m004_line_change_log, False),
+    (5, "产品全文搜索索引（FTS5）", _m005_products_fts, False),
+    (6, "分页排序索引", _m006_keyset_indexes, False),
+    (7, "关系 (line_id, from_code, to_code) 复合索引", _m007_relation_pair_index, False),
+    (8, "跨线上下游 / 图片引用 / 产品所在线索引", _m008_access_path_indexes, False),
+    (9, "线内成员分页索引改按 COALESCE(sort_order, 0)", _m009_member_sort_expr_index, False),
+    (10, "刷新 line_products 统计信息", _m010_refresh_member_stats, False),
+]
 
-    if "display_order" not in col2_names:
-        exec_sql("ALTER TABLE product_lines ADD COLUMN display_order INTEGER")
-        rows = q_all("SELECT id FROM product_lines ORDER BY id")
-        for i, r in enumerate(rows, start=1):
-            exec_sql("UPDATE product_lines SET display_order=? WHERE id=?", (i, r["id"]))
+SCHEMA_VERSION = MIGRATIONS[-1][0]
 
-    exec_sql("UPDATE product_lines SET display_order=id WHERE display_order IS NULL")
+# 已迁移到最新版本的数据库文件 -> 版本号（进程内）
+_migrated: dict[str, int] = {}
+_migrate_lock = threading.Lock()
 
-    # -----------------------
-    # 迁移：relations.edge_label（旧库补列）
-    # -----------------------
-    cols_rel = q_all("PRAGMA table_info(relations)")
-    rel_names = {c["name"] for c in cols_rel}
-    if "edge_label" not in rel_names:
-        exec_sql("ALTER TABLE relations ADD COLUMN edge_label TEXT")
 
-    # ---- 类型检查：sort_order / y_pos 是否 REAL
-    cols3 = q_all("PRAGMA table_info(line_products)")
-    types = {c["name"]: (c["type"] or "").upper() for c in cols3}
-    so_type = types.get("sort_order", "")
-    y_type = types.get("y_pos", "")
+def _apply(c: sqlite3.Connection, version: int, step, fk_off: bool) -> None:
+    """单个迁移步骤：一个事务内执行步骤 + 写 user_version。"""
+    if fk_off:
+        # foreign_keys 在事务内修改无效，必须在 BEGIN 之前关闭
+        c.execute("PRAGMA foreign_keys=OFF")
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            step(c)
+            if fk_off:
+                bad = c.execute("PRAGMA foreign_key_check").fetchone()
+                if bad is not None:
+                    raise sqlite3.IntegrityError(f"migration {version}: foreign key check failed on {bad[0]}")
+            c.execute(f"PRAGMA user_version={int(version)}")
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+    finally:
+        if fk_off:
+            c.execute("PRAGMA foreign_keys=ON")
+
 
-    if "REAL" not in so_type or "REAL" not in y_type:
-        _rebuild_line_products_to_real()
+def run_migrations() -> int:
+    """
+    按 PRAGMA user_version 执行尚未应用的迁移步骤。
+
+    Returns:
+        迁移后的 user_version
+    """
+    with conn() as c:
+        current = int(c.execute("PRAGMA user_version").fetchone()[0])
+        for version, _desc, step, fk_off in MIGRATIONS:
+            if version <= current:
+                continue
+            _apply(c, version, step, fk_off)
+            current = version
+        return current
+
+
+def ensure_schema_migrations() -> None:
+    """
+    保证当前数据库已迁移到 SCHEMA_VERSION。
+
+    每个进程、每个数据库文件只真正执行一次；之后 Streamlit 每次 rerun 只做一次整数比较。
+    """
+    path = current_db_path()
+    if _migrated.get(path) == SCHEMA_VERSION:
+        return
+    with _migrate_lock:
+        if _migrated.get(path) == SCHEMA_VERSION:
+            return
+        _migrated[path] = run_migrations()
@@ -0,0 +1,177 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from core import db
+from core.settings import PERF_PANEL, PERF_TRACE_FILE, PERF_TOP_QUERIES, PERF_KEEP_TRACES
+
+
+class Trace:
+    """
+    一次 rerun 的耗时记录。
+
+    - spans：按名称聚合的 [次数, 含子项耗时, 自身耗时]；自身耗时不含嵌套 span 与 SQL
+    - queries：每条 SQL 的 (语句, 秒, 行数)
+    - total 减去各 span 自身耗时与 SQL 耗时，剩下的就是 Streamlit 渲染等未计时部分
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.total = 0.0
+        self.spans: dict[str, list] = {}
+        self.queries: list[tuple[str, float, int]] = []
+        # 栈元素：[名称, 子项累计秒]
+        self._stack: list[list] = []
+
+    def _charge_parent(self, seconds: float) -> None:
+        if self._stack:
+            self._stack[-1][1] += seconds
+
+    def add_query(self, sql: str, seconds: float, rows: int) -> None:
+        self.queries.append((" ".join(sql.split()), seconds, rows))
+        self._charge_parent(seconds)
+
+    def finish(self) -> None:
+        self.total = time.perf_counter() - self._t0
+
+    def sql_seconds(self) -> float:
+        return sum(q[1] for q in self.queries)
+
+    def breakdown(self) -> list[dict]:
+        """按自身耗时降序：span 名 / 次数 / 含子项 / 自身；另加 sql 与未计时部分。"""
+        rows = [
+            {"name": name, "count": n, "inclusive_ms": incl * 1000, "self_ms": own * 1000}
+            for name, (n, incl, own) in self.spans.items()
+        ]
+        sql = self.sql_seconds()
+        rows.append({"name": "sql", "count": len(self.queries), "inclusive_ms": sql * 1000, "self_ms": sql * 1000})
+        untimed = self.total - sql - sum(v[2] for v in self.spans.values())
+        rows.append({"name": "(untimed)", "count": 1, "inclusive_ms": untimed * 1000, "self_ms": untimed * 1000})
+        rows.sort(key=lambda r: r["self_ms"], reverse=True)
+        return rows
+
+    def top_queries(self, n: int = PERF_TOP_QUERIES) -> list[dict]:
+        """最慢的 n 条 SQL（同一语句多次执行分别列出）。"""
+        top = sorted(self.queries, key=lambda q: q[1], reverse=True)[:n]
+        return [{"ms": s * 1000, "rows": r, "sql": q} for q, s, r in top]
+
+    def to_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "started_at": self.started_at,
+            "total_ms": self.total * 1000,
+            "sql_ms": self.sql_seconds() * 1000,
+            "query_count": len(self.queries),
+            "breakdown": self.breakdown(),
+            "queries": [{"sql": q, "ms": s * 1000, "rows": r} for q, s, r in self.queries],
+        }
+
+
+# 当前线程（= 当前会话的脚本线程）正在记录的 trace
+_local = threading.local()
+
+# 最近完成的 trace（进程内，供调试面板导出）
+_recent: deque = deque(maxlen=max(1, int(PERF_KEEP_TRACES)))
+_recent_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    """调试面板或 JSONL 导出任一打开时才记录。"""
+    return bool(PERF_PANEL or PERF_TRACE_FILE)
+
+
+def current() -> Optional[Trace]:
+    return getattr(_local, "trace", None)
+
+
+def _on_query(sql: str, params, seconds: float, rows: int) -> None:
+    t = current()
+    if t is not None:
+        t.add_query(sql, seconds, rows)
+
+
+def start_trace(label: str) -> Optional[Trace]:
+    """开始记录本次 rerun（未启用时返回 None，后续 span 全部空转）。"""
+    if not enabled():
+        return None
+    db.add_query_hook(_on_query)
+    t = _local.trace = Trace(label)
+    return t
+
+
+def end_trace() -> Optional[Trace]:
+    """结束记录：保存到最近列表；配置了 PERF_TRACE_FILE 时追加一行 JSON。"""
+    t = current()
+    if t is None:
+        return None
+    _local.trace = None
+    t.finish()
+    with _recent_lock:
+        _recent.append(t)
+    if PERF_TRACE_FILE:
+        export_jsonl([t], PERF_TRACE_FILE)
+    return t
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """计时一段代码；没有正在记录的 trace 时几乎零开销。"""
+    t = current()
+    if t is None:
+        yield
+        return
+    frame = [name, 0.0]
+    t._stack.append(frame)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        t._stack.pop()
+        agg = t.spans.setdefault(name, [0, 0.0, 0.0])
+        agg[0] += 1
+        agg[1] += elapsed
+        agg[2] += max(0.0, elapsed - frame[1])
+        t._charge_parent(elapsed)
+
+
+def timed(name: str) -> Callable:
+    """函数装饰器版 span。"""
+
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def recent_traces() -> list[Trace]:
+    with _recent_lock:
+        return list(_recent)
+
+
+def to_jsonl(traces: list[Trace]) -> str:
+    return "".join(json.dumps(t.to_dict(), ensure_ascii=False) + "\n" for t in traces)
+
+
+def export_jsonl(traces: list[Trace], path) -> None:
+    """把 trace 追加写入 JSON Lines 文件（每个 rerun 一行）。"""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    data = to_jsonl(traces)
+    with _export_lock, p.open("a", encoding="utf-8") as f:
+        f.write(data)
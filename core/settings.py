@@ -8,15 +8,99 @@ BASE_DIR = Path(__file__).resolve().parents[1]
 PROJECT_ROOT = get_project_root()
 DB_PATH, IMG_DIR = ensure_writable_assets(PROJECT_ROOT)
 IMG_DIR.mkdir(exist_ok=True)
+# 图片派生文件（缩略图/放大图，按原图内容哈希存放），与 img/ 同级
+DERIVED_DIR = IMG_DIR.parent / "img_derived"
 
 # -----------------------
 # UI constants
 # -----------------------
 IMG_W = 130
 GRAPH_THUMB = 96
+ZOOM_MAX = 1024               # 放大查看的最长边（原图更大时按比例缩小）
+LINE_CARD_PAGE_SIZE = 20      # 产品线页每页渲染的产品卡片数（卡片带图片，整线一次渲染太重）
 
 # -----------------------
 # Graph layout constants
 # -----------------------
 X_GAP = 260
 Y_GAP = 150
+
+# -----------------------
+# SQLite connection pool
+# -----------------------
+DB_POOL_SIZE = 8              # 每个数据库文件最多同时打开的连接数
+DB_POOL_TIMEOUT = 30.0        # 连接池耗尽时的最长等待秒数
+DB_BUSY_TIMEOUT_MS = 5000     # 写锁冲突时 SQLite 内部重试的毫秒数
+DB_SYNCHRONOUS = "NORMAL"     # WAL 下 NORMAL 足够安全，且比 FULL 少一半 fsync
+DB_CACHE_SIZE_KB = 16384      # 每连接页缓存（KiB）
+DB_MMAP_SIZE = 256 * 1024 * 1024
+
+# -----------------------
+# Repo read cache
+# -----------------------
+REPO_CACHE_MAX_ENTRIES = 512  # 读缓存最多保留的 (函数, 参数) 结果数
+SHOW_CACHE_STATS = False      # 侧边栏显示缓存命中统计（调参用）
+
+# -----------------------
+# graph/ caches（按字节限额的 LRU）
+# -----------------------
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024          # 图节点 data URI
+LINE_GRAPH_CACHE_BYTES = 128 * 1024 * 1024    # 已构建的产品线图
+THUMB_INDEX_CACHE_BYTES = 8 * 1024 * 1024     # 原图 -> 派生文件索引
+CACHE_SPILL_DIR = None        # 例如 PROJECT_ROOT / "cache_spill"：淘汰的 bytes/str 写盘，下次先读盘
+LINE_GRAPH_PATCH_MAX = 64     # 超过这么多条变更就整线重建，不再逐条增量更新
+
+# -----------------------
+# Image delivery
+# -----------------------
+# inline：图节点图片以 base64 data URI 内嵌在图数据里（默认，无需额外端口）
+# url：由本地资源服务按内容哈希 URL 提供，浏览器长期缓存，同一张图只传一次
+IMAGE_DELIVERY = "inline"
+ASSET_HOST = "127.0.0.1"
+ASSET_PORT = 8502
+ASSET_BASE_URL = None         # 经反向代理/CDN 访问时填浏览器可达的地址；None 则用 http://{ASSET_HOST}:{ASSET_PORT}
+
+# -----------------------
+# N-hop neighborhood（详情页邻域探索）
+# -----------------------
+NEIGHBORHOOD_MAX_DEPTH = 5    # 深度滑块上限
+NEIGHBORHOOD_MAX_NODES = 200  # 首次加载 / 每次展开最多新增的产品数
+NEIGHBORHOOD_MAX_EDGES = 1000 # 首次加载 / 每次展开最多新增的边数（同一对产品的多条关系已合并）
+
+# -----------------------
+# Relation index（repo.rel_index，全库邻接数组）
+# -----------------------
+REL_INDEX_OVERLAY_MAX = 5000  # 写入累积的增删改超过这么多条就整体重建，否则记在叠加层
+REACH_CLOSURE_MAX_PRODUCTS = 10000  # 产品数不超过它才建可达性位集（位集最多 ~ 产品数²/4 字节）；超过则在缩点图上 BFS 回答
+
+# -----------------------
+# Product search
+# -----------------------
+PICKER_LIMIT = 20             # 产品选择框每次最多取回的候选数
+
+# -----------------------
+# Partial reruns
+# -----------------------
+USE_FRAGMENTS = True          # 图 / 卡片列表 / 详情面板 / 后台子表单用 st.fragment 局部重跑；False 回到整页重跑
+
+# -----------------------
+# Admin grids
+# -----------------------
+ADMIN_PAGE_SIZE = 50          # 后台表格每页行数
+
+# -----------------------
+# Performance trace（调试用）
+# -----------------------
+PERF_PANEL = False            # 侧边栏显示本次 rerun 的耗时分解与最慢 SQL
+PERF_TRACE_FILE = None        # 例如 PROJECT_ROOT / "perf_traces.jsonl"：每次 rerun 追加一行 JSON
+PERF_TOP_QUERIES = 10         # 面板里列出的最慢 SQL 条数
+PERF_KEEP_TRACES = 50         # 进程内保留最近多少次 rerun（面板导出用）
+
+# -----------------------
+# Slow-query log
+# -----------------------
+SLOW_QUERY_MS = 250           # 单条 SQL 超过这么多毫秒记入慢查询日志；None 关闭
+SLOW_QUERY_LOG = PROJECT_ROOT / "logs" / "slow_queries.log"   # JSON Lines，按大小轮转
+SLOW_QUERY_LOG_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+SLOW_QUERY_QUEUE = 1000       # 后台写日志队列长度；满了就丢弃（不阻塞请求线程）
@@ -0,0 +1,134 @@
+"""
+慢查询日志：请求线程只把记录放进队列，EXPLAIN 与写文件都在后台线程完成。
+
+每条一行 JSON：时间 / 数据库 / 耗时 / 行数 / 调用的 repo 函数 / SQL / 参数 / 查询计划。
+"""
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from core.settings import SLOW_QUERY_LOG, SLOW_QUERY_LOG_BYTES, SLOW_QUERY_LOG_BACKUPS, SLOW_QUERY_QUEUE
+
+_queue: queue.Queue = queue.Queue(maxsize=max(1, int(SLOW_QUERY_QUEUE)))
+_worker: threading.Thread | None = None
+_worker_lock = threading.Lock()
+_stats = {"queued": 0, "written": 0, "dropped": 0}
+
+_logger = logging.getLogger("prvs.slow_query")
+_logger.propagate = False
+
+
+def _caller() -> str | None:
+    """调用栈里最近的 repo.* 函数（模块.函数名）；只在判定为慢查询后才走栈，平时零开销。"""
+    f = sys._getframe(1)
+    while f is not None:
+        mod = f.f_globals.get("__name__", "")
+        if mod.startswith("repo."):
+            return f"{mod}.{f.f_code.co_name}"
+        f = f.f_back
+    return None
+
+
+def _jsonable(v, limit: int = 200):
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return f"<{len(v)} bytes>"
+    if isinstance(v, str) and len(v) > limit:
+        return v[:limit] + f"...<{len(v)} chars>"
+    if v is None or isinstance(v, (int, float, str)):
+        return v
+    return repr(v)[:limit]
+
+
+def submit(db_path: str, sql: str, params, seconds: float, rows: int) -> None:
+    """
+    登记一条慢查询（请求线程调用，不阻塞）。
+
+    exec_many 的 params 是参数组列表：只记组数和第一组。
+    """
+    batch = None
+    if isinstance(params, list):
+        batch = len(params)
+        params = params[0] if params else ()
+    rec = {
+        "ts": time.time(),
+        "db": db_path,
+        "ms": round(seconds * 1000, 3),
+        "rows": rows,
+        "caller": _caller(),
+        "sql": " ".join(sql.split()),
+        "params": [_jsonable(p) for p in (params or ())],
+        "batch": batch,
+        "thread": threading.current_thread().name,
+    }
+    _ensure_worker()
+    try:
+        _queue.put_nowait((rec, tuple(params or ())))
+        _stats["queued"] += 1
+    except queue.Full:
+        _stats["dropped"] += 1
+
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        if not _logger.handlers:
+            path = Path(SLOW_QUERY_LOG)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            h = RotatingFileHandler(path, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+            h.setFormatter(logging.Formatter("%(message)s"))
+            _logger.addHandler(h)
+            _logger.setLevel(logging.INFO)
+        _worker = threading.Thread(target=_run, name="slow-query-log", daemon=True)
+        _worker.start()
+
+
+def _plan(conns: dict, db_path: str, sql: str, params: tuple) -> list[str]:
+    """后台线程用自己的只读连接跑 EXPLAIN QUERY PLAN（语句本身不会执行）。"""
+    try:
+        c = conns.get(db_path)
+        if c is None:
+            c = conns[db_path] = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        return [r[3] for r in c.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error as e:
+        return [f"(EXPLAIN failed: {e})"]
+
+
+def _run() -> None:
+    conns: dict[str, sqlite3.Connection] = {}
+    while True:
+        rec, params = _queue.get()
+        try:
+            rec["plan"] = _plan(conns, rec["db"], rec["sql"], params)
+            _logger.info(json.dumps(rec, ensure_ascii=False))
+            _stats["written"] += 1
+        except Exception:
+            _stats["dropped"] += 1
+        finally:
+            _queue.task_done()
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """等待队列写完（命令行工具退出前 / 调试用）。返回是否在超时内写完。"""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    for h in _logger.handlers:
+        h.flush()
+    return True
+
+
+def stats() -> dict:
+    """queued / written / dropped。"""
+    return {**_stats, "pending": _queue.qsize()}
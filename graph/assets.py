@@ -0,0 +1,109 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+from core.settings import DERIVED_DIR, IMAGE_DELIVERY, ASSET_HOST, ASSET_PORT, ASSET_BASE_URL
+
+# 只提供派生文件：/<sha256>/<g96.png|c130.png|z1024.png>
+_ASSET_RE = re.compile(r"^/([0-9a-f]{64})/([gcz][0-9]+\.png)$")
+
+# 文件名含内容哈希，内容永不变化：可以让浏览器缓存一年且不再校验
+_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class _AssetHandler(BaseHTTPRequestHandler):
+    """只读、白名单路径的派生图片服务。"""
+
+    def _resolve(self) -> Optional[Path]:
+        m = _ASSET_RE.match(self.path.split("?", 1)[0])
+        if not m:
+            return None
+        sha, name = m.groups()
+        p = DERIVED_DIR / sha[:2] / sha / name
+        return p if p.is_file() else None
+
+    def _send(self, with_body: bool) -> None:
+        p = self._resolve()
+        if p is None:
+            self.send_error(404)
+            return
+
+        etag = f'"{p.parent.name}-{p.name}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", _CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        data = p.read_bytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", _CACHE_CONTROL)
+        self.send_header("ETag", etag)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if with_body:
+            self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(True)
+
+    def do_HEAD(self):
+        self._send(False)
+
+    def log_message(self, format, *args):
+        # 图片请求很多，不刷 Streamlit 控制台
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_ok: Optional[bool] = None
+_server_lock = threading.Lock()
+
+
+def _ensure_server() -> bool:
+    """进程内只启动一次资源服务；端口被占用等失败时返回 False（调用方回退到内嵌）。"""
+    global _server, _server_ok
+    if _server_ok is not None:
+        return _server_ok
+    with _server_lock:
+        if _server_ok is None:
+            try:
+                _server = ThreadingHTTPServer((ASSET_HOST, int(ASSET_PORT)), _AssetHandler)
+                _server.daemon_threads = True
+                threading.Thread(target=_server.serve_forever, name="prvs-assets", daemon=True).start()
+                _server_ok = True
+            except OSError:
+                _server_ok = False
+    return _server_ok
+
+
+def _base_url() -> str:
+    if ASSET_BASE_URL:
+        return str(ASSET_BASE_URL).rstrip("/")
+    host = "localhost" if ASSET_HOST in ("0.0.0.0", "::") else ASSET_HOST
+    return f"http://{host}:{int(ASSET_PORT)}"
+
+
+def asset_url(derived: Path) -> Optional[str]:
+    """
+    派生文件 -> 浏览器可访问的 URL。
+
+    返回 None 的情况（调用方应回退到内嵌 data URI）：
+    - IMAGE_DELIVERY 不是 "url"
+    - 文件不在派生目录（例如 Pillow 不可用时派生路径就是原图）
+    - 资源服务启动失败（且未配置 ASSET_BASE_URL）
+    """
+    if IMAGE_DELIVERY != "url":
+        return None
+    derived = Path(derived)
+    sha = derived.parent.name
+    if not _ASSET_RE.match(f"/{sha}/{derived.name}"):
+        return None
+    if not _ensure_server() and not ASSET_BASE_URL:
+        return None
+    return f"{_base_url()}/{sha}/{derived.name}"
@@ -1,11 +1,151 @@
+import sys
+
 from streamlit_agraph import Edge
 
-from core.settings import X_GAP, Y_GAP
+from core.perf import timed
+from core.settings import X_GAP, Y_GAP, LINE_GRAPH_CACHE_BYTES, LINE_GRAPH_PATCH_MAX
+from graph.lru import ByteLRU
 from graph.nodes import node_for_product
-from repo.line_content import list_line_members
-from repo.relations import list_relations_filtered
+from repo.line_content import list_line_members_brief, get_line_member, line_revision, line_changes_since
+from repo.relations import list_relations_of_members, get_relation
+
+
+def _x(row) -> float:
+    try:
+        return float(row["sort_order"] or 0.0)
+    except Exception:
+        return 0.0
+
+
+def _y(row) -> float:
+    if row["y_pos"] is not None:
+        return float(row["y_pos"])
+    return 0.0 if int(row["is_main"]) == 1 else 1.0
+
+
+def _node(p):
+    x = _x(p) * X_GAP
+    y = -_y(p) * Y_GAP
+    return node_for_product(
+        p["code"],
+        p["name"],
+        p["image_path"],
+        x=int(x),
+        y=float(y),
+        fixed=True,
+    )
+
+
+def _edge_text(row) -> str:
+    return (row["edge_label"] or "").strip()
+
+
+def _edge(r) -> Edge:
+    return Edge(
+        source=r["from_code"],
+        target=r["to_code"],
+        directed=bool(r["directed"]),
+        dashes=(r["strength"] == "weak"),
+        label=_edge_text(r) or None,
+        title=_edge_text(r) or None,
+    )
+
+
+class _LineGraph:
+    """
+    一条产品线的已构建图（products/nodes 按下标对齐，edges/edge_ids 按下标对齐）。
+
+    列表在会话间共享：增量更新时先浅拷贝再替换元素（写时复制），
+    正在被其他会话遍历的旧列表不受影响。
+    """
+
+    __slots__ = ("rev", "products", "nodes", "edges", "edge_ids")
+
+    def __init__(self, rev, products, nodes, edges, edge_ids):
+        self.rev = rev
+        self.products = products
+        self.nodes = nodes
+        self.edges = edges
+        self.edge_ids = edge_ids
+
+    def result(self):
+        return self.products, self.nodes, self.edges
+
+    def nbytes(self) -> int:
+        """
+        估算占用：每个 node/edge 的属性字典 + 字符串；内嵌图片 data URI 按长度计。
+        （同一图片的 data URI 与图片缓存共享同一个 str，这里仍计入，偏保守）
+        """
+        total = 0
+        for obj in self.nodes + self.edges:
+            d = obj.__dict__
+            total += sys.getsizeof(d)
+            for v in d.values():
+                total += len(v) if isinstance(v, str) else 64
+        for p in self.products:
+            total += sys.getsizeof(p) + sum(len(v) for v in p if isinstance(v, str))
+        return total
 
 
+_graphs = ByteLRU("line_graph", LINE_GRAPH_CACHE_BYTES)
+
+
+def _build_full(line_id: int, rev: int) -> _LineGraph:
+    products = list(list_line_members_brief(line_id))
+    rels = list_relations_of_members(line_id)
+
+    nodes = [_node(p) for p in products]
+    edges = [_edge(r) for r in rels]
+    edge_ids = [int(r["id"]) for r in rels]
+    return _LineGraph(rev, products, nodes, edges, edge_ids)
+
+
+def _patch(line_id: int, g: _LineGraph, rev: int, changes) -> _LineGraph | None:
+    """
+    按变更日志增量更新；遇到成员增删等无法局部处理的变更返回 None（整线重建）。
+    """
+    products = list(g.products)
+    nodes = list(g.nodes)
+    edges = list(g.edges)
+    edge_ids = list(g.edge_ids)
+    member_idx = {p["code"]: i for i, p in enumerate(products)}
+
+    for ch in changes:
+        kind = ch["kind"]
+        if kind == "member":
+            i = member_idx.get(ch["ref"])
+            row = get_line_member(line_id, ch["ref"])
+            if i is None or row is None:
+                return None
+            products[i] = row
+            nodes[i] = _node(row)
+
+        elif kind == "relation":
+            rel_id = int(ch["ref"])
+            r = get_relation(rel_id)
+            keep = (
+                r is not None
+                and r["line_id"] == line_id
+                and r["from_code"] in member_idx
+                and r["to_code"] in member_idx
+            )
+            j = edge_ids.index(rel_id) if rel_id in edge_ids else None
+            if keep and j is not None:
+                edges[j] = _edge(r)
+            elif keep:
+                edges.append(_edge(r))
+                edge_ids.append(rel_id)
+            elif j is not None:
+                del edges[j]
+                del edge_ids[j]
+
+        else:
+            return None
+
+    return _LineGraph(rev, products, nodes, edges, edge_ids)
+
+
+@timed("graph.build_line")
 def build_line_graph(line_id: int):
     """
     生成产品线页图数据（products + nodes + edges）。
@@ -13,51 +153,27 @@ def build_line_graph(line_id: int):
     坐标规则（纯手动档位）：
     - x = sort_order * X_GAP
     - y = -y_pos * Y_GAP（y_pos=1 显示在上方）
+
+    缓存：
+    - 按 line_id 缓存已构建的图，line_revision 未变直接复用
+    - 单个成员 X/Y/Main、单条关系变化时只替换对应 node/edge
+    - 返回的列表在会话间共享，调用方不得原地修改；products 顺序在增量更新后不保证
+    - products 是窄投影（不含 intro/detail），长文本由调用方按需取
     """
-    products = list_line_members(line_id)
-    codes = [p["code"] for p in products]
-    rels = list_relations_filtered(line_id, codes)
-
-    def _x(row) -> float:
-        try:
-            return float(row["sort_order"] or 0.0)
-        except Exception:
-            return 0.0
-
-    def _y(row) -> float:
-        if row["y_pos"] is not None:
-            return float(row["y_pos"])
-        return 0.0 if int(row["is_main"]) == 1 else 1.0
-
-    nodes = []
-    for p in products:
-        x = _x(p) * X_GAP
-        y = -_y(p) * Y_GAP
-
-        nodes.append(
-            node_for_product(
-                p["code"],
-                p["name"],
-                p["image_path"],
-                x=int(x),
-                y=float(y),
-                fixed=True,
-            )
-        )
-
-    def _edge_text(row) -> str:
-        return (row["edge_label"] or "").strip()
-
-    edges = [
-        Edge(
-            source=r["from_code"],
-            target=r["to_code"],
-            directed=bool(r["directed"]),
-            dashes=(r["strength"] == "weak"),
-            label=_edge_text(r) or None,
-            title=_edge_text(r) or None,
-        )
-        for r in rels
-    ]
-
-    return products, nodes, edges
+    line_id = int(line_id)
+    rev = line_revision(line_id)
+
+    g = _graphs.get(line_id)
+    if g is not None and g.rev == rev:
+        return g.result()
+
+    new_g = None
+    if g is not None:
+        changes = line_changes_since(line_id, g.rev)
+        if changes is not None and len(changes) <= LINE_GRAPH_PATCH_MAX:
+            new_g = _patch(line_id, g, rev, changes)
+    if new_g is None:
+        new_g = _build_full(line_id, rev)
+
+    _graphs.put(line_id, new_g, new_g.nbytes())
+    return new_g.result()
@@ -1,10 +1,12 @@
 from streamlit_agraph import Edge
 
+from core.perf import timed
 from graph.nodes import node_for_product
-from repo.products import get_product
+from repo.products import get_product_brief
 from repo.relations import global_upstream, global_downstream, global_undirected
 
 
+@timed("graph.build_product_global")
 def build_product_graph_global(product_code: str):
     """
     生成详情页全局上下游图（跨产品线）。
@@ -15,7 +17,7 @@ def build_product_graph_global(product_code: str):
     - 下游 level=2
     - 无向尽量 level=1
     """
-    p = get_product(product_code)
+    p = get_product_brief(product_code)
     if not p:
         return None, [], []
 
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+# 所有 ByteLRU 实例：name -> cache（给统计面板用）
+_registry: dict[str, "ByteLRU"] = {}
+_registry_lock = threading.Lock()
+
+
+def payload_size(value) -> int:
+    """估算缓存值占用字节：bytes/str 按长度，其余用 sys.getsizeof 兜底。"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class ByteLRU:
+    """
+    按“实际字节数”限额的线程安全 LRU。
+
+    - put 时给出 nbytes（不给则 payload_size 估算），常驻总量超过 budget_bytes 就从最久未用的淘汰
+    - 单个值超过整个预算时不缓存（直接返回给调用方）
+    - spill_dir 非空时，被淘汰的 bytes/str 值写到磁盘，下次 miss 先从磁盘读回
+    """
+
+    def __init__(self, name: str, budget_bytes: int, spill_dir: Optional[Path] = None):
+        self.name = name
+        self.budget_bytes = max(0, int(budget_bytes))
+        self.spill_dir = Path(spill_dir) / name if spill_dir else None
+        self._data: OrderedDict = OrderedDict()  # key -> (value, nbytes)
+        self._resident = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+            "spill_writes": 0,
+            "spill_hits": 0,
+            "rejected": 0,
+        }
+        with _registry_lock:
+            _registry[name] = self
+
+    # ---- 磁盘溢出 ----
+    def _spill_path(self, key) -> Path:
+        h = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return self.spill_dir / h[:2] / h
+
+    def _spill(self, key, value) -> None:
+        if self.spill_dir is None or not isinstance(value, (bytes, str)):
+            return
+        p = self._spill_path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            data = b"b" + value if isinstance(value, bytes) else b"s" + value.encode("utf-8")
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        except OSError:
+            return
+        with self._lock:
+            self._stats["spill_writes"] += 1
+
+    def _unspill(self, key):
+        if self.spill_dir is None:
+            return None
+        try:
+            data = self._spill_path(key).read_bytes()
+        except OSError:
+            return None
+        if data[:1] == b"b":
+            return data[1:]
+        if data[:1] == b"s":
+            return data[1:].decode("utf-8")
+        return None
+
+    # ---- 基本操作 ----
+    def get(self, key, default=None):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None:
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                return hit[0]
+
+        value = self._unspill(key)
+        if value is not None:
+            with self._lock:
+                self._stats["spill_hits"] += 1
+            self.put(key, value)
+            return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return default
+
+    def put(self, key, value, nbytes: Optional[int] = None) -> None:
+        n = payload_size(value) if nbytes is None else int(nbytes)
+        evicted = []
+        with self._lock:
+            if n > self.budget_bytes:
+                self._stats["rejected"] += 1
+                return
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._resident -= old[1]
+            self._data[key] = (value, n)
+            self._resident += n
+            while self._resident > self.budget_bytes and self._data:
+                k, (v, vn) = self._data.popitem(last=False)
+                self._resident -= vn
+                self._stats["evictions"] += 1
+                self._stats["evicted_bytes"] += vn
+                evicted.append((k, v))
+        for k, v in evicted:
+            self._spill(k, v)
+
+    def get_or_load(self, key, loader: Callable, sizeof: Optional[Callable] = None):
+        """命中直接返回；否则调用 loader 并按 sizeof(value)（默认 payload_size）入缓存。"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        value = loader()
+        self.put(key, value, sizeof(value) if sizeof else None)
+        return value
+
+    def pop(self, key) -> None:
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._resident -= old[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._resident = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._data),
+                "resident_bytes": self._resident,
+                "budget_bytes": self.budget_bytes,
+            }
+
+
+def all_cache_stats() -> dict[str, dict]:
+    """所有 ByteLRU 的统计（按名称）。"""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {c.name: c.stats() for c in caches}
+
+
+def clear_all_caches() -> None:
+    """清空所有 ByteLRU（磁盘溢出文件保留）；基准测试模拟冷进程用。"""
+    with _registry_lock:
+        caches = list(_registry.values())
+    for c in caches:
+        c.clear()
@@ -0,0 +1,87 @@
+from streamlit_agraph import Edge, Node
+
+from core.perf import timed
+from graph.nodes import node_for_product
+from repo.relations import neighborhood
+
+
+def _edge(r) -> Edge:
+    """合并后的关系 -> Edge（弱=虚线；多条合并时在提示里写条数）。"""
+    label_text = (r["edge_label"] or "").strip()
+    title = f"{r['line_name']}" + (f" 等 {r['n']} 条" if r["n"] > 1 else "")
+    if label_text:
+        title = f"{label_text}\n{title}"
+    return Edge(
+        source=r["from_code"],
+        target=r["to_code"],
+        directed=bool(r["directed"]),
+        dashes=(r["strength"] == "weak"),
+        id=str(r["id"]),
+        label=label_text or None,
+        title=title,
+    )
+
+
+class NeighborhoodGraph:
+    """
+    详情页 N 跳邻域的累积图：先按深度取一次，之后点哪个节点就只向外展开它的一圈。
+
+    - nodes / edges：已生成的 agraph 元素（按 code / 关系 id），展开时只为新节点生成
+    - hops：各产品离根的跳数；expanded：已经展开过的产品（再点不重复查询）
+    - max_nodes / max_edges 是每一步（首次加载、每次展开）的上限
+    - 对象放在 session_state 里，随会话保留
+    """
+
+    def __init__(self, root: str, depth: int, direction: str, strength: str | None, max_nodes: int, max_edges: int):
+        self.root = root
+        self.params = (root, depth, direction, strength, max_nodes, max_edges)
+        self.direction = direction
+        self.strength = strength
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.nodes: dict[str, Node] = {}
+        self.edges: dict[str, Edge] = {}
+        self.hops: dict[str, int] = {}
+        self.expanded: set[str] = set()
+        self.truncated = False
+        self._merge(*neighborhood([root], depth, direction, strength, max_nodes, (), max_edges), base_hop=0)
+        # 深度以内的节点都已展开过；最外一圈留给点击展开
+        self.expanded.update(code for code, hop in self.hops.items() if hop < depth)
+
+    def _merge(self, node_rows, edge_rows, truncated: bool, base_hop: int) -> int:
+        for r in node_rows:
+            hop = base_hop + int(r["hop"])
+            self.hops[r["code"]] = hop
+            hover = "起点" if hop == 0 else f"{hop} 跳"
+            self.nodes[r["code"]] = node_for_product(r["code"], r["name"], r["image_path"], hover_extra=hover)
+        for r in edge_rows:
+            self.edges.setdefault(str(r["id"]), _edge(r))
+        self.truncated = self.truncated or truncated
+        return len(node_rows)
+
+    @timed("graph.neighborhood.expand")
+    def expand(self, code: str) -> int:
+        """向外展开 code 的一圈：只查询新的邻居及它们与已有节点之间的边；返回新增节点数。"""
+        if code in self.expanded or code not in self.nodes:
+            return 0
+        self.expanded.add(code)
+        node_rows, edge_rows, truncated = neighborhood(
+            [code], 1, self.direction, self.strength, self.max_nodes, sorted(self.nodes), self.max_edges
+        )
+        return self._merge(node_rows, edge_rows, truncated, base_hop=self.hops[code])
+
+    def elements(self) -> tuple[list[Node], list[Edge]]:
+        return list(self.nodes.values()), list(self.edges.values())
+
+
+@timed("graph.neighborhood")
+def build_neighborhood_graph(
+    root: str,
+    depth: int,
+    direction: str = "both",
+    strength: str | None = None,
+    max_nodes: int = 200,
+    max_edges: int = 1000,
+) -> NeighborhoodGraph:
+    """从 root 出发取 depth 跳以内的跨线邻域。"""
+    return NeighborhoodGraph(root, depth, direction, strength, max_nodes, max_edges)
@@ -1,71 +1,53 @@
 import base64
-import io
 from pathlib import Path
 from typing import Optional, Tuple
 
 import streamlit as st
 from streamlit_agraph import Node
 
-from core.settings import PROJECT_ROOT, BASE_DIR, IMG_W, GRAPH_THUMB
+from core.perf import timed
+from core.settings import IMG_W, GRAPH_THUMB, IMAGE_CACHE_BYTES, CACHE_SPILL_DIR
+from graph.assets import asset_url
+from graph.lru import ByteLRU
+from graph.thumbs import build_derivatives, derivatives_for, img_path_or_none
 
 
-def img_path_or_none(image_path: str | None) -> Optional[Path]:
-    """把数据库相对路径转为实际路径（不存在则返回 None）。"""
-    if not image_path:
-        return None
+_data_uri_cache = ByteLRU("image_data_uri", IMAGE_CACHE_BYTES, CACHE_SPILL_DIR)
 
-    p = Path(image_path)
 
-    # 绝对路径直接用
-    if p.is_absolute():
-        return p if p.exists() else None
+def _png_data_uri(derived_path: str) -> str:
+    """派生文件 -> data URI（派生文件按内容哈希命名，按路径缓存不会过期）。"""
 
-    # ✅ 打包态/可写资源：exe 同目录
-    p1 = PROJECT_ROOT / p
-    if p1.exists():
-        return p1
+    def _load() -> str:
+        b64 = base64.b64encode(Path(derived_path).read_bytes()).decode("utf-8")
+        return f"data:image/png;base64,{b64}"
 
-    # ✅ 兼容开发态
-    p2 = BASE_DIR / p
-    return p2 if p2.exists() else None
+    return _data_uri_cache.get_or_load(derived_path, _load)
 
 
-@st.cache_data(show_spinner=False)
 def image_to_data_uri_and_luma(path_str: str, thumb: int = GRAPH_THUMB) -> Tuple[str, float]:
     """
-    生成 data URI（用于 circularImage），并计算平均亮度 luma。
+    生成 data URI（用于 circularImage），并返回平均亮度 luma。
 
     注意：
+    - 缩略图与 luma 在上传时预生成（graph.thumbs），这里只读预生成的字节
     - luma 目前不用于动态字体色，但保留输出便于后续扩展
     """
-    p = Path(path_str)
-    raw = p.read_bytes()
+    d = derivatives_for(Path(path_str), graph=thumb)
+    return _png_data_uri(str(d.graph)), d.luma
 
-    luma = 255.0
-    try:
-        from PIL import Image
 
-        im = Image.open(io.BytesIO(raw)).convert("RGBA")
-        im.thumbnail((thumb, thumb))
-
-        rgb = im.convert("RGB")
-        w, h = rgb.size
-        n = w * h
-        if n > 0:
-            total = 0.0
-            for r, g, b in rgb.getdata():
-                total += 0.2126 * r + 0.7152 * g + 0.0722 * b
-            luma = total / n
-
-        buf = io.BytesIO()
-        im.save(buf, format="PNG")
-        data = buf.getvalue()
-    except Exception:
-        data = raw
-        luma = 255.0
-
-    b64 = base64.b64encode(data).decode("utf-8")
-    return f"data:image/png;base64,{b64}", float(luma)
+@timed("graph.nodes.image")
+def node_image_src(imgp: Path, thumb: int = GRAPH_THUMB) -> str:
+    """
+    图节点 image 字段：IMAGE_DELIVERY="url" 时用内容哈希 URL（浏览器缓存、同图只传一次），
+    否则回退为内嵌 data URI。
+    """
+    d = derivatives_for(imgp, graph=thumb)
+    url = asset_url(d.graph)
+    if url:
+        return url
+    return _png_data_uri(str(d.graph))
 
 
 def _short(s: str, n: int = 10) -> str:
@@ -73,6 +55,7 @@ def _short(s: str, n: int = 10) -> str:
     return s if len(s) <= n else s[:n] + "…"
 
 
+@timed("graph.nodes.node")
 def node_for_product(
     node_id: str,
     name: str,
@@ -118,8 +101,7 @@ def node_for_product(
     )
 
     if imgp:
-        uri, _ = image_to_data_uri_and_luma(str(imgp))
-        kwargs.update(image=uri, shape="circularImage", size=32)
+        kwargs.update(image=node_image_src(imgp), shape="circularImage", size=32)
     else:
         kwargs.update(shape="box", size=28)
         kwargs["label"] = label + "\n(无图)"
@@ -142,30 +124,35 @@ def node_for_product(
     return n
 
 
-def show_image_with_zoom(path: Path, thumb_w: int = IMG_W) -> None:
-    """卡片图展示：缩略图 + 放大查看。"""
-    raw = path.read_bytes()
+@timed("graph.nodes.show_image")
+def show_image_with_zoom(path: Path, thumb_w: int = IMG_W, key: str | None = None) -> None:
+    """
+    卡片图展示：缩略图 + 放大查看（都读预生成的派生文件，不在渲染时缩放）。
 
-    try:
-        from PIL import Image
+    放大图按需加载，页面本身只带缩略图：
+    - IMAGE_DELIVERY="url"：弹层里只放 URL，浏览器打开弹层时才去取
+    - 内嵌模式：弹层里先放一个“加载大图”按钮，点了才读字节下发；
+      同一会话同时只保留一张已加载的大图（session_state.zoom_open）
 
-        im = Image.open(path).convert("RGBA")
-        w, h = im.size
-        if w > thumb_w:
-            new_h = int(h * (thumb_w / w))
-            im = im.resize((thumb_w, new_h), Image.LANCZOS)
-        buf = io.BytesIO()
-        im.save(buf, format="PNG")
-        st.image(buf.getvalue(), width=thumb_w)
-    except Exception:
-        st.image(raw, width=thumb_w)
+    key：同一页里区分各张卡片（同一张图可能被多个产品共用），默认用路径
+    """
+    d = derivatives_for(path, card=thumb_w)
+    card_url = asset_url(d.card)
+    zoom_url = asset_url(d.zoom)
+    st.image(card_url or d.card.read_bytes(), width=thumb_w)
 
-    if hasattr(st, "popover"):
-        with st.popover("🔍 放大查看"):
-            st.image(raw, width="stretch")
-    else:
-        with st.expander("🔍 放大查看"):
-            st.image(raw, width="stretch")
+    box = st.popover("🔍 放大查看") if hasattr(st, "popover") else st.expander("🔍 放大查看")
+    with box:
+        if zoom_url:
+            st.image(zoom_url, width="stretch")
+            return
+
+        zoom_key = f"zoom_{key or path}"
+        if st.session_state.get("zoom_open") == zoom_key:
+            st.image(d.zoom.read_bytes(), width="stretch")
+        elif st.button("加载大图", key=zoom_key):
+            st.session_state.zoom_open = zoom_key
+            st.image(d.zoom.read_bytes(), width="stretch")
 
 
 def save_product_image_overwrite(code: str, name: str, uploaded_file, img_dir: Path) -> str:
@@ -199,8 +186,12 @@ def save_product_image_overwrite(code: str, name: str, uploaded_file, img_dir: P
             pass
 
     dst = img_dir / filename
+    raw = bytes(uploaded_file.getbuffer())
     with dst.open("wb") as f:
-        f.write(uploaded_file.getbuffer())
+        f.write(raw)
+
+    # 上传时一次性生成图节点缩略图 / 卡片缩略图 / 放大图 + luma
+    build_derivatives(dst, raw)
 
     return f"img/{filename}"
 
@@ -0,0 +1,103 @@
+"""
+批量（重新）生成图片派生文件，让用户打开产品线前缓存就已就绪。
+
+    python -m graph.prewarm [--workers N] [--force] [--db path/to/data.sqlite3]
+    PRVS.exe --prewarm-thumbs [...同上参数]
+
+- 遍历 products.image_path，多进程并行生成 graph/card/zoom 缩略图 + luma
+- 可中断、可重复执行：原图 mtime/size 未变且派生文件齐全的直接跳过
+- 修改 GRAPH_THUMB / IMG_W / ZOOM_MAX 后重新执行即可补齐新尺寸
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from core import db
+from graph.thumbs import build_derivatives, img_path_or_none, is_up_to_date
+from repo.products import list_image_paths
+
+
+def _work(path_str: str) -> tuple[str, int, str | None]:
+    """子进程：生成一张图的派生文件。返回 (路径, 原图字节数, 错误信息)。"""
+    p = Path(path_str)
+    try:
+        raw = p.read_bytes()
+        build_derivatives(p, raw)
+        return path_str, len(raw), None
+    except Exception as e:
+        return path_str, 0, f"{type(e).__name__}: {e}"
+
+
+def prewarm(workers: int | None = None, force: bool = False, log=print) -> dict:
+    """
+    生成所有产品图片的派生文件。
+
+    Returns:
+        统计：total / skipped / built / failed / missing / bytes / seconds
+    """
+    t0 = time.perf_counter()
+    stats = {"total": 0, "skipped": 0, "built": 0, "failed": 0, "missing": 0, "bytes": 0, "seconds": 0.0}
+
+    todo = []
+    seen = set()
+    for image_path in list_image_paths():
+        p = img_path_or_none(image_path)
+        if p is None:
+            stats["missing"] += 1
+            continue
+        key = str(p.resolve())
+        if key in seen:
+            continue
+        seen.add(key)
+        stats["total"] += 1
+        if not force and is_up_to_date(p):
+            stats["skipped"] += 1
+            continue
+        todo.append(str(p))
+
+    log(f"images: {stats['total']}  up-to-date: {stats['skipped']}  to build: {len(todo)}  missing files: {stats['missing']}")
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        done = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_work, s) for s in todo]
+            for fut in as_completed(futures):
+                path_str, nbytes, err = fut.result()
+                done += 1
+                if err:
+                    stats["failed"] += 1
+                    log(f"  FAILED {path_str}: {err}")
+                else:
+                    stats["built"] += 1
+                    stats["bytes"] += nbytes
+                if done % 100 == 0 or done == len(todo):
+                    el = time.perf_counter() - t0
+                    log(f"  {done}/{len(todo)}  {done / el:.1f} img/s  {stats['bytes'] / el / 1e6:.1f} MB/s")
+
+    stats["seconds"] = time.perf_counter() - t0
+    el = max(stats["seconds"], 1e-9)
+    log(
+        f"done in {stats['seconds']:.1f}s: built {stats['built']}, skipped {stats['skipped']}, "
+        f"failed {stats['failed']}  ({stats['built'] / el:.1f} img/s, {stats['bytes'] / el / 1e6:.1f} MB/s)"
+    )
+    return stats
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="prewarm", description="批量生成产品图片缩略图（派生文件）")
+    ap.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    ap.add_argument("--force", action="store_true", help="忽略已有派生文件，全部重建")
+    ap.add_argument("--db", default=None, help="数据库文件（默认项目内 data.sqlite3）")
+    args = ap.parse_args(argv)
+
+    if args.db:
+        db.use_database(args.db)
+    stats = prewarm(args.workers, args.force)
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
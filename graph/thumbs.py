@@ -0,0 +1,236 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from core.settings import PROJECT_ROOT, BASE_DIR, DERIVED_DIR, GRAPH_THUMB, IMG_W, ZOOM_MAX, THUMB_INDEX_CACHE_BYTES
+from graph.lru import ByteLRU
+
+
+class Derivatives(NamedTuple):
+    """
+    一张原图的派生文件。
+
+    - graph：关系图节点用的方形缩略图（最长边 GRAPH_THUMB）
+    - card：卡片用的定宽缩略图（宽 IMG_W，原图更窄时不放大）
+    - zoom：放大查看用（最长边 ZOOM_MAX）
+    - luma：graph 缩略图平均亮度（Rec.709）
+    - sha：原图内容哈希（派生文件目录名）
+
+    Pillow 不可用或解码失败时，三个路径都指向原图，luma=255。
+    """
+
+    sha: str
+    graph: Path
+    card: Path
+    zoom: Path
+    luma: float
+
+
+# 一条索引（key + 4 个路径 + sha）的大致占用
+_DERIVATIVES_NBYTES = 1024
+
+# (path, mtime_ns, size, graph, card, zoom) -> Derivatives
+_memo = ByteLRU("thumb_index", THUMB_INDEX_CACHE_BYTES)
+
+
+def img_path_or_none(image_path: str | None) -> Optional[Path]:
+    """把数据库相对路径转为实际路径（不存在则返回 None）。"""
+    if not image_path:
+        return None
+
+    p = Path(image_path)
+
+    # 绝对路径直接用
+    if p.is_absolute():
+        return p if p.exists() else None
+
+    # ✅ 打包态/可写资源：exe 同目录
+    p1 = PROJECT_ROOT / p
+    if p1.exists():
+        return p1
+
+    # ✅ 兼容开发态
+    p2 = BASE_DIR / p
+    return p2 if p2.exists() else None
+
+
+def _sha256(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _sha_dir(sha: str) -> Path:
+    return DERIVED_DIR / sha[:2] / sha
+
+
+def _ref_path(src: Path) -> Path:
+    """原图 -> 内容哈希 的指针文件（避免每次都重新读原图算哈希）。"""
+    key = hashlib.sha1(str(src.resolve()).encode("utf-8")).hexdigest()
+    return DERIVED_DIR / "refs" / f"{key}.json"
+
+
+def _write_atomic(dst: Path, data: bytes) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dst)
+
+
+def _png_bytes(im) -> bytes:
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _luma(im) -> float:
+    """平均亮度：convert 矩阵 + ImageStat 在 C 层完成，不逐像素走 Python。"""
+    from PIL import ImageStat
+
+    rgb = im.convert("RGB")
+    if rgb.size[0] * rgb.size[1] == 0:
+        return 255.0
+    lum = rgb.convert("L", (0.2126, 0.7152, 0.0722, 0))
+    return float(ImageStat.Stat(lum).mean[0])
+
+
+def _names(graph: int, card: int, zoom: int) -> dict[str, str]:
+    return {"graph": f"g{graph}.png", "card": f"c{card}.png", "zoom": f"z{zoom}.png"}
+
+
+def _generate(raw: bytes, out_dir: Path, graph: int, card: int, zoom: int) -> float:
+    """解码一次原图，生成缺失的派生文件，并把 luma 写入 meta.json。返回 luma。"""
+    from PIL import Image
+
+    names = _names(graph, card, zoom)
+    meta_path = out_dir / "meta.json"
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        meta = {}
+    luma_key = names["graph"]
+
+    im = Image.open(io.BytesIO(raw)).convert("RGBA")
+
+    gp = out_dir / names["graph"]
+    if not gp.exists() or luma_key not in meta.get("luma", {}):
+        g = im.copy()
+        g.thumbnail((graph, graph))
+        _write_atomic(gp, _png_bytes(g))
+        meta.setdefault("luma", {})[luma_key] = _luma(g)
+
+    cp = out_dir / names["card"]
+    if not cp.exists():
+        c = im
+        w, h = im.size
+        if w > card:
+            c = im.resize((card, max(1, int(h * (card / w)))), Image.LANCZOS)
+        _write_atomic(cp, _png_bytes(c))
+
+    zp = out_dir / names["zoom"]
+    if not zp.exists():
+        z = im.copy()
+        z.thumbnail((zoom, zoom), Image.LANCZOS)
+        _write_atomic(zp, _png_bytes(z))
+
+    meta["size"] = list(im.size)
+    _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    return float(meta["luma"][luma_key])
+
+
+def build_derivatives(
+    src: Path,
+    raw: Optional[bytes] = None,
+    *,
+    graph: int = GRAPH_THUMB,
+    card: int = IMG_W,
+    zoom: int = ZOOM_MAX,
+) -> Derivatives:
+    """
+    为原图生成（或复用）派生文件，并更新指针文件。
+
+    上传时调用一次；之后渲染只读派生文件，不再解码原图。
+    """
+    src = Path(src)
+    if raw is None:
+        raw = src.read_bytes()
+    sha = _sha256(raw)
+    out_dir = _sha_dir(sha)
+    names = _names(graph, card, zoom)
+
+    try:
+        luma = _generate(raw, out_dir, graph, card, zoom)
+        d = Derivatives(sha, out_dir / names["graph"], out_dir / names["card"], out_dir / names["zoom"], luma)
+    except Exception:
+        d = Derivatives(sha, src, src, src, 255.0)
+
+    st = src.stat()
+    ref = {"path": str(src.resolve()), "mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha": sha}
+    try:
+        _write_atomic(_ref_path(src), json.dumps(ref).encode("utf-8"))
+    except OSError:
+        pass
+    return d
+
+
+def _from_ref(src: Path, st, graph: int, card: int, zoom: int) -> Optional[Derivatives]:
+    """指针文件仍与原图 mtime/size 一致且派生文件齐全时，直接返回（不读原图）。"""
+    try:
+        ref = json.loads(_ref_path(src).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if ref.get("mtime_ns") != st.st_mtime_ns or ref.get("size") != st.st_size:
+        return None
+
+    out_dir = _sha_dir(ref["sha"])
+    names = _names(graph, card, zoom)
+    paths = [out_dir / names[k] for k in ("graph", "card", "zoom")]
+    if not all(p.exists() for p in paths):
+        return None
+    try:
+        meta = json.loads((out_dir / "meta.json").read_text(encoding="utf-8"))
+        luma = float(meta["luma"][names["graph"]])
+    except (OSError, ValueError, KeyError):
+        return None
+    return Derivatives(ref["sha"], *paths, luma)
+
+
+def is_up_to_date(
+    src: Path,
+    *,
+    graph: int = GRAPH_THUMB,
+    card: int = IMG_W,
+    zoom: int = ZOOM_MAX,
+) -> bool:
+    """原图的派生文件是否齐全且与原图 mtime/size 一致（批量预热时据此跳过）。"""
+    src = Path(src)
+    try:
+        st = src.stat()
+    except OSError:
+        return False
+    return _from_ref(src, st, graph, card, zoom) is not None
+
+
+def derivatives_for(
+    src: Path,
+    *,
+    graph: int = GRAPH_THUMB,
+    card: int = IMG_W,
+    zoom: int = ZOOM_MAX,
+) -> Derivatives:
+    """
+    渲染入口：返回原图的派生文件（只 stat 原图；缺失时才补生成）。
+    """
+    src = Path(src)
+    st = src.stat()
+    key = (str(src), st.st_mtime_ns, st.st_size, graph, card, zoom)
+
+    d = _memo.get(key)
+    if d is not None:
+        return d
+
+    d = _from_ref(src, st, graph, card, zoom) or build_derivatives(src, graph=graph, card=card, zoom=zoom)
+    _memo.put(key, d, _DERIVATIVES_NBYTES)
+    return d
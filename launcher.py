@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import sys
 import shutil
@@ -68,6 +69,11 @@ def main():
     sys.path.insert(0, str(root))
     sys.path.insert(0, str(root / "_internal"))
 
+    # 批量预热缩略图：PRVS.exe --prewarm-thumbs [--workers N] [--force]
+    if len(sys.argv) > 1 and sys.argv[1] == "--prewarm-thumbs":
+        from graph.prewarm import main as prewarm_main
+        raise SystemExit(prewarm_main(sys.argv[2:]))
+
     app_path = find_app(root)
 
     host = "127.0.0.1"
@@ -88,4 +94,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包后用多进程（批量预热缩略图）必须先调用
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,172 @@
+"""
+有向关系的环路检测：全库（跨产品线）或单条产品线。
+
+- 扫描：repo.rel_index 上跑迭代版 Tarjan（O(点 + 边)），产品数 > 1 的强连通分量即环路；
+  后台线程执行，结果按 (数据库, 产品线) 缓存，并记下对应的变更日志 rev，数据变了就标为过期
+- 新增关系前的增量检查：from->to 会闭合环路，当且仅当 to 已经能沿有向关系到达 from；
+  只从 to 出发在内存索引上 BFS，不重扫全图
+"""
+import json
+import threading
+import time
+from collections import deque
+
+from core import db
+from repo import rel_index
+from repo.rel_index import RelationIndex
+
+_lock = threading.Lock()
+_results: dict[tuple[str, int | None], dict] = {}
+_running: dict[tuple[str, int | None], threading.Thread] = {}
+
+
+def _path(index: RelationIndex, src: int, dst: int, allowed=None, line_id: int | None = None) -> list[int] | None:
+    """src 沿有向边到 dst 的一条最短路径（产品 id 列表，含两端）；allowed 限定可经过的产品。"""
+    parent = {src: None}
+    q = deque([src])
+    while q:
+        u = q.popleft()
+        for e in index.out_edges(u):
+            if not e[5] or (line_id is not None and e[3] != line_id):
+                continue
+            v = e[2]
+            if v == dst:
+                path = [v, u]
+                while parent[path[-1]] is not None:
+                    path.append(parent[path[-1]])
+                return path[::-1]
+            if v not in parent and (allowed is None or v in allowed):
+                parent[v] = u
+                q.append(v)
+    return None
+
+
+def closing_path(
+    from_code: str,
+    to_code: str,
+    line_id: int | None = None,
+    index: RelationIndex | None = None,
+) -> list[str] | None:
+    """
+    新增有向关系 from->to 会不会闭合环路。
+
+    Returns:
+        会：已有的 to -> ... -> from 路径（产品 code 列表）；不会：None。
+        line_id 给出时只看该产品线内的关系（默认看全库）；index 默认取 rel_index.get_index()。
+    """
+    if from_code == to_code:
+        return [from_code]
+    if index is None:
+        index = rel_index.get_index()
+    a, b = index.id_of(to_code), index.id_of(from_code)
+    if a is None or b is None:
+        return None  # 没有任何关系的产品不可能在环上
+    path = _path(index, a, b, line_id=line_id)
+    return None if path is None else [index.codes[u] for u in path]
+
+
+def _product_names(codes: list[str]) -> dict[str, str]:
+    rows = db.q_all(
+        "SELECT code, name FROM products WHERE code IN (SELECT value FROM json_each(?))",
+        (json.dumps(codes, ensure_ascii=False),),
+    )
+    return {r["code"]: r["name"] for r in rows}
+
+
+def find_cycles(line_id: int | None = None) -> dict:
+    """
+    同步扫描一次（后台任务的主体，也可直接调用）。
+
+    Returns:
+        {rev, line_id, products, relations, seconds, finished_at, cycles}
+        cycles 按产品数从多到少：{codes, names, relations, lines, path}
+        （relations = 环内有向关系数；lines = 涉及的产品线 id；path = 经过第一个产品的一条环路）
+    """
+    t0 = time.perf_counter()
+    index = rel_index.get_index()
+    comp, ncomp = index.components(line_id)
+    groups: dict[int, list[int]] = {}
+    for u, c in enumerate(comp):
+        groups.setdefault(c, []).append(u)
+
+    cycles = []
+    for c, members in groups.items():
+        rel_ids, lines = set(), set()
+        for u in members:
+            for e in index.out_edges(u):
+                if e[5] and comp[e[2]] == c and (line_id is None or e[3] == line_id):
+                    rel_ids.add(e[0])
+                    lines.add(e[3])
+        if len(members) == 1 and not rel_ids:
+            continue  # 单个产品且没有自环
+        first = min(members, key=lambda u: index.codes[u])
+        path = _path(index, first, first, allowed=set(members), line_id=line_id) or [first, first]
+        cycles.append({
+            "codes": sorted(index.codes[u] for u in members),
+            "relations": len(rel_ids),
+            "lines": sorted(lines),
+            "path": [index.codes[u] for u in path],
+        })
+    cycles.sort(key=lambda x: (-len(x["codes"]), x["codes"][0]))
+    names = _product_names(sorted({code for x in cycles for code in x["codes"]}))
+    for x in cycles:
+        x["names"] = [names.get(code, "") for code in x["codes"]]
+    return {
+        "rev": index.rev,
+        "line_id": line_id,
+        "products": len(index.codes),
+        "relations": len(index),
+        "seconds": time.perf_counter() - t0,
+        "finished_at": time.time(),
+        "cycles": cycles,
+    }
+
+
+def _run_scan(key: tuple[str, int | None], line_id: int | None) -> None:
+    try:
+        result = find_cycles(line_id)
+    except Exception as e:  # noqa: BLE001 后台任务：错误记进结果，页面上显示
+        result = {"rev": None, "line_id": line_id, "error": f"{type(e).__name__}: {e}", "finished_at": time.time()}
+    with _lock:
+        _results[key] = result
+        _running.pop(key, None)
+
+
+def start_scan(line_id: int | None = None) -> bool:
+    """在后台线程开始扫描；同一范围已在扫描时不重复开始。返回是否新开了任务。"""
+    key = (db.current_db_path(), line_id)
+    with _lock:
+        t = _running.get(key)
+        if t is not None and t.is_alive():
+            return False
+        # 后台线程沿用当前数据库（db.use_database 是进程级的）
+        t = threading.Thread(target=_run_scan, args=(key, line_id), name="cycle-scan", daemon=True)
+        _running[key] = t
+        t.start()
+        return True
+
+
+def scan_status(line_id: int | None = None) -> dict:
+    """
+    最近一次扫描的状态：{running, result, stale}。
+
+    result 为 None 表示还没扫过；stale 表示扫描之后（该产品线的）关系又有变更（结果仍可看，建议重扫）。
+    """
+    key = (db.current_db_path(), line_id)
+    with _lock:
+        t = _running.get(key)
+        result = _results.get(key)
+    stale = False
+    if result is not None and result.get("rev") is not None:
+        stale = rel_index.relations_changed_since(result["rev"], line_id)
+    return {"running": t is not None and t.is_alive(), "result": result, "stale": stale}
+
+
+def wait_scan(line_id: int | None = None, timeout: float | None = None) -> bool:
+    """等待进行中的扫描结束（命令行 / 基准用）。返回是否已结束。"""
+    with _lock:
+        t = _running.get((db.current_db_path(), line_id))
+    if t is not None:
+        t.join(timeout)
+        return not t.is_alive()
+    return True
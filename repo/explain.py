@@ -0,0 +1,290 @@
+"""
+打印 repo 层每条 SQL 的 EXPLAIN QUERY PLAN（发现索引回归用）。
+
+    python -m repo.explain [--db path/to/data.sqlite3] [--writes] [--fail-on-scan]
+
+- 读函数：自动发现 repo 模块里所有 @cached_read 函数，按参数名填入库里的样例值执行，
+  通过 core.db 的 SQL 观察者记下实际发出的语句，再逐条 EXPLAIN QUERY PLAN
+- --writes：在数据库的临时副本上把写操作也走一遍（原库不动）
+- 计划里出现整表 / 整个索引扫描（"SCAN 表名"）时标 !!；--fail-on-scan 时返回码为 1
+"""
+import argparse
+import importlib
+import inspect
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+from core import db
+from core.migrations import ensure_schema_migrations
+
+REPO_MODULES = ("repo.lines", "repo.products", "repo.line_content", "repo.relations")
+
+# 不带 @cached_read 的读函数
+_EXTRA_READS = ("repo.products.list_image_paths",)
+
+# 预期内的全表扫描：函数名 -> 原因
+_EXPECTED_SCANS = {
+    "repo.products.list_products": "全量列表（按主键顺序）",
+    "repo.products.list_products_page": "第一页按索引顺序读 limit 行",
+    "repo.products.count_products": "COUNT(*)",
+    "repo.products.first_product_code": "按主键顺序读 1 行",
+    "repo.products.search_products": "非 ASCII 查询的 LIKE 子串兜底",
+    "repo.products.list_image_paths": "导出全部图片路径",
+    "repo.lines.list_lines_sorted": "产品线全表（下拉）",
+    "repo.lines.normalize_display_order": "产品线全表重排",
+    "repo.lines.move_line_rank": "产品线全表重排",
+}
+
+# "SCAN 表" 或 "SCAN 表 USING [COVERING] INDEX 索引"（不带条件）：整表 / 整个索引扫描
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?$")
+
+
+def sample_values() -> dict:
+    """按参数名给出样例值：尽量选数据最多的产品线 / 产品，让计划接近真实负载。"""
+    line = db.q_one(
+        "SELECT line_id AS id FROM line_products GROUP BY line_id ORDER BY COUNT(*) DESC LIMIT 1"
+    ) or db.q_one("SELECT id FROM product_lines ORDER BY id LIMIT 1")
+    line_id = int(line["id"]) if line else 1
+
+    prod = db.q_one(
+        """
+        SELECT code FROM (
+            SELECT from_code AS code FROM relations
+            UNION ALL
+            SELECT to_code FROM relations
+        ) GROUP BY code ORDER BY COUNT(*) DESC LIMIT 1
+        """
+    ) or db.q_one("SELECT code FROM products ORDER BY code LIMIT 1")
+    code = prod["code"] if prod else "X"
+
+    rel = db.q_one("SELECT id FROM relations ORDER BY id LIMIT 1")
+    codes = [r["product_code"] for r in db.q_all("SELECT product_code FROM line_products WHERE line_id=?", (line_id,))]
+    return {
+        "line_id": line_id,
+        "product_code": code,
+        "code": code,
+        "rel_id": int(rel["id"]) if rel else 1,
+        "codes": codes or [code],
+        "query": code[:2],
+        "rev": 0,
+        "depth": 2,
+    }
+
+
+def read_functions() -> list[tuple[str, object]]:
+    """repo 读函数：(模块.函数名, 不经读缓存的函数)。基准测试也用这份清单。"""
+    out = []
+    for mod_name in REPO_MODULES:
+        mod = importlib.import_module(mod_name)
+        for name, fn in vars(mod).items():
+            if name.startswith("_") or not callable(fn) or getattr(fn, "__module__", None) != mod_name:
+                continue
+            if hasattr(fn, "uncached"):
+                out.append((f"{mod_name}.{name}", fn.uncached))
+    for full in _EXTRA_READS:
+        mod_name, name = full.rsplit(".", 1)
+        out.append((full, getattr(importlib.import_module(mod_name), name)))
+    return out
+
+
+def call_args(fn, samples: dict) -> dict:
+    """按参数名从 samples 取值（有默认值的参数不填）。"""
+    kwargs = {}
+    for p in inspect.signature(fn).parameters.values():
+        if p.default is not inspect.Parameter.empty:
+            continue
+        if p.name not in samples:
+            raise KeyError(f"no sample value for parameter {p.name!r}")
+        kwargs[p.name] = samples[p.name]
+    return kwargs
+
+
+class _Recorder:
+    """SQL 观察者：记下 (sql, params)，同一条 SQL 只留第一次。"""
+
+    def __init__(self):
+        self.statements: list[tuple[str, tuple]] = []
+        self._seen = set()
+
+    def __call__(self, sql: str, params, seconds: float, rows: int) -> None:
+        if sql in self._seen:
+            return
+        self._seen.add(sql)
+        if isinstance(params, list):
+            # exec_many：用第一组参数
+            params = params[0] if params else ()
+        self.statements.append((sql, tuple(params)))
+
+
+def _record(fn, **kwargs) -> list[tuple[str, tuple]]:
+    rec = _Recorder()
+    db.add_query_hook(rec)
+    try:
+        fn(**kwargs)
+    finally:
+        db.remove_query_hook(rec)
+    return rec.statements
+
+
+def _plan(sql: str, params: tuple) -> list[str]:
+    """EXPLAIN QUERY PLAN 的行（按父子关系缩进）。"""
+    with db.conn() as c:
+        rows = c.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    depth = {0: 0}
+    out = []
+    for r in rows:
+        d = depth.get(r["parent"], 0) + 1
+        depth[r["id"]] = d
+        out.append("  " * d + r["detail"])
+    return out
+
+
+def _full_scans(plan: list[str], tables: set[str]) -> list[str]:
+    found = []
+    for line in plan:
+        m = _FULL_SCAN.match(line.strip())
+        if m and m.group(1) in tables:
+            found.append(m.group(1))
+    return found
+
+
+def _one_line(sql: str, width: int = 110) -> str:
+    s = " ".join(sql.split())
+    return s if len(s) <= width else s[: width - 3] + "..."
+
+
+def _report(label: str, statements, tables: set[str], out) -> list[str]:
+    """打印一个函数的所有语句及计划；返回预期外的全表扫描。"""
+    print(f"== {label}", file=out)
+    bad = []
+    for sql, params in statements:
+        print(f"  SQL: {_one_line(sql)}", file=out)
+        try:
+            plan = _plan(sql, params)
+        except sqlite3.Error as e:
+            print(f"    (EXPLAIN failed: {e})", file=out)
+            continue
+        scans = _full_scans(plan, tables)
+        for line in plan:
+            print(f"  {line}", file=out)
+        if scans:
+            name = label.split("(")[0]
+            why = _EXPECTED_SCANS.get(name)
+            if why:
+                print(f"    (full scan of {', '.join(scans)}: expected, {why})", file=out)
+            else:
+                print(f"    !! full scan of {', '.join(scans)}", file=out)
+                bad.append(f"{name}: {', '.join(scans)}")
+    if not statements:
+        print("  (no SQL issued)", file=out)
+    return bad
+
+
+def _tables() -> set[str]:
+    rows = db.q_all("SELECT name FROM sqlite_master WHERE type='table'")
+    return {r["name"] for r in rows}
+
+
+def explain_reads(out=sys.stdout) -> list[str]:
+    """所有读函数；返回预期外的全表扫描列表。"""
+    samples = sample_values()
+    tables = _tables()
+    bad = []
+    for label, fn in read_functions():
+        kwargs = call_args(fn, samples)
+        args = ", ".join(f"{k}={v!r}" for k, v in kwargs.items() if k != "codes")
+        if "codes" in kwargs:
+            args = ", ".join(filter(None, [args, f"codes=<{len(kwargs['codes'])} codes>"]))
+        statements = _record(fn, **kwargs)
+        bad += _report(f"{label}({args})", statements, tables, out)
+    return bad
+
+
+def write_steps(samples: dict) -> list[tuple[str, object, dict]]:
+    """
+    一组可重复执行的写操作：(名称, 函数, 参数)。
+
+    新增的产品 / 产品线最后都会删掉，整组可以反复执行。
+    """
+    from repo import lines, line_content, products, relations
+
+    code = "__EXPLAIN__"
+    line_id = samples["line_id"]
+    other = samples["codes"][0]
+    return [
+        ("repo.products.create_product", products.create_product,
+         dict(code=code, name="explain", category="", intro="", detail="", image_path="img/__explain__.png")),
+        ("repo.products.update_product", products.update_product,
+         dict(code=code, name="explain2", category="", intro="", detail="", image_path="img/__explain__.png")),
+        ("repo.line_content.add_product_to_line", line_content.add_product_to_line,
+         dict(line_id=line_id, product_code=code, sort_order=1.0, y_pos=0.0, is_main=0)),
+        ("repo.line_content.update_line_member", line_content.update_line_member,
+         dict(line_id=line_id, product_code=code, sort_order=2.0, y_pos=1.0, is_main=1)),
+        ("repo.relations.create_relation", relations.create_relation,
+         dict(line_id=line_id, from_code=code, to_code=other, strength="strong",
+              directed=1, relation_type="compatible", edge_label=None)),
+        ("repo.relations.update_relation", lambda: relations.update_relation(
+            int(db.q_one("SELECT MAX(id) AS id FROM relations")["id"]), "weak", 0, "compatible", "x"), {}),
+        ("repo.relations.delete_relation", lambda: relations.delete_relation(
+            int(db.q_one("SELECT MAX(id) AS id FROM relations")["id"])), {}),
+        ("repo.line_content.remove_product_and_relations_from_line",
+         line_content.remove_product_and_relations_from_line, dict(line_id=line_id, product_code=code)),
+        ("repo.lines.create_line", lines.create_line, dict(name="__explain__", description="")),
+        ("repo.lines.move_line_rank", lambda: lines.move_line_rank(
+            int(db.q_one("SELECT MAX(id) AS id FROM product_lines")["id"]), 1), {}),
+        ("repo.lines.normalize_display_order", lines.normalize_display_order, {}),
+        ("repo.lines.delete_line", lambda: lines.delete_line(
+            int(db.q_one("SELECT MAX(id) AS id FROM product_lines")["id"])), {}),
+        ("repo.products.delete_product", products.delete_product, dict(code=code)),
+    ]
+
+
+def explain_writes(out=sys.stdout) -> list[str]:
+    """在临时副本上执行一遍写操作并打印计划；返回预期外的全表扫描列表。"""
+    src = db.current_db_path()
+    bad = []
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = str(Path(tmp) / "explain.sqlite3")
+        with sqlite3.connect(src) as a, sqlite3.connect(copy) as b:
+            a.backup(b)
+        db.use_database(copy)
+        try:
+            samples = sample_values()
+            tables = _tables()
+            for label, fn, kwargs in write_steps(samples):
+                bad += _report(label, _record(fn, **kwargs), tables, out)
+        finally:
+            db.close_pools()
+            db.use_database(src)
+    return bad
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--db", help="数据库文件（默认应用自己的 data.sqlite3）")
+    ap.add_argument("--writes", action="store_true", help="同时在临时副本上检查写操作")
+    ap.add_argument("--fail-on-scan", action="store_true", help="出现预期外的全表扫描时返回码 1")
+    args = ap.parse_args()
+
+    if args.db:
+        db.use_database(args.db)
+    ensure_schema_migrations()
+
+    bad = explain_reads()
+    if args.writes:
+        bad += explain_writes()
+    db.close_pools()
+
+    if bad:
+        print(f"\nunexpected full scans ({len(bad)}):")
+        for b in bad:
+            print(f"  {b}")
+        if args.fail_on_scan:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
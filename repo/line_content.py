@@ -1,7 +1,10 @@
 import sqlite3
-from core.db import q_all, q_one, exec_sql
+from core.db import q_all, q_one, exec_sql, transaction
+from core.cache import cached_read
+from repo.relations import delete_relations_of_product_in_line
 
 
+@cached_read
 def list_line_members(line_id: int) -> list[sqlite3.Row]:
     """列出某产品线成员（含产品信息 + X/Y/Main）。"""
     return q_all(
@@ -16,6 +19,101 @@ def list_line_members(line_id: int) -> list[sqlite3.Row]:
     )
 
 
+# 线内成员的窄投影：产品不含 intro/detail，加 X/Y/Main
+_MEMBER_BRIEF_COLUMNS = "p.code, p.name, p.category, p.image_path, lp.sort_order, lp.y_pos, lp.is_main"
+
+
+@cached_read
+def list_line_members_brief(line_id: int) -> list[sqlite3.Row]:
+    """
+    列出某产品线成员（窄投影：code/name/category/image_path + X/Y/Main）。
+
+    图构建、卡片列表用这个；简介/详情按需用 repo.products.get_product_text 取。
+    """
+    return q_all(
+        f"""
+        SELECT {_MEMBER_BRIEF_COLUMNS}
+        FROM line_products lp
+        JOIN products p ON p.code=lp.product_code
+        WHERE lp.line_id=?
+        ORDER BY lp.sort_order, lp.is_main DESC, p.code
+        """,
+        (line_id,),
+    )
+
+
+@cached_read
+def list_line_members_page(
+    line_id: int,
+    after: tuple | None = None,
+    limit: int = 50,
+) -> tuple[list[sqlite3.Row], tuple | None]:
+    """
+    线内成员分页（keyset，按 (sort_order, code)；列与 list_line_members_brief 一致）。
+
+    旧数据的 sort_order 可能是 NULL：排序和游标都按 COALESCE(sort_order, 0)，
+    否则 NULL 行落在页尾时游标比较恒为 NULL，后面的页全部丢失。
+
+    Returns:
+        (本页行, 下一页游标)；没有下一页时游标为 None
+    """
+    cond = "AND (COALESCE(lp.sort_order, 0), lp.product_code) > (?, ?)" if after is not None else ""
+    rows = q_all(
+        f"""
+        SELECT {_MEMBER_BRIEF_COLUMNS}
+        FROM line_products lp
+        JOIN products p ON p.code=lp.product_code
+        WHERE lp.line_id=? {cond}
+        ORDER BY COALESCE(lp.sort_order, 0), lp.product_code
+        LIMIT ?
+        """,
+        (line_id,) + tuple(after or ()) + (limit + 1,),
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1]["sort_order"] or 0, rows[-1]["code"])
+    return rows, None
+
+
+@cached_read
+def get_line_member(line_id: int, product_code: str) -> sqlite3.Row | None:
+    """单个线内成员（列与 list_line_members_brief 一致，用于图缓存增量更新）。"""
+    return q_one(
+        f"""
+        SELECT {_MEMBER_BRIEF_COLUMNS}
+        FROM line_products lp
+        JOIN products p ON p.code=lp.product_code
+        WHERE lp.line_id=? AND lp.product_code=?
+        """,
+        (line_id, product_code),
+    )
+
+
+@cached_read
+def line_revision(line_id: int) -> int:
+    """产品线修订号：该线最近一条变更日志的 seq（无变更为 0）。"""
+    row = q_one("SELECT COALESCE(MAX(seq), 0) AS rev FROM line_changes WHERE line_id=?", (line_id,))
+    return int(row["rev"])
+
+
+@cached_read
+def line_changes_since(line_id: int, rev: int) -> list[sqlite3.Row] | None:
+    """
+    该线在 rev 之后的变更（kind/ref，按 seq 升序）。
+
+    Returns:
+        None 表示 rev 之后的日志已被裁剪，无法增量更新（调用方应整线重建）
+    """
+    floor = q_one("SELECT MIN(seq) AS s FROM line_changes")
+    if floor["s"] is not None and rev < int(floor["s"]) - 1:
+        return None
+    return q_all(
+        "SELECT seq, kind, ref FROM line_changes WHERE line_id=? AND seq>? ORDER BY seq",
+        (line_id, rev),
+    )
+
+
+@cached_read
 def list_line_members_simple(line_id: int) -> list[sqlite3.Row]:
     """列出某产品线成员（仅 code/name，用于关系配置下拉）。"""
     return q_all(
@@ -30,6 +128,7 @@ def list_line_members_simple(line_id: int) -> list[sqlite3.Row]:
     )
 
 
+@cached_read
 def line_has_product(line_id: int, product_code: str) -> bool:
     """判断某产品是否已在该产品线中。"""
     return q_one(
@@ -74,6 +173,14 @@ def remove_product_from_line(line_id: int, product_code: str) -> None:
     )
 
 
+def remove_product_and_relations_from_line(line_id: int, product_code: str) -> None:
+    """先删该产品在线内的关系，再移除成员（同一事务，一次提交）。"""
+    with transaction():
+        delete_relations_of_product_in_line(line_id, product_code)
+        remove_product_from_line(line_id, product_code)
+
+
+@cached_read
 def list_lines_for_product(product_code: str) -> list[sqlite3.Row]:
     """列出包含该产品的产品线（用于详情页右侧快捷返回）。"""
     return q_all(
@@ -1,7 +1,9 @@
 import sqlite3
-from core.db import q_all, q_one, exec_sql
+from core.db import q_all, q_one, exec_sql, exec_many, transaction
+from core.cache import cached_read
 
 
+@cached_read
 def list_lines_sorted() -> tuple[list[sqlite3.Row], dict[int, int]]:
     """
     返回按 display_order 排序后的产品线列表 + 显示编号映射（1..n）。
@@ -17,6 +19,7 @@ def list_lines_sorted() -> tuple[list[sqlite3.Row], dict[int, int]]:
     return rows, id2d
 
 
+@cached_read
 def get_line(line_id: int) -> sqlite3.Row | None:
     """按 id 获取产品线。"""
     return q_one("SELECT * FROM product_lines WHERE id=?", (line_id,))
@@ -24,12 +27,13 @@ def get_line(line_id: int) -> sqlite3.Row | None:
 
 def create_line(name: str, description: str) -> None:
     """新增产品线（display_order 自动追加到末尾）。"""
-    maxo = q_one("SELECT COALESCE(MAX(display_order), 0) AS m FROM product_lines")
-    m = int(maxo["m"] or 0)
-    exec_sql(
-        "INSERT INTO product_lines(name, description, display_order) VALUES (?,?,?)",
-        (name, description, m + 1),
-    )
+    with transaction():
+        maxo = q_one("SELECT COALESCE(MAX(display_order), 0) AS m FROM product_lines")
+        m = int(maxo["m"] or 0)
+        exec_sql(
+            "INSERT INTO product_lines(name, description, display_order) VALUES (?,?,?)",
+            (name, description, m + 1),
+        )
 
 
 def update_line(line_id: int, name: str, description: str) -> None:
@@ -48,25 +52,34 @@ def set_line_display_order(line_id: int, display_order: int) -> None:
 
 
 def normalize_display_order() -> None:
-    """将 display_order 规范化为 1..n。"""
-    rows = q_all("SELECT id FROM product_lines ORDER BY COALESCE(display_order, 999999), id")
-    for i, r in enumerate(rows, start=1):
-        exec_sql("UPDATE product_lines SET display_order=? WHERE id=?", (i, r["id"]))
+    """将 display_order 规范化为 1..n（单事务批量更新）。"""
+    with transaction():
+        rows = q_all("SELECT id FROM product_lines ORDER BY COALESCE(display_order, 999999), id")
+        _write_display_order([r["id"] for r in rows])
+
+
+def _write_display_order(ids: list[int]) -> None:
+    """按 ids 顺序批量写入 display_order=1..n。"""
+    exec_many(
+        "UPDATE product_lines SET display_order=? WHERE id=?",
+        [(i, lid) for i, lid in enumerate(ids, start=1)],
+    )
+
 
 def move_line_rank(line_id: int, new_rank: int) -> None:
     """
     将某条产品线移动到第 new_rank 位（1..n），并把 display_order 重新规范化为 1..n。
     """
-    rows = q_all("SELECT id FROM product_lines ORDER BY COALESCE(display_order, 999999), id")
-    ids = [r["id"] for r in rows]
-    if line_id not in ids:
-        return
+    with transaction():
+        rows = q_all("SELECT id FROM product_lines ORDER BY COALESCE(display_order, 999999), id")
+        ids = [r["id"] for r in rows]
+        if line_id not in ids:
+            return
 
-    n = len(ids)
-    new_rank = max(1, min(int(new_rank), n))
+        n = len(ids)
+        new_rank = max(1, min(int(new_rank), n))
 
-    ids.remove(line_id)
-    ids.insert(new_rank - 1, line_id)
+        ids.remove(line_id)
+        ids.insert(new_rank - 1, line_id)
 
-    for i, lid in enumerate(ids, start=1):
-        exec_sql("UPDATE product_lines SET display_order=? WHERE id=?", (i, lid))
+        _write_display_order(ids)
@@ -1,17 +1,169 @@
 import sqlite3
-from core.db import q_all, q_one, exec_sql
+from core.db import q_all, q_one, exec_sql, transaction
+from core.cache import cached_read
 
 
+# 不含 intro/detail 长文本的列（下拉、图节点、卡片标题只用这些）
+BRIEF_COLUMNS = "code, name, category, image_path"
+
+
+@cached_read
 def list_products() -> list[sqlite3.Row]:
     """全局产品列表。"""
     return q_all("SELECT * FROM products ORDER BY code")
 
 
+# 分页排序键：ORDER BY 列 + “大于游标”条件 + 从行取游标
+_PRODUCT_SORTS = {
+    "code": ("code", "code > ?", lambda r: (r["code"],)),
+    "name": ("name, code", "(name, code) > (?, ?)", lambda r: (r["name"], r["code"])),
+}
+
+
+@cached_read
+def list_products_page(
+    after: tuple | None = None,
+    limit: int = 50,
+    sort: str = "code",
+) -> tuple[list[sqlite3.Row], tuple | None]:
+    """
+    产品分页（keyset：按排序键“上一页最后一行之后”取，不用 OFFSET）。
+
+    Args:
+        after: 上一页返回的游标；None 表示第一页
+        sort: "code" 或 "name"
+
+    Returns:
+        (本页行, 下一页游标)；没有下一页时游标为 None
+    """
+    order_by, cond, cursor_of = _PRODUCT_SORTS[sort]
+    where = f"WHERE {cond}" if after is not None else ""
+    rows = q_all(
+        f"SELECT * FROM products {where} ORDER BY {order_by} LIMIT ?",
+        tuple(after or ()) + (limit + 1,),
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, cursor_of(rows[-1])
+    return rows, None
+
+
+@cached_read
+def count_products() -> int:
+    """产品总数。"""
+    return int(q_one("SELECT COUNT(*) AS n FROM products")["n"])
+
+
+@cached_read
+def first_product_code() -> str | None:
+    """按 code 排序的第一个产品（页面默认选中项）。"""
+    row = q_one("SELECT code FROM products ORDER BY code LIMIT 1")
+    return row["code"] if row else None
+
+
+@cached_read
+def _has_search_index() -> bool:
+    return q_one("SELECT 1 FROM sqlite_master WHERE type='table' AND name='products_fts'") is not None
+
+
+def _fts_query(query: str) -> str:
+    """每个空白分隔的词做前缀匹配，词之间 AND。"""
+    return " ".join('"' + t.replace('"', '""') + '"*' for t in query.split())
+
+
+# 与 products_fts 索引的列一致（LIKE 兜底也查同样的列，两种后端结果口径相同）
+_SEARCH_COLUMNS = ("code", "name", "category", "intro", "detail")
+
+
+def _like_pattern(query: str) -> str:
+    return "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+@cached_read
+def search_products(query: str, limit: int = 20) -> list[sqlite3.Row]:
+    """
+    产品搜索（code / name / category / intro / detail），只返回前 limit 条的 code/name。
+
+    - 空查询：按 code 取前 limit 条
+    - FTS5：每个词前缀匹配，code 完全相等的排最前，其余按 bm25 相关度
+    - 含非 ASCII 字符（中文名中间的子串 unicode61 无法前缀命中）或没有 FTS5 时，
+      不足 limit 条再用 LIKE 补齐：同样的五列，每个词都要在某一列里出现；
+      code 完全相等的最前，其次 code / name 命中整个查询的
+    """
+    q = (query or "").strip()
+    limit = max(1, int(limit))
+    if not q:
+        return q_all("SELECT code, name FROM products ORDER BY code LIMIT ?", (limit,))
+
+    rows: list[sqlite3.Row] = []
+    has_fts = _has_search_index()
+    if has_fts:
+        try:
+            rows = q_all(
+                """
+                SELECT p.code, p.name
+                FROM products_fts f
+                JOIN products p ON p.rowid=f.rowid
+                WHERE products_fts MATCH ?
+                ORDER BY (p.code=?) DESC, bm25(products_fts, 10.0, 5.0, 2.0, 1.0, 0.5)
+                LIMIT ?
+                """,
+                (_fts_query(q), q, limit),
+            )
+        except sqlite3.OperationalError:
+            rows = []
+
+    if len(rows) < limit and (not has_fts or not q.isascii()):
+        # 与 FTS 索引同样的五列、同样的“每个词都要命中”（词之间 AND），只是子串匹配
+        seen = {r["code"] for r in rows}
+        terms = q.split()
+        per_term = "(" + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in _SEARCH_COLUMNS) + ")"
+        params = [p for t in terms for p in [_like_pattern(t)] * len(_SEARCH_COLUMNS)]
+        pat = _like_pattern(q)
+        more = q_all(
+            f"""
+            SELECT code, name
+            FROM products
+            WHERE {" AND ".join([per_term] * len(terms))}
+            ORDER BY (code=?) DESC, (code LIKE ? ESCAPE '\\' OR name LIKE ? ESCAPE '\\') DESC, code
+            LIMIT ?
+            """,
+            (*params, q, pat, pat, limit),
+        )
+        rows = rows + [r for r in more if r["code"] not in seen][: limit - len(rows)]
+    return rows
+
+
+def rebuild_search_index() -> None:
+    """重建产品搜索索引（VACUUM 之后或索引损坏时使用）。"""
+    if _has_search_index.uncached():
+        exec_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+@cached_read
 def get_product(code: str) -> sqlite3.Row | None:
     """按 code 获取产品。"""
     return q_one("SELECT * FROM products WHERE code=?", (code,))
 
 
+@cached_read
+def get_product_brief(code: str) -> sqlite3.Row | None:
+    """按 code 获取产品（仅 code/name/category/image_path）。"""
+    return q_one(f"SELECT {BRIEF_COLUMNS} FROM products WHERE code=?", (code,))
+
+
+@cached_read
+def get_product_text(code: str) -> sqlite3.Row | None:
+    """按 code 获取产品的长文本（intro/detail），卡片/详情真正显示时再取。"""
+    return q_one("SELECT intro, detail FROM products WHERE code=?", (code,))
+
+
+def list_image_paths() -> list[str]:
+    """所有产品引用的图片路径（去重，用于批量生成缩略图）。"""
+    rows = q_all("SELECT DISTINCT image_path FROM products WHERE image_path IS NOT NULL AND image_path<>'' ORDER BY image_path")
+    return [r["image_path"] for r in rows]
+
+
 def create_product(code: str, name: str, category: str, intro: str, detail: str, image_path: str | None) -> None:
     """新增产品。"""
     exec_sql(
@@ -38,21 +190,22 @@ from core.db import q_one  # 你文件里已有 q_one，就不用重复导入
 
 def delete_product(code: str) -> None:
     """删除产品（级联删除引用记录）。若图片无其他产品引用，则同时删除图片文件。"""
-    # 1) 先取出图片路径
-    row = q_one("SELECT image_path FROM products WHERE code=?", (code,))
-    img = (row["image_path"] if row else None)
+    with transaction():
+        # 1) 先取出图片路径
+        row = q_one("SELECT image_path FROM products WHERE code=?", (code,))
+        img = (row["image_path"] if row else None)
 
-    # 2) 删产品（会级联删 line_products / relations）
-    exec_sql("DELETE FROM products WHERE code=?", (code,))
+        # 2) 删产品（会级联删 line_products / relations）
+        exec_sql("DELETE FROM products WHERE code=?", (code,))
 
-    # 3) 无图片就结束
-    if not img:
-        return
+        # 3) 无图片就结束
+        if not img:
+            return
 
-    # 4) 如果还有其他产品引用这张图，就别删文件
-    ref = q_one("SELECT 1 FROM products WHERE image_path=? LIMIT 1", (img,))
-    if ref is not None:
-        return
+        # 4) 如果还有其他产品引用这张图，就别删文件
+        ref = q_one("SELECT 1 FROM products WHERE image_path=? LIMIT 1", (img,))
+        if ref is not None:
+            return
 
     # 5) 删除磁盘文件（相对路径按项目根目录 BASE_DIR 解析）
     p = Path(img)
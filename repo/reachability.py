@@ -0,0 +1,404 @@
+"""
+跨线传递可达性（"A 是否经有向关系一路连到 B"）：建在 repo.rel_index 上的进程内单例。
+
+- 有向关系先按强连通分量缩点（同一个环里的产品互相可达），缩点后是 DAG
+- 每个分量存两个位集（Python int 当位集）：desc = 能到达的分量，anc = 能到达它的分量；
+  查询 = 一次位测试，枚举上下游 = 遍历置位
+- 写入后按关系索引的变更做增量维护：
+  - 新增边 u->v：若已可达不变；否则把 v 的可达集并入 u 的所有祖先（反向同理）；
+    若新边闭合了环（v 本来就能到 u），分量要合并，整体重建
+  - 删除边：分量之间的最后一条边删掉时，只重算 u 的祖先（desc）与 v 的后代（anc）；
+    分量内部的边删掉后 u 仍能到 v 则分量不变，否则整体重建
+- 位集内存随产品数平方增长：产品数超过 REACH_CLOSURE_MAX_PRODUCTS 时不建位集，
+  查询改为在缩点图（succ / pred，与关系数同阶）上 BFS
+- 对象不可变：维护时生成新对象（未改动的位集共享），正在查询旧对象的会话不受影响
+- 页面用 ready_reachability()：构建 / 追赶都在后台线程，请求路径上从不等全量构建
+"""
+import threading
+
+from core import db
+from core.settings import REACH_CLOSURE_MAX_PRODUCTS
+from repo import rel_index
+from repo.rel_index import RelationIndex
+
+
+def _bits(x: int) -> list[int]:
+    """位集里所有置位的下标（升序）。"""
+    s = bin(x)[:1:-1]  # 去掉 "0b" 并反转：s[i] 即第 i 位
+    out = []
+    i = s.find("1")
+    while i != -1:
+        out.append(i)
+        i = s.find("1", i + 1)
+    return out
+
+
+def _walk(start: int, adj: list[dict[int, int]], stop: int | None = None) -> list[int]:
+    """缩点图上从 start 出发能到达的分量（不含 start；缩点图无环）；遇到 stop 立即返回 [stop]。"""
+    seen = {start}
+    stack = [start]
+    out = []
+    while stack:
+        c = stack.pop()
+        for d in adj[c]:
+            if d not in seen:
+                if d == stop:
+                    return [d]
+                seen.add(d)
+                out.append(d)
+                stack.append(d)
+    return out
+
+
+def _closure(order: list[int], adj: list[dict[int, int]], sets: list[int]) -> None:
+    """
+    按 order 重算 sets[c] = ∪(sets[d] | 1<<d)，d 取 adj[c]；order 中的分量互相依赖时先算被依赖的。
+    不在 order 里的分量视为已是最新。
+    """
+    todo = set(order)
+    for start in order:
+        if start not in todo:
+            continue
+        # 迭代后序 DFS：只在 todo 内部下探
+        work = [(start, iter(adj[start]))]
+        todo.discard(start)
+        while work:
+            c, it = work[-1]
+            for d in it:
+                if d in todo:
+                    todo.discard(d)
+                    work.append((d, iter(adj[d])))
+                    break
+            else:
+                work.pop()
+                x = 0
+                for d in adj[c]:
+                    x |= sets[d] | (1 << d)
+                sets[c] = x
+
+
+class Reachability:
+    """
+    一个版本的可达性索引（对应 index 那个版本的关系索引）。
+
+    comp[产品 id] = 分量号；members[分量] = 产品 id 列表；succ / pred[分量] = {相邻分量: 边数}
+    desc / anc：可达位集；产品数超过 REACH_CLOSURE_MAX_PRODUCTS 时为 None（查询走 BFS）
+    """
+
+    def __init__(self, index: RelationIndex):
+        self.index = index
+        comp, ncomp = index.components()
+        self.comp = comp
+        members: list[list[int]] = [[] for _ in range(ncomp)]
+        for u, c in enumerate(comp):
+            members[c].append(u)
+        self.members = members
+        succ: list[dict[int, int]] = [{} for _ in range(ncomp)]
+        pred: list[dict[int, int]] = [{} for _ in range(ncomp)]
+        for u in range(len(comp)):
+            cu = comp[u]
+            su = succ[cu]
+            for v in index.successors(u):
+                cv = comp[v]
+                if cv != cu:
+                    su[cv] = su.get(cv, 0) + 1
+                    pu = pred[cv]
+                    pu[cu] = pu.get(cu, 0) + 1
+        self.succ = succ
+        self.pred = pred
+        self.desc = self.anc = None
+        if len(comp) > REACH_CLOSURE_MAX_PRODUCTS:
+            return
+        # tarjan_scc 的分量号是逆拓扑序（后继总是更小）：正序算 desc，倒序算 anc
+        desc = [0] * ncomp
+        for c in range(ncomp):
+            x = 0
+            for d in succ[c]:
+                x |= desc[d] | (1 << d)
+            desc[c] = x
+        anc = [0] * ncomp
+        for c in range(ncomp - 1, -1, -1):
+            x = 0
+            for p in pred[c]:
+                x |= anc[p] | (1 << p)
+            anc[c] = x
+        self.desc = desc
+        self.anc = anc
+
+    # ---------- 增量维护 ----------
+    def advanced(self, index: RelationIndex, rel_ids: list[int]) -> "Reachability | None":
+        """
+        把 rel_ids 的变更（self.index -> index）应用到新对象上；需要整体重建时返回 None。
+
+        index 必须是 self.index 打补丁得到的（产品 id 不变，只追加）。
+        """
+        old_index = self.index
+        removes, inserts = [], []
+        for rid in rel_ids:
+            a = old_index.edge(rid)
+            b = index.edge(rid)
+            a = (a[1], a[2]) if a is not None and a[5] else None
+            b = (b[1], b[2]) if b is not None and b[5] else None
+            if a != b:
+                if a is not None:
+                    removes.append(a)
+                if b is not None:
+                    inserts.append(b)
+
+        new = object.__new__(Reachability)
+        new.__dict__.update(self.__dict__)
+        new.index = index
+        if not removes and not inserts and len(index.codes) == len(self.comp):
+            return new
+        closure = self.desc is not None
+        if closure and len(index.codes) > REACH_CLOSURE_MAX_PRODUCTS:
+            return None  # 产品数越过阈值：重建为不带位集的版本
+        new.comp = list(self.comp)
+        new.members = list(self.members)
+        new.succ = list(self.succ)
+        new.pred = list(self.pred)
+        if closure:
+            new.desc = list(self.desc)
+            new.anc = list(self.anc)
+        # 新产品：各自一个孤立分量
+        for u in range(len(self.comp), len(index.codes)):
+            new.comp.append(len(new.members))
+            new.members.append([u])
+            new.succ.append({})
+            new.pred.append({})
+            if closure:
+                new.desc.append(0)
+                new.anc.append(0)
+
+        for u, v in removes:
+            if not new._remove_edge(u, v):
+                return None
+        for u, v in inserts:
+            if not new._insert_edge(u, v):
+                return None
+        return new
+
+    def _bump(self, cu: int, cv: int, delta: int) -> int:
+        """分量边 cu->cv 的计数加 delta（写时复制两个字典）；返回新计数。"""
+        su = self.succ[cu] = dict(self.succ[cu])
+        pv = self.pred[cv] = dict(self.pred[cv])
+        n = su.get(cv, 0) + delta
+        if n > 0:
+            su[cv] = pv[cu] = n
+        else:
+            su.pop(cv, None)
+            pv.pop(cu, None)
+        return n
+
+    def _insert_edge(self, u: int, v: int) -> bool:
+        cu, cv = self.comp[u], self.comp[v]
+        if cu == cv:
+            return True
+        if self.desc is None:
+            if cv in self.succ[cu]:
+                self._bump(cu, cv, 1)
+                return True
+            if cu in _walk(cv, self.succ, stop=cu):
+                return False  # 闭合了环：分量合并
+            self._bump(cu, cv, 1)
+            return True
+        if (self.desc[cv] >> cu) & 1:
+            return False  # 闭合了环：分量合并
+        already = (self.desc[cu] >> cv) & 1
+        self._bump(cu, cv, 1)
+        if already:
+            return True
+        down = self.desc[cv] | (1 << cv)
+        up = self.anc[cu] | (1 << cu)
+        for a in _bits(up):
+            self.desc[a] |= down
+        for d in _bits(down):
+            self.anc[d] |= up
+        return True
+
+    def _remove_edge(self, u: int, v: int) -> bool:
+        cu, cv = self.comp[u], self.comp[v]
+        if cu == cv:
+            return len(self.members[cu]) == 1 or self._reaches_within(u, v, cu)
+        if self._bump(cu, cv, -1) > 0 or self.desc is None:
+            return True
+        _closure([cu] + _bits(self.anc[cu]), self.succ, self.desc)
+        _closure([cv] + _bits(self.desc[cv]), self.pred, self.anc)
+        return True
+
+    def _reaches_within(self, u: int, v: int, c: int) -> bool:
+        """当前关系索引里 u 能否只经分量 c 内部的有向边到达 v。"""
+        comp = self.comp
+        seen = {u}
+        stack = [u]
+        while stack:
+            x = stack.pop()
+            for y in self.index.successors(x):
+                if y == v:
+                    return True
+                if y not in seen and comp[y] == c:
+                    seen.add(y)
+                    stack.append(y)
+        return False
+
+    # ---------- 查询 ----------
+    def _comp_of(self, code: str) -> int | None:
+        u = self.index.id_of(code)
+        return None if u is None or u >= len(self.comp) else self.comp[u]
+
+    def reaches(self, a: str, b: str) -> bool:
+        """a 是否经一条或多条有向关系到达 b（a 在 b 的上游）。a == b 时看 a 是否在环里。"""
+        ca, cb = self._comp_of(a), self._comp_of(b)
+        if ca is None or cb is None:
+            return False
+        if ca == cb:
+            return a != b or len(self.members[ca]) > 1
+        if self.desc is None:
+            return cb in _walk(ca, self.succ, stop=cb)
+        return bool((self.desc[ca] >> cb) & 1)
+
+    def _down(self, c: int) -> list[int]:
+        """c 下游的所有分量（不含 c）。"""
+        return _bits(self.desc[c]) if self.desc is not None else _walk(c, self.succ)
+
+    def _up(self, c: int) -> list[int]:
+        """c 上游的所有分量（不含 c）。"""
+        return _bits(self.anc[c]) if self.anc is not None else _walk(c, self.pred)
+
+    def _expand(self, c: int, comps: list[int]) -> list[str]:
+        codes = self.index.codes
+        out = [codes[u] for d in comps for u in self.members[d]]
+        if len(self.members[c]) > 1:
+            out += [codes[u] for u in self.members[c]]
+        return out
+
+    def descendants(self, code: str) -> list[str]:
+        """code 一路往下游能到达的所有产品（在环里时含同环产品及自身）。"""
+        c = self._comp_of(code)
+        return [] if c is None else sorted(self._expand(c, self._down(c)))
+
+    def ancestors(self, code: str) -> list[str]:
+        """一路往上游能到达 code 的所有产品（在环里时含同环产品及自身）。"""
+        c = self._comp_of(code)
+        return [] if c is None else sorted(self._expand(c, self._up(c)))
+
+    def counts(self, code: str) -> dict:
+        """上游 / 下游可达的产品数（不含自身）与所在环的产品数（不在环里为 1）。"""
+        c = self._comp_of(code)
+        if c is None:
+            return {"ancestors": 0, "descendants": 0, "cycle": 1}
+        size = len(self.members[c])
+        extra = size - 1  # 同环的其他产品既在上游也在下游
+        return {
+            "ancestors": sum(len(self.members[d]) for d in self._up(c)) + extra,
+            "descendants": sum(len(self.members[d]) for d in self._down(c)) + extra,
+            "cycle": size,
+        }
+
+    def nbytes(self) -> int:
+        """位集占用的字节数（估算；不建位集时为 0）。"""
+        if self.desc is None:
+            return 0
+        return sum((x.bit_length() + 7) // 8 for x in self.desc) + sum((x.bit_length() + 7) // 8 for x in self.anc)
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.comp),
+            "components": len(self.members),
+            "cyclic_components": sum(1 for m in self.members if len(m) > 1),
+            "closure": self.desc is not None,
+            "bitset_bytes": self.nbytes(),
+            "rev": self.index.rev,
+        }
+
+
+_lock = threading.Lock()
+_reach: dict[str, Reachability] = {}
+
+
+def get_reachability() -> Reachability:
+    """
+    当前数据库的可达性索引（进程内单例）。
+
+    跟着 rel_index.get_index() 走：关系索引是打补丁得到的就按变更增量维护，
+    关系索引重建过（产品 id 变了）或增量维护要求重建时整体重建。
+    """
+    index = rel_index.get_index()
+    r = _reach.get(index.db_path)
+    if r is not None and r.index is index:
+        return r
+    with _lock:
+        r = _reach.get(index.db_path)
+        if r is not None and r.index is index:
+            return r
+        new = None
+        # 同一份基础数组 = 同一次构建之后的补丁，产品 id 可以沿用
+        if r is not None and r.index.rel_id is index.rel_id and r.index.rev <= index.rev:
+            changed = rel_index.changed_relations(r.index.rev)
+            if changed is not None:
+                new = r.advanced(index, changed)
+        if new is None:
+            new = Reachability(index)
+        _reach[index.db_path] = new
+        return new
+
+
+_warming: dict[str, threading.Thread] = {}
+
+
+def _warm_run() -> None:
+    try:
+        get_reachability()
+    except Exception:  # noqa: BLE001 后台预热失败不影响页面，下次 warm() 会重试
+        pass
+
+
+def warm() -> None:
+    """在后台线程构建 / 追赶当前数据库的可达性索引（已是最新或已在进行时不开线程）。"""
+    path = db.current_db_path()
+    r = _reach.get(path)
+    if r is not None and r.index.rev == rel_index.current_rev():
+        return
+    with _lock:
+        t = _warming.get(path)
+        if t is not None and t.is_alive():
+            return
+        # 后台线程沿用当前数据库（db.use_database 是进程级的）
+        t = _warming[path] = threading.Thread(target=_warm_run, name="reachability-warm", daemon=True)
+        t.start()
+
+
+def ready_reachability() -> Reachability | None:
+    """
+    不阻塞地取可达性索引：已是最新直接返回；落后于变更日志时在后台追赶，先返回上一个版本；
+    还没建过返回 None（同时开始后台构建）。
+    """
+    r = _reach.get(db.current_db_path())
+    warm()
+    return r
+
+
+def is_upstream(a: str, b: str) -> bool:
+    """a 是否经有向关系（跨产品线、任意跳数）一路连到 b。"""
+    return get_reachability().reaches(a, b)
+
+
+def all_upstream(code: str) -> list[str]:
+    """所有能一路连到 code 的上游产品。"""
+    return get_reachability().ancestors(code)
+
+
+def all_downstream(code: str) -> list[str]:
+    """code 一路能连到的所有下游产品。"""
+    return get_reachability().descendants(code)
+
+
+def reach_counts(code: str) -> dict:
+    """{ancestors, descendants, cycle}：详情页徽标用。"""
+    return get_reachability().counts(code)
+
+
+def invalidate() -> None:
+    """丢弃所有已构建的可达性索引（测试 / 基准用）。"""
+    with _lock:
+        _reach.clear()
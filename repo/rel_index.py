@@ -0,0 +1,423 @@
+"""
+全库关系的内存邻接索引（CSR）：进程内单例，所有会话共享。
+
+- 产品 code 驻留为整数 id（codes[i] <-> ids[code]）
+- 每条关系一行列式数组：rel_id / src / dst / line_id / strong / directed（array 模块，不依赖 NumPy）
+- 正向 / 反向邻接都是 CSR：out_off[u]..out_off[u+1] 是 u 的出边在 out_edge 里的区间，
+  out_edge 存的是边下标（再去列数组取 dst / line_id 等）
+- 写入后：按变更日志（line_changes，kind=relation）把增删改记到叠加层（added / removed），
+  基础数组不动；叠加层过大或日志已被裁剪时整体重建
+- 索引对象不可变：打补丁时生成新对象（共享基础数组；没有新产品时也共享 codes / ids），
+  正在遍历旧对象的会话不受影响
+- 单例放在本模块（_indexes），不用 st.cache_resource：repo 层不依赖 streamlit，
+  共享语义相同（进程内、跨会话）
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Iterable, Iterator
+
+from core import db
+from core.settings import REL_INDEX_OVERLAY_MAX
+
+# 边元组：(rel_id, src, dst, line_id, strong, directed)
+EdgeTuple = tuple[int, int, int, int, int, int]
+
+
+def _csr(n: int, keys: array) -> tuple[array, array]:
+    """按 keys（每条边的端点 id）做计数排序：返回 (offsets[n+1], 边下标)。"""
+    off = array("i", [0]) * (n + 1)
+    for k in keys:
+        off[k + 1] += 1
+    for i in range(n):
+        off[i + 1] += off[i]
+    pos = array("i", off)
+    order = array("i", [0]) * len(keys)
+    for e, k in enumerate(keys):
+        order[pos[k]] = e
+        pos[k] += 1
+    return off, order
+
+
+def tarjan_scc(n: int, succ: Callable[[int], Iterable[int]]) -> tuple[list[int], int]:
+    """
+    迭代版 Tarjan 强连通分量（不递归，长链不会撞递归上限），O(点 + 边)。
+
+    Returns:
+        (comp[点] = 分量号, 分量数)。分量号按完成顺序分配：能到达的分量号总是更小（汇点在前）
+    """
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comp = [-1] * n
+    stack: list[int] = []
+    counter = 0
+    ncomp = 0
+    for s in range(n):
+        if index[s] != -1:
+            continue
+        index[s] = low[s] = counter
+        counter += 1
+        stack.append(s)
+        on_stack[s] = True
+        work = [(s, iter(succ(s)))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, iter(succ(w))))
+                    break
+                if on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    if low[v] < low[u]:
+                        low[u] = low[v]
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp[w] = ncomp
+                        if w == v:
+                            break
+                    ncomp += 1
+    return comp, ncomp
+
+
+class RelationIndex:
+    """
+    一个版本的关系图索引。
+
+    rev：构建 / 打补丁时对应的变更日志 seq；db_path：所属数据库。
+    基础数组按 rel_id 升序（可二分查找）；打补丁只追加新产品 id，已有 id 不变。
+    """
+
+    def __init__(self, db_path: str, rev: int, codes: list[str], ids: dict[str, int], cols: dict[str, array]):
+        self.db_path = db_path
+        self.rev = rev
+        self.codes = codes
+        self.ids = ids
+        self.rel_id = cols["rel_id"]
+        self.src = cols["src"]
+        self.dst = cols["dst"]
+        self.line_id = cols["line_id"]
+        self.strong = cols["strong"]
+        self.directed = cols["directed"]
+        n = len(codes)
+        self.out_off, self.out_edge = _csr(n, self.src)
+        self.in_off, self.in_edge = _csr(n, self.dst)
+        # 叠加层
+        self.removed: frozenset[int] = frozenset()
+        self.added: dict[int, EdgeTuple] = {}
+        self._added_out: dict[int, list[int]] = {}
+        self._added_in: dict[int, list[int]] = {}
+
+    # ---------- 构建 / 补丁 ----------
+    @classmethod
+    def build(cls, db_path: str, rev: int) -> "RelationIndex":
+        ids: dict[str, int] = {}
+        cols = {name: array(t) for name, t in (
+            ("rel_id", "q"), ("src", "i"), ("dst", "i"), ("line_id", "i"), ("strong", "b"), ("directed", "b"),
+        )}
+        # 驻留：setdefault 一次调用完成“查 / 分配下一个 id”
+        intern = ids.setdefault
+        rel_ids, srcs, dsts = cols["rel_id"].append, cols["src"].append, cols["dst"].append
+        lines, strongs, directeds = cols["line_id"].append, cols["strong"].append, cols["directed"].append
+        with db.conn() as c:
+            cur = c.cursor()
+            cur.row_factory = None  # 百万行：元组比 sqlite3.Row 省一半时间
+            cur.execute("SELECT id, line_id, from_code, to_code, strength='strong', directed<>0 FROM relations ORDER BY id")
+            while True:
+                batch = cur.fetchmany(10000)
+                if not batch:
+                    break
+                for rid, lid, f, t, s, d in batch:
+                    rel_ids(rid)
+                    srcs(intern(f, len(ids)))
+                    dsts(intern(t, len(ids)))
+                    lines(lid)
+                    strongs(s)
+                    directeds(d)
+        codes = list(ids)  # dict 保持插入顺序，下标即 id
+        return cls(db_path, rev, codes, ids, cols)
+
+    def patched(self, rev: int, rows: list) -> "RelationIndex":
+        """
+        返回打了补丁的新索引（共享基础数组）。
+
+        rows：变更涉及的关系 id 及其当前行（已删除的为 None）：[(rel_id, row|None), ...]
+        """
+        new = object.__new__(RelationIndex)
+        new.__dict__.update(self.__dict__)
+        new.rev = rev
+        # codes / ids 只在出现新产品时才复制（一次），否则与旧对象共享：每次追赶不再是 O(产品数)
+        fresh = list(dict.fromkeys(
+            code for _, row in rows if row is not None
+            for code in (row["from_code"], row["to_code"]) if code not in self.ids
+        ))
+        if fresh:
+            new.codes = self.codes + fresh
+            new.ids = dict(self.ids)
+            new.ids.update((code, i) for i, code in enumerate(fresh, len(self.codes)))
+        removed = set(self.removed)
+        added = dict(self.added)
+        for rel_id, row in rows:
+            # removed 只记基础数组里的 id（__len__ 按它扣减）；叠加层里的直接替换
+            added.pop(rel_id, None)
+            if self._in_base(rel_id):
+                removed.add(rel_id)
+            if row is None:
+                continue
+            added[rel_id] = (
+                rel_id,
+                new.ids[row["from_code"]],
+                new.ids[row["to_code"]],
+                int(row["line_id"]),
+                1 if row["strength"] == "strong" else 0,
+                1 if row["directed"] else 0,
+            )
+        new.removed = frozenset(removed)
+        new.added = added
+        new._added_out = {}
+        new._added_in = {}
+        for e in added.values():
+            new._added_out.setdefault(e[1], []).append(e[0])
+            new._added_in.setdefault(e[2], []).append(e[0])
+        return new
+
+    def _in_base(self, rel_id: int) -> bool:
+        k = bisect_left(self.rel_id, rel_id)
+        return k < len(self.rel_id) and self.rel_id[k] == rel_id
+
+    def overlay_size(self) -> int:
+        return len(self.removed) + len(self.added)
+
+    # ---------- 查询 ----------
+    def __len__(self) -> int:
+        return len(self.rel_id) - len(self.removed) + len(self.added)
+
+    def id_of(self, code: str) -> int | None:
+        return self.ids.get(code)
+
+    def edge(self, rel_id: int) -> EdgeTuple | None:
+        """按关系 id 取边（不存在返回 None）。"""
+        e = self.added.get(rel_id)
+        if e is not None or rel_id in self.removed:
+            return e
+        k = bisect_left(self.rel_id, rel_id)
+        if k < len(self.rel_id) and self.rel_id[k] == rel_id:
+            return self._base_edge(k)
+        return None
+
+    def _base_edge(self, e: int) -> EdgeTuple:
+        return (
+            int(self.rel_id[e]), self.src[e], self.dst[e], self.line_id[e], self.strong[e], self.directed[e],
+        )
+
+    def out_edges(self, u: int) -> Iterator[EdgeTuple]:
+        """u 作为 from 端的所有关系（含叠加层）。"""
+        removed = self.removed
+        n_base = len(self.out_off) - 1
+        if u < n_base:
+            rel_id = self.rel_id
+            for k in range(self.out_off[u], self.out_off[u + 1]):
+                e = self.out_edge[k]
+                if not removed or rel_id[e] not in removed:
+                    yield self._base_edge(e)
+        for rid in self._added_out.get(u, ()):
+            yield self.added[rid]
+
+    def in_edges(self, v: int) -> Iterator[EdgeTuple]:
+        """v 作为 to 端的所有关系（含叠加层）。"""
+        removed = self.removed
+        n_base = len(self.in_off) - 1
+        if v < n_base:
+            rel_id = self.rel_id
+            for k in range(self.in_off[v], self.in_off[v + 1]):
+                e = self.in_edge[k]
+                if not removed or rel_id[e] not in removed:
+                    yield self._base_edge(e)
+        for rid in self._added_in.get(v, ()):
+            yield self.added[rid]
+
+    def successors(self, u: int, strength: str | None = None) -> Iterator[int]:
+        """沿有向边的下游产品 id（可能重复：同一对产品可有多条关系）。"""
+        want = None if strength is None else (1 if strength == "strong" else 0)
+        for e in self.out_edges(u):
+            if e[5] and (want is None or e[4] == want):
+                yield e[2]
+
+    def predecessors(self, v: int, strength: str | None = None) -> Iterator[int]:
+        """沿有向边的上游产品 id（可能重复）。"""
+        want = None if strength is None else (1 if strength == "strong" else 0)
+        for e in self.in_edges(v):
+            if e[5] and (want is None or e[4] == want):
+                yield e[1]
+
+    def components(self, line_id: int | None = None) -> tuple[list[int], int]:
+        """有向关系的强连通分量（tarjan_scc）；line_id 只看该产品线的关系。"""
+        if line_id is None:
+            return tarjan_scc(len(self.codes), self.successors)
+
+        def succ(u: int) -> Iterator[int]:
+            for e in self.out_edges(u):
+                if e[5] and e[3] == line_id:
+                    yield e[2]
+
+        return tarjan_scc(len(self.codes), succ)
+
+    def bfs(
+        self,
+        roots: list[str],
+        depth: int,
+        direction: str = "both",
+        strength: str | None = None,
+        max_nodes: int | None = None,
+    ) -> dict[str, int]:
+        """
+        内存 BFS：返回 {code: 跳数}（含起点，跳数 0）。
+
+        direction 与 repo.relations.neighborhood 一致：down / up / both，无向边总是可走。
+        """
+        want = None if strength is None else (1 if strength == "strong" else 0)
+        down = direction in ("down", "both")
+        up = direction in ("up", "both")
+        hops: dict[int, int] = {}
+        q = deque()
+        for code in roots:
+            i = self.ids.get(code)
+            if i is not None and i not in hops:
+                hops[i] = 0
+                q.append(i)
+        while q:
+            u = q.popleft()
+            h = hops[u]
+            if h >= depth:
+                continue
+            nxt = []
+            for e in self.out_edges(u):
+                if (want is None or e[4] == want) and (down or not e[5]):
+                    nxt.append(e[2])
+            for e in self.in_edges(u):
+                if (want is None or e[4] == want) and (up or not e[5]):
+                    nxt.append(e[1])
+            for v in nxt:
+                if v not in hops:
+                    if max_nodes is not None and len(hops) >= max_nodes:
+                        return {self.codes[i]: d for i, d in hops.items()}
+                    hops[v] = h + 1
+                    q.append(v)
+        return {self.codes[i]: d for i, d in hops.items()}
+
+    def nbytes(self) -> int:
+        """基础数组占用的字节数（不含 codes 字符串与叠加层）。"""
+        arrays = (
+            self.rel_id, self.src, self.dst, self.line_id, self.strong, self.directed,
+            self.out_off, self.out_edge, self.in_off, self.in_edge,
+        )
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    def stats(self) -> dict:
+        return {
+            "products": len(self.codes),
+            "relations": len(self),
+            "overlay": self.overlay_size(),
+            "array_bytes": self.nbytes(),
+            "rev": self.rev,
+        }
+
+
+_lock = threading.Lock()
+_indexes: dict[str, RelationIndex] = {}
+
+
+def current_rev() -> int:
+    """变更日志当前的最大 seq（一次主键查询）。"""
+    row = db.q_one("SELECT COALESCE(MAX(seq), 0) AS rev FROM line_changes")
+    return int(row["rev"])
+
+
+def changed_relations(rev: int) -> list[int] | None:
+    """rev 之后变更过的关系 id（去重保序）；日志已被裁剪返回 None。"""
+    floor = db.q_one("SELECT MIN(seq) AS s FROM line_changes")
+    if floor["s"] is not None and rev < int(floor["s"]) - 1:
+        return None
+    rows = db.q_all("SELECT ref FROM line_changes WHERE kind='relation' AND seq>? ORDER BY seq", (rev,))
+    return list(dict.fromkeys(int(r["ref"]) for r in rows))
+
+
+def relations_changed_since(rev: int, line_id: int | None = None) -> bool:
+    """
+    rev 之后有没有关系变更（line_id 给出时只看该产品线）；日志已被裁剪时当作有。
+
+    先比变更日志的最大 seq（没有任何写入时只这一次主键查询），再查到第一条匹配的日志为止。
+    """
+    if current_rev() == rev:
+        return False
+    floor = db.q_one("SELECT MIN(seq) AS s FROM line_changes")
+    if floor["s"] is not None and rev < int(floor["s"]) - 1:
+        return True
+    if line_id is None:
+        row = db.q_one("SELECT 1 AS x FROM line_changes WHERE kind='relation' AND seq>? LIMIT 1", (rev,))
+    else:
+        row = db.q_one(
+            "SELECT 1 AS x FROM line_changes WHERE line_id=? AND seq>? AND kind='relation' LIMIT 1",
+            (line_id, rev),
+        )
+    return row is not None
+
+
+def _current_rows(rel_ids: list[int]) -> list:
+    rows = {}
+    for k in range(0, len(rel_ids), 500):
+        chunk = rel_ids[k:k + 500]
+        ph = ",".join("?" * len(chunk))
+        for r in db.q_all(
+            f"SELECT id, line_id, from_code, to_code, strength, directed FROM relations WHERE id IN ({ph})",
+            tuple(chunk),
+        ):
+            rows[int(r["id"])] = r
+    return [(rid, rows.get(rid)) for rid in rel_ids]
+
+
+def get_index(patch_only: bool = False) -> RelationIndex:
+    """
+    当前数据库的关系索引（进程内单例）。
+
+    每次调用比较变更日志的最大 seq：没变直接返回；变了按日志打补丁，
+    叠加层超过 REL_INDEX_OVERLAY_MAX 或日志已被裁剪时整体重建。
+
+    patch_only：已有索引时只按日志追赶、不因叠加层过大而重建（持有写锁时用，
+    留给之后的普通调用去重建）；还没有索引或日志已被裁剪时仍会构建。
+    """
+    path = db.current_db_path()
+    rev = current_rev()
+    idx = _indexes.get(path)
+    if idx is not None and idx.rev == rev:
+        return idx
+    with _lock:
+        idx = _indexes.get(path)
+        if idx is not None and idx.rev == rev:
+            return idx
+        new = None
+        if idx is not None:
+            changed = changed_relations(idx.rev)
+            if changed is not None and (patch_only or idx.overlay_size() + len(changed) <= REL_INDEX_OVERLAY_MAX):
+                new = idx.patched(rev, _current_rows(changed))
+        if new is None:
+            new = RelationIndex.build(path, rev)
+        _indexes[path] = new
+        return new
+
+
+def invalidate() -> None:
+    """丢弃所有已构建的索引（测试 / 基准用）。"""
+    with _lock:
+        _indexes.clear()
@@ -1,7 +1,12 @@
+import json
 import sqlite3
-from core.db import q_all, exec_sql
+from core.db import q_all, q_one, exec_sql, transaction
+from core.cache import cached_read
+from repo import rel_index
+from repo.cycles import closing_path
 
 
+@cached_read
 def list_relations_in_line(line_id: int) -> list[sqlite3.Row]:
     """列出某产品线内所有关系（带 from/to 名称）。"""
     return q_all(
@@ -19,25 +24,105 @@ def list_relations_in_line(line_id: int) -> list[sqlite3.Row]:
     )
 
 
+@cached_read
+def list_relations_in_line_page(
+    line_id: int,
+    before: int | None = None,
+    limit: int = 50,
+) -> tuple[list[sqlite3.Row], int | None]:
+    """
+    线内关系分页（keyset，按 id 倒序；列与 list_relations_in_line 一致）。
+
+    Args:
+        before: 上一页返回的游标（上一页最后一条的 id）；None 表示第一页
+
+    Returns:
+        (本页行, 下一页游标)；没有下一页时游标为 None
+    """
+    cond = "AND r.id < ?" if before is not None else ""
+    rows = q_all(
+        f"""
+        SELECT r.*,
+               a.name AS from_name,
+               b.name AS to_name
+        FROM relations r
+        JOIN products a ON a.code=r.from_code
+        JOIN products b ON b.code=r.to_code
+        WHERE r.line_id=? {cond}
+        ORDER BY r.id DESC
+        LIMIT ?
+        """,
+        (line_id,) + ((before,) if before is not None else ()) + (limit + 1,),
+    )
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, int(rows[-1]["id"])
+    return rows, None
+
+
+@cached_read
+def list_relations_of_members(line_id: int) -> list[sqlite3.Row]:
+    """
+    读取线内关系，只保留 from/to 都是该线成员的边（用于产品线页作图）。
+
+    两次 JOIN line_products（主键查找），由数据库做集合过滤，不绑定成员列表。
+    """
+    return q_all(
+        """
+        SELECT r.*
+        FROM relations r
+        JOIN line_products fa ON fa.line_id=r.line_id AND fa.product_code=r.from_code
+        JOIN line_products fb ON fb.line_id=r.line_id AND fb.product_code=r.to_code
+        WHERE r.line_id=?
+        """,
+        (line_id,),
+    )
+
+
+@cached_read
 def list_relations_filtered(line_id: int, codes: list[str]) -> list[sqlite3.Row]:
     """
-    读取线内关系，但只保留 from/to 都在 codes 内的边（用于产品线页作图）。
+    读取线内关系，但只保留 from/to 都在 codes 内的边（任意子集）。
+
+    codes 作为一个 JSON 数组参数传入（json_each 展开成集合），
+    不受绑定参数个数上限影响；codes 就是整条线的成员时用 list_relations_of_members。
+
+    注意：IN 左侧加一元 +，只按 line_id 走索引、IN 只做过滤；否则规划器会在
+    (line_id, from_code, to_code) 索引上按 codes×codes 逐对查找，成员多时极慢。
     """
     if not codes:
         return []
-    ph = ",".join(["?"] * len(codes))
     return q_all(
-        f"""
-        SELECT *
-        FROM relations
-        WHERE line_id=?
-          AND from_code IN ({ph})
-          AND to_code IN ({ph})
+        """
+        WITH sel(code) AS (SELECT value FROM json_each(?))
+        SELECT r.*
+        FROM relations r
+        WHERE r.line_id=?
+          AND +r.from_code IN sel
+          AND +r.to_code IN sel
         """,
-        tuple([line_id] + codes + codes),
+        (json.dumps(list(codes), ensure_ascii=False), line_id),
     )
 
 
+@cached_read
+def get_relation(rel_id: int) -> sqlite3.Row | None:
+    """按 id 获取关系。"""
+    return q_one("SELECT * FROM relations WHERE id=?", (rel_id,))
+
+
+def _check_no_cycle(from_code: str, to_code: str) -> None:
+    """
+    有向关系 from->to 会闭合环路时抛 ValueError（消息带上已有的 to -> ... -> from 路径）。
+
+    在写事务里调用：索引只按变更日志追赶到最新，不在持有写锁时整体构建
+    （调用方在 BEGIN IMMEDIATE 之前先 rel_index.get_index() 一次）。
+    """
+    path = closing_path(from_code, to_code, index=rel_index.get_index(patch_only=True))
+    if path is not None:
+        raise ValueError(f"{from_code} -> {to_code} 会形成环路：{' -> '.join([from_code] + path)}")
+
+
 def create_relation(
     line_id: int,
     from_code: str,
@@ -46,15 +131,28 @@ def create_relation(
     directed: int,
     relation_type: str,
     edge_label: str | None,
+    check_cycle: bool = False,
 ) -> None:
-    """新增关系。"""
-    exec_sql(
-        """
-        INSERT INTO relations(line_id, from_code, to_code, strength, directed, relation_type, edge_label)
-        VALUES (?,?,?,?,?,?,?)
-        """,
-        (line_id, from_code, to_code, strength, directed, relation_type, edge_label),
-    )
+    """
+    新增关系。
+
+    check_cycle：新关系有向时先检查会不会闭合环路（跨产品线），会则抛 ValueError。
+    只从 to 出发在内存关系索引上搜索，不重扫全图；检查与插入在同一个写事务里
+    （BEGIN IMMEDIATE 之后索引按变更日志追到最新），并发会话不会各自通过检查后合起来成环。
+    索引冷启动 / 落后较多时的构建放在拿写锁之前，不让其他写入者等到 busy_timeout。
+    """
+    if check_cycle and directed:
+        rel_index.get_index()
+    with transaction():
+        if check_cycle and directed:
+            _check_no_cycle(from_code, to_code)
+        exec_sql(
+            """
+            INSERT INTO relations(line_id, from_code, to_code, strength, directed, relation_type, edge_label)
+            VALUES (?,?,?,?,?,?,?)
+            """,
+            (line_id, from_code, to_code, strength, directed, relation_type, edge_label),
+        )
 
 
 def update_relation(
@@ -63,12 +161,24 @@ def update_relation(
     directed: int,
     relation_type: str,
     edge_label: str | None,
+    check_cycle: bool = False,
 ) -> None:
-    """更新关系。"""
-    exec_sql(
-        "UPDATE relations SET strength=?, directed=?, relation_type=?, edge_label=? WHERE id=?",
-        (strength, directed, relation_type, edge_label, rel_id),
-    )
+    """
+    更新关系。
+
+    check_cycle：把无向关系改成有向时，同 create_relation 检查会不会闭合环路。
+    """
+    if check_cycle and directed:
+        rel_index.get_index()
+    with transaction():
+        if check_cycle and directed:
+            r = q_one("SELECT from_code, to_code, directed FROM relations WHERE id=?", (rel_id,))
+            if r is not None and not r["directed"]:
+                _check_no_cycle(r["from_code"], r["to_code"])
+        exec_sql(
+            "UPDATE relations SET strength=?, directed=?, relation_type=?, edge_label=? WHERE id=?",
+            (strength, directed, relation_type, edge_label, rel_id),
+        )
 
 
 def delete_relation(rel_id: int) -> None:
@@ -88,6 +198,7 @@ def delete_relations_of_product_in_line(line_id: int, product_code: str) -> None
     )
 
 
+@cached_read
 def global_upstream(product_code: str) -> list[sqlite3.Row]:
     """跨线：directed=1 且 to_code=本体。"""
     return q_all(
@@ -104,6 +215,7 @@ def global_upstream(product_code: str) -> list[sqlite3.Row]:
     )
 
 
+@cached_read
 def global_downstream(product_code: str) -> list[sqlite3.Row]:
     """跨线：directed=1 且 from_code=本体。"""
     return q_all(
@@ -120,19 +232,156 @@ def global_downstream(product_code: str) -> list[sqlite3.Row]:
     )
 
 
+@cached_read
 def global_undirected(product_code: str) -> list[sqlite3.Row]:
-    """跨线：directed=0 且本体参与其中。"""
+    """
+    跨线：directed=0 且本体参与其中。
+
+    from/to 两个分支 UNION 出 id（各走 idx_rel_from_dir / idx_rel_to_dir 覆盖索引），
+    再按主键回表；自环只出现一次。
+    """
     return q_all(
         """
+        WITH hit AS (
+            SELECT id FROM relations WHERE from_code=? AND directed=0
+            UNION
+            SELECT id FROM relations WHERE to_code=? AND directed=0
+        )
         SELECT r.id, r.line_id, pl.name AS line_name,
                r.from_code, r.to_code, r.strength, r.directed, r.relation_type, r.edge_label,
                a.name AS a_name, b.name AS b_name,
                a.image_path AS a_img, b.image_path AS b_img
-        FROM relations r
+        FROM hit
+        JOIN relations r ON r.id=hit.id
         JOIN products a ON a.code=r.from_code
         JOIN products b ON b.code=r.to_code
         JOIN product_lines pl ON pl.id=r.line_id
-        WHERE r.directed=0 AND (r.from_code=? OR r.to_code=?)
         """,
         (product_code, product_code),
     )
+
+
+# N 跳邻域：每个方向一条递归步（SQLite 3.34+ 允许多个递归 SELECT）；?2=深度 ?3=强弱（NULL 不限）
+_HOP_DOWN = """
+    SELECT r.to_code, w.hop + 1 FROM walk w
+    JOIN relations r ON r.from_code=w.code AND r.directed=1
+    WHERE w.hop < ?2 AND (?3 IS NULL OR r.strength=?3)"""
+_HOP_UP = """
+    SELECT r.from_code, w.hop + 1 FROM walk w
+    JOIN relations r ON r.to_code=w.code AND r.directed=1
+    WHERE w.hop < ?2 AND (?3 IS NULL OR r.strength=?3)"""
+# 无向边在任何方向下都可走
+_HOP_UNDIRECTED = """
+    SELECT r.to_code, w.hop + 1 FROM walk w
+    JOIN relations r ON r.from_code=w.code AND r.directed=0
+    WHERE w.hop < ?2 AND (?3 IS NULL OR r.strength=?3)
+    UNION
+    SELECT r.from_code, w.hop + 1 FROM walk w
+    JOIN relations r ON r.to_code=w.code AND r.directed=0
+    WHERE w.hop < ?2 AND (?3 IS NULL OR r.strength=?3)"""
+_HOP_STEPS = {
+    "down": (_HOP_DOWN, _HOP_UNDIRECTED),
+    "up": (_HOP_UP, _HOP_UNDIRECTED),
+    "both": (_HOP_DOWN, _HOP_UP, _HOP_UNDIRECTED),
+}
+
+
+@cached_read
+def neighborhood(
+    codes: list[str],
+    depth: int,
+    direction: str = "both",
+    strength: str | None = None,
+    max_nodes: int = 200,
+    known: list[str] = (),
+    max_edges: int = 1000,
+) -> tuple[list[sqlite3.Row], list[sqlite3.Row], bool]:
+    """
+    跨线 N 跳邻域（递归 CTE，按跳数由近到远）。
+
+    Args:
+        codes: 起点产品
+        depth: 最多走几跳
+        direction: down=只沿有向边往下游 / up=只往上游 / both=两个方向；无向边总是可走
+        strength: "strong" / "weak" 只走该强度的边；None 不限
+        max_nodes: 最多返回多少个新产品（离起点近的优先）
+        known: 调用方已有的产品：不再作为新节点返回，但它们与新节点之间的边会返回
+            （详情页逐个展开时只取新的一圈）
+        max_edges: 最多返回多少条（合并后的）边，合并条数多的优先
+
+    Returns:
+        (节点, 边, 是否因 max_nodes / max_edges 截断)
+        节点列：code, name, image_path, hop
+        边列：id, line_id, line_name, from_code, to_code, strength, directed, relation_type, edge_label, n
+        （同一对产品同向同强度的多条关系合并为一条，id/line 取最小的那条，n 为条数）
+    """
+    if direction not in _HOP_STEPS:
+        raise ValueError(f"direction must be one of {sorted(_HOP_STEPS)}: {direction!r}")
+    if not codes:
+        return [], [], False
+    seeds = json.dumps(list(codes), ensure_ascii=False)
+    known_json = json.dumps(list(known), ensure_ascii=False)
+    steps = "\n    UNION".join(_HOP_STEPS[direction])
+
+    # 同一产品可能以不同跳数多次出现在 walk 里，LIMIT 留出余量，最后按最小跳数去重截断
+    nodes = q_all(
+        f"""
+        WITH RECURSIVE walk(code, hop) AS (
+            SELECT value, 0 FROM json_each(?1)
+            UNION{steps}
+            ORDER BY 2
+            LIMIT ?4
+        ),
+        reached AS (
+            SELECT code, MIN(hop) AS hop FROM walk
+            WHERE code NOT IN (SELECT value FROM json_each(?5))
+            GROUP BY code
+            ORDER BY hop, code
+            LIMIT ?6
+        )
+        SELECT p.code, p.name, p.image_path, reached.hop
+        FROM reached
+        JOIN products p ON p.code=reached.code
+        ORDER BY reached.hop, p.code
+        """,
+        (seeds, int(depth), strength, (int(max_nodes) + len(known) + 1) * (int(depth) + 1), known_json, int(max_nodes) + 1),
+    )
+    truncated = len(nodes) > max_nodes
+    nodes = nodes[:max_nodes]
+    if not nodes:
+        return [], [], False
+
+    # 两个产品之间的同向、同强度的多条关系（通常分属不同产品线）合并成一条，n=条数；
+    # 产品线、类型、标签都取自同一条代表关系（id 最小的那条），不各自取 MIN 拼出不存在的组合
+    fresh = [r["code"] for r in nodes]
+    edges = q_all(
+        """
+        WITH fresh(code) AS (SELECT value FROM json_each(?1)),
+             shown(code) AS (SELECT value FROM json_each(?1) UNION SELECT value FROM json_each(?2)),
+             hit AS (
+                 SELECT id FROM relations WHERE from_code IN fresh AND to_code IN shown
+                 UNION
+                 SELECT id FROM relations WHERE to_code IN fresh AND from_code IN shown
+             ),
+             grouped AS (
+                 SELECT MIN(r.id) AS id, COUNT(*) AS n
+                 FROM hit
+                 JOIN relations r ON r.id=hit.id
+                 WHERE ?3 IS NULL OR r.strength=?3
+                 GROUP BY r.from_code, r.to_code, r.directed, r.strength
+             )
+        SELECT r.id, r.line_id, pl.name AS line_name,
+               r.from_code, r.to_code, r.strength, r.directed, r.relation_type, r.edge_label,
+               g.n
+        FROM grouped g
+        JOIN relations r ON r.id=g.id
+        JOIN product_lines pl ON pl.id=r.line_id
+        ORDER BY g.n DESC, r.id
+        LIMIT ?4
+        """,
+        (json.dumps(fresh, ensure_ascii=False), known_json, strength, int(max_edges) + 1),
+    )
+    if len(edges) > max_edges:
+        edges = edges[:max_edges]
+        truncated = True
+    return nodes, edges, truncated
@@ -0,0 +1,62 @@
+import functools
+
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from core import perf
+from core.settings import USE_FRAGMENTS
+
+# st.fragment（1.37+）；更早的版本叫 experimental_fragment；都没有就退回整页重跑
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def fragments_enabled() -> bool:
+    return bool(USE_FRAGMENTS and _st_fragment is not None)
+
+
+def fragment(fn):
+    """
+    把一块页面声明为片段：块内控件的交互只重跑这个函数，不重跑整个脚本。
+
+    注意：
+    - 片段重跑时沿用上次整页运行时传入的参数，参数只放整页切换才会变的值（line_id、code 等）
+    - 片段只能往自己内部写元素，不要在外面建好 columns 再传进来
+    - 不支持片段（或 USE_FRAGMENTS=False）时原样返回，行为与整页重跑一致
+    - 性能 trace：随整页运行时计入整页的 trace；只重跑片段时单独记一条，标签为 "fragment:函数名"
+    """
+    if not fragments_enabled():
+        return fn
+
+    @functools.wraps(fn)
+    def traced(*args, **kwargs):
+        if perf.current() is not None:
+            return fn(*args, **kwargs)
+        perf.start_trace(f"fragment:{fn.__name__}")
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            # st.rerun() 以异常跳出时也要结束本次 trace
+            perf.end_trace()
+
+    return _st_fragment(traced)
+
+
+def in_fragment_rerun() -> bool:
+    """
+    本次运行是不是只重跑片段（片段内控件的交互触发），而不是整页运行。
+
+    取不到运行上下文（或版本没有这个信息）时按整页运行处理。
+    """
+    ctx = get_script_run_ctx()
+    return bool(getattr(ctx, "fragment_ids_this_run", None))
+
+
+def rerun_fragment() -> None:
+    """只重跑当前片段（翻页、切换选中项等局部状态变化）；不在片段内时整页重跑。"""
+    if fragments_enabled():
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            pass
+    st.rerun()
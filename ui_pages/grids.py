@@ -0,0 +1,51 @@
+import pandas as pd
+import streamlit as st
+
+from core.settings import ADMIN_PAGE_SIZE
+from ui_pages.fragments import rerun_fragment
+
+
+def rows_to_frame(rows) -> pd.DataFrame:
+    """sqlite3.Row 列表直接建 DataFrame（不逐行转 dict）。"""
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(rows, columns=rows[0].keys())
+
+
+def paged_grid(key: str, fetch_page, page_size: int = ADMIN_PAGE_SIZE) -> list:
+    """
+    分页表格：每次只取一页（keyset 游标），上一页/下一页按钮翻页。
+
+    放在片段里时翻页只重跑该片段。
+
+    Args:
+        key: 分页状态的 session_state 前缀（同一数据源用同一个 key）
+        fetch_page: (cursor, limit) -> (rows, next_cursor)
+
+    Returns:
+        当前页的行（供下方“选择要修改的项”使用）
+    """
+    ss = st.session_state
+    stack = ss.setdefault(f"{key}_cursors", [None])
+
+    rows, next_cursor = fetch_page(stack[-1], page_size)
+    if not rows and len(stack) > 1:
+        # 删除等操作后当前页变空：回到第一页
+        stack[:] = [None]
+        rows, next_cursor = fetch_page(None, page_size)
+
+    st.dataframe(rows_to_frame(rows), width="stretch")
+
+    c1, c2, c3 = st.columns([1, 1, 4])
+    with c1:
+        if st.button("上一页", key=f"{key}_prev", disabled=len(stack) <= 1):
+            stack.pop()
+            rerun_fragment()
+    with c2:
+        if st.button("下一页", key=f"{key}_next", disabled=next_cursor is None):
+            stack.append(next_cursor)
+            rerun_fragment()
+    with c3:
+        st.caption(f"第 {len(stack)} 页（每页 {page_size} 行）")
+
+    return rows
@@ -1,10 +1,14 @@
 import streamlit as st
 from streamlit_agraph import agraph, Config
 
+from core.perf import timed
+from core.settings import LINE_CARD_PAGE_SIZE
 from core.scroll import safe_dom_id, scroll_to_anchor, go
 from graph.nodes import img_path_or_none, show_image_with_zoom
 from graph.build_line import build_line_graph
 from repo.lines import list_lines_sorted, get_line
+from repo.products import get_product_text
+from ui_pages.fragments import fragment, in_fragment_rerun, rerun_fragment
 
 
 def get_clicked_node(selected):
@@ -29,12 +33,16 @@ def get_clicked_node(selected):
     return None
 
 
+@timed("page.line")
 def render_line_page() -> None:
     """
     产品线页：
     - 选择产品线
     - 显示线内关系图（手动坐标）
-    - 下方卡片列表：点击节点 => 滚动到卡片；按钮 => 进入详情页
+    - 下方卡片列表（分页窗口）：点击节点 => 跳到所在页并滚动到卡片；按钮 => 进入详情页
+
+    关系图与卡片列表各是一个片段（st.fragment）：点节点只重跑关系图，
+    不重建侧边栏、不重新查询产品线、也不重发卡片。
     """
     st.subheader("产品线页面（左→右分层，强=实线，弱=虚线）")
 
@@ -65,30 +73,103 @@ def render_line_page() -> None:
     if line and line["description"]:
         st.caption(line["description"])
 
-    products, nodes, edges = build_line_graph(int(line_id))
+    products, _nodes, _edges = build_line_graph(int(line_id))
     if not products:
         st.warning("该产品线里还没有产品。请先到【后台管理】→【产品线内容管理】加入产品。")
         return
 
+    _line_graph(int(line_id))
+
+    st.divider()
+    _card_list(int(line_id))
+
+
+def _card_order(products) -> list:
+    """卡片顺序：主线在前，各自按 X（sort_order）、code 排。"""
+    main_ps = [p for p in products if int(p["is_main"]) == 1]
+    sub_ps = [p for p in products if int(p["is_main"]) == 0]
+    main_ps.sort(key=lambda r: (float(r["sort_order"] or 0.0), r["code"]))
+    sub_ps.sort(key=lambda r: (float(r["sort_order"] or 0.0), r["code"]))
+    return main_ps + sub_ps
+
+
+def _page_key(line_id: int) -> str:
+    return f"line_cards_page_{line_id}"
+
+
+@fragment
+def _line_graph(line_id: int) -> None:
+    """
+    关系图片段：点击节点 => 滚动到卡片。
+
+    卡片在当前窗口里：只重跑本片段并滚动；不在：切到包含它的那一页，整页重跑后由卡片列表滚动。
+    agraph 之后每次重跑都会返回上一次点击的节点，只处理新的点击事件，
+    否则翻页后的任何整页重跑都会被旧点击拉回节点所在页：
+    - 点了另一个节点：返回值变了（上次处理的节点按线记在 session_state）
+    - 再点同一个节点：返回值不变，但点击只重跑本片段（in_fragment_rerun）；
+      不支持片段时无法区分，同一节点的再次点击会被忽略
+    """
+    products, nodes, edges = build_line_graph(line_id)
+
     st.markdown("#### 产品线关系图（点击节点 => 滚动到卡片）")
     config = Config(width="100%", height=520, directed=True, physics=False, hierarchical=False, nodeHighlightBehavior=True)
     selected = agraph(nodes=nodes, edges=edges, config=config)
     clicked = get_clicked_node(selected)
+    last_key = f"line_graph_click_{line_id}"
 
-    if clicked:
+    if clicked and (clicked != st.session_state.get(last_key) or in_fragment_rerun()):
+        st.session_state[last_key] = clicked
         real_code = clicked.split("@@")[0]
-        st.session_state.scroll_to = real_code
         st.session_state.needs_top = 0
 
-    st.divider()
-    st.markdown("#### 产品介绍（左图 / 中介绍 / 右按钮）")
+        codes = [p["code"] for p in _card_order(products)]
+        if real_code not in codes:
+            return
+        page = codes.index(real_code) // LINE_CARD_PAGE_SIZE
+        key = _page_key(line_id)
+        if st.session_state.get(key, 0) != page:
+            st.session_state[key] = page
+            st.session_state.scroll_to = real_code
+            st.rerun()
+        scroll_to_anchor(f"prod-{safe_dom_id(real_code)}", offset=250)
+
+
+@fragment
+@timed("page.line.cards")
+def _card_list(line_id: int) -> None:
+    """
+    卡片列表片段（左图 / 中介绍 / 右按钮）：一次只渲染一页 LINE_CARD_PAGE_SIZE 张卡片，
+    翻页只重跑本片段；图片解码、介绍查询也只发生在当前页。
+    """
+    products, _nodes, _edges = build_line_graph(line_id)
+    ordered = _card_order(products)
 
-    main_ps = [p for p in products if int(p["is_main"]) == 1]
-    sub_ps = [p for p in products if int(p["is_main"]) == 0]
-    main_ps.sort(key=lambda r: (float(r["sort_order"] or 0.0), r["code"]))
-    sub_ps.sort(key=lambda r: (float(r["sort_order"] or 0.0), r["code"]))
+    st.markdown("#### 产品介绍（左图 / 中介绍 / 右按钮）")
 
-    for p in main_ps + sub_ps:
+    pages = max(1, -(-len(ordered) // LINE_CARD_PAGE_SIZE))
+    key = _page_key(line_id)
+    page = min(max(0, int(st.session_state.get(key, 0))), pages - 1)
+    st.session_state[key] = page
+
+    if pages > 1:
+        c1, c2, c3 = st.columns([1, 1, 4])
+        with c1:
+            if st.button("上一页", key=f"line_cards_prev_{line_id}", disabled=page == 0):
+                st.session_state[key] = page - 1
+                rerun_fragment()
+        with c2:
+            if st.button("下一页", key=f"line_cards_next_{line_id}", disabled=page >= pages - 1):
+                st.session_state[key] = page + 1
+                rerun_fragment()
+        with c3:
+            lo = page * LINE_CARD_PAGE_SIZE
+            st.caption(
+                f"第 {page + 1} / {pages} 页（{lo + 1}–{min(lo + LINE_CARD_PAGE_SIZE, len(ordered))} / {len(ordered)}；"
+                f"点击关系图节点会跳到所在页）"
+            )
+
+    window = ordered[page * LINE_CARD_PAGE_SIZE:(page + 1) * LINE_CARD_PAGE_SIZE]
+    for p in window:
         code = p["code"]
         anchor = f"prod-{safe_dom_id(code)}"
 
@@ -99,7 +180,7 @@ def render_line_page() -> None:
             with c1:
                 imgp = img_path_or_none(p["image_path"])
                 if imgp:
-                    show_image_with_zoom(imgp)
+                    show_image_with_zoom(imgp, key=f"card_{code}")
                 else:
                     st.info("无图片")
 
@@ -107,7 +188,8 @@ def render_line_page() -> None:
                 st.markdown(f"### {p['code']} / {p['name']}")
                 if p["category"]:
                     st.caption(p["category"])
-                st.write(p["intro"] or "")
+                text = get_product_text(code)
+                st.write((text["intro"] if text else None) or "")
 
             with c3:
                 st.write("")
@@ -117,7 +199,7 @@ def render_line_page() -> None:
 
         st.divider()
 
-    if st.session_state.scroll_to:
-        a = f"prod-{safe_dom_id(st.session_state.scroll_to)}"
-        scroll_to_anchor(a, offset=250)
-        st.session_state.scroll_to = None
+    target = st.session_state.scroll_to
+    if target and any(p["code"] == target for p in window):
+        scroll_to_anchor(f"prod-{safe_dom_id(target)}", offset=250)
+    st.session_state.scroll_to = None
@@ -0,0 +1,42 @@
+import pandas as pd
+import streamlit as st
+
+from core import perf
+from core.settings import PERF_TOP_QUERIES
+
+
+def render_perf_panel(trace: perf.Trace | None) -> None:
+    """侧边栏：本次 rerun 的耗时分解、最慢 SQL、此前的片段重跑，以及最近 trace 的 JSONL 导出。"""
+    if trace is None:
+        return
+    with st.sidebar.expander("性能（本次 rerun）"):
+        c1, c2, c3 = st.columns(3)
+        c1.metric("总耗时", f"{trace.total * 1000:.0f} ms")
+        c2.metric("SQL", f"{trace.sql_seconds() * 1000:.0f} ms")
+        c3.metric("查询数", len(trace.queries))
+
+        st.caption("耗时分解（自身耗时不含嵌套项与 SQL）")
+        st.dataframe(pd.DataFrame(trace.breakdown()), hide_index=True, width="stretch")
+
+        st.caption(f"最慢的 {PERF_TOP_QUERIES} 条 SQL")
+        st.dataframe(pd.DataFrame(trace.top_queries()), hide_index=True, width="stretch")
+
+        traces = perf.recent_traces()
+        # 片段局部重跑不会重画侧边栏：在这里列出上次整页之后的片段 trace
+        frags = []
+        for t in reversed(traces[:-1]):
+            if not t.label.startswith("fragment:"):
+                break
+            frags.append({"label": t.label, "total_ms": t.total * 1000, "sql_ms": t.sql_seconds() * 1000,
+                          "queries": len(t.queries)})
+        if frags:
+            st.caption(f"此前的 {len(frags)} 次片段重跑（新的在前）")
+            st.dataframe(pd.DataFrame(frags), hide_index=True, width="stretch")
+
+        st.download_button(
+            f"导出最近 {len(traces)} 次 rerun（JSONL）",
+            perf.to_jsonl(traces),
+            file_name="perf_traces.jsonl",
+            mime="application/jsonl",
+            key="perf_export",
+        )
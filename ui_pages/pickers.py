@@ -0,0 +1,44 @@
+import streamlit as st
+
+from core.settings import PICKER_LIMIT
+from repo.products import search_products, get_product_brief
+
+
+def product_picker(label: str, key: str, current_code: str | None = None, limit: int = PICKER_LIMIT) -> str | None:
+    """
+    产品选择（搜索框 + 候选下拉）：只取回前 limit 条匹配，产品再多渲染成本也不变。
+
+    - 选择框的值是 code（session_state[key]），外部可直接写入 code 来同步显示
+    - current_code 不在候选里时也会保留在第一项，避免搜索后丢失当前选择
+    - 空搜索框时列出按 code 排序的前 limit 个
+    - 搜索在回车 / 失焦时执行（st.text_input 不逐键回传）；候选下拉本身可再输入做本地过滤
+    """
+    q = st.text_input(
+        f"搜索{label}（型号 / 名称 / 类别 / 简介，回车搜索）",
+        key=f"{key}_q",
+        placeholder="例如：CBMK 或 加热",
+    )
+    rows = search_products(q, limit)
+    names = {r["code"]: r["name"] for r in rows}
+    options = list(names)
+
+    keep = current_code or st.session_state.get(key)
+    if keep and keep not in names:
+        cur = get_product_brief(keep)
+        if cur:
+            options.insert(0, cur["code"])
+            names[cur["code"]] = cur["name"]
+
+    if not options:
+        st.caption("没有匹配的产品。")
+        return None
+
+    if st.session_state.get(key) not in options:
+        st.session_state[key] = options[0]
+
+    return st.selectbox(
+        label,
+        options,
+        key=key,
+        format_func=lambda c: f"{c} | {names.get(c, '')}",
+    )
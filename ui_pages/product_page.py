@@ -1,12 +1,18 @@
 import streamlit as st
 from streamlit_agraph import agraph, Config
 
+from core.perf import timed
+from core.settings import NEIGHBORHOOD_MAX_DEPTH, NEIGHBORHOOD_MAX_NODES, NEIGHBORHOOD_MAX_EDGES
 from core.scroll import go
 from graph.nodes import img_path_or_none, show_image_with_zoom
 from graph.build_product_global import build_product_graph_global
-from repo.products import list_products
+from graph.neighborhood import build_neighborhood_graph
+from repo.products import count_products, first_product_code, get_product_brief, get_product_text
 from repo.line_content import list_lines_for_product
 from repo.lines import list_lines_sorted
+from repo.reachability import ready_reachability
+from ui_pages.fragments import fragment, rerun_fragment
+from ui_pages.pickers import product_picker
 
 
 def get_clicked_node(selected):
@@ -29,42 +35,46 @@ def get_clicked_node(selected):
     return None
 
 
+@timed("page.product")
 def render_product_page() -> None:
     """
     产品详情页：
     - 选择产品
     - 显示跨线的上下游/无向关系图（层级 UD）
+    - 可选：N 跳邻域探索（点击节点逐步向外展开）
     - 展示详情 + 所属产品线快捷返回
+
+    关系图与详情面板各是一个片段（st.fragment），互不牵连重跑。
     """
     st.subheader("产品详情页面（展示该产品所有可能的上下游/可连接产品）")
 
-    products = list_products()
-    if not products:
+    if count_products() == 0:
         st.info("还没有产品。请先到【后台管理】→【产品库（全局）】新增产品。")
         return
 
-    current_code = st.session_state.product or products[0]["code"]
-    labels = [f'{p["code"]} | {p["name"]}' for p in products]
-    codes = [p["code"] for p in products]
-    idx = codes.index(current_code) if current_code in codes else 0
-
-    # ✅ 关键：只在 widget 创建前初始化（或列表变化时纠正）
-    if (
-        "product_selectbox" not in st.session_state
-        or st.session_state["product_selectbox"] not in labels
-    ):
-        st.session_state["product_selectbox"] = labels[idx]
-
-    chosen = st.selectbox("选择产品（下拉）", labels, key="product_selectbox")
-    code = chosen.split(" | ")[0].strip()
+    current_code = st.session_state.product or first_product_code()
+    code = product_picker("产品", key="product_selectbox", current_code=current_code)
+    if not code:
+        return
     st.session_state.product = code
 
 
-    p, nodes, edges = build_product_graph_global(code)
-    if not p:
+    if not get_product_brief(code):
         st.error("产品不存在。")
         return
 
+    _product_graph(code)
+    _neighborhood_explorer(code)
+
+    st.divider()
+    _detail_panel(code)
+
+
+@fragment
+def _product_graph(code: str) -> None:
+    """关系图片段：点击其他节点 => 整页跳到该产品详情。"""
+    _p, nodes, edges = build_product_graph_global(code)
+
     st.markdown("#### 上下游/可连接关系图（点击节点 => 跳到该产品详情）")
     config = Config(
         width="100%",
@@ -85,7 +95,61 @@ def render_product_page() -> None:
         if real_code != code:
             go("产品详情", product_code=real_code)
 
-    st.divider()
+
+_DIRECTIONS = {"双向": "both", "只看下游": "down", "只看上游": "up"}
+_STRENGTHS = {"全部": None, "强": "strong", "弱": "weak"}
+
+
+@fragment
+@timed("page.product.neighborhood")
+def _neighborhood_explorer(code: str) -> None:
+    """
+    N 跳邻域片段（默认收起）：按深度 / 方向 / 强弱取跨线邻域；点击外圈节点只取它的新一圈并并入图中。
+    """
+    if not st.toggle("N 跳邻域探索（跨产品线，点击节点向外展开一跳）", key="nbh_on"):
+        return
+
+    c1, c2, c3 = st.columns([2, 2, 1])
+    with c1:
+        depth = st.slider("深度（跳）", 1, NEIGHBORHOOD_MAX_DEPTH, 2, key="nbh_depth")
+    with c2:
+        direction = st.radio("方向", list(_DIRECTIONS), horizontal=True, key="nbh_direction")
+    with c3:
+        strength = st.selectbox("强弱", list(_STRENGTHS), key="nbh_strength")
+
+    params = (code, int(depth), _DIRECTIONS[direction], _STRENGTHS[strength], NEIGHBORHOOD_MAX_NODES, NEIGHBORHOOD_MAX_EDGES)
+    nb = st.session_state.get("nbh_graph")
+    if nb is None or nb.params != params:
+        nb = st.session_state.nbh_graph = build_neighborhood_graph(*params)
+
+    nodes, edges = nb.elements()
+    config = Config(width="100%", height=520, directed=True, physics=True, hierarchical=False, nodeHighlightBehavior=True)
+    clicked = get_clicked_node(agraph(nodes=nodes, edges=edges, config=config))
+    if clicked and clicked not in nb.expanded:
+        # 展开后图数据变了，agraph 会按新参数重建，点击值随之清空，不会重复展开
+        nb.expand(clicked)
+        rerun_fragment()
+
+    note = f"{len(nodes)} 个产品 / {len(edges)} 条关系（同一对产品的多条关系合并显示）"
+    if nb.truncated:
+        note += f"；已截断：每步最多 {NEIGHBORHOOD_MAX_NODES} 个产品、{NEIGHBORHOOD_MAX_EDGES} 条关系"
+    c4, c5 = st.columns([5, 1])
+    with c4:
+        st.caption(note)
+    with c5:
+        if st.button("重置", key="nbh_reset"):
+            st.session_state.nbh_graph = None
+            rerun_fragment()
+
+
+@fragment
+@timed("page.product.detail")
+def _detail_panel(code: str) -> None:
+    """详情面板片段（左图 / 中详情 / 右相关产品线）。"""
+    p = get_product_brief(code)
+    if not p:
+        return
+
     st.markdown("#### 产品详情（左图 / 中详情 / 右相关产品线）")
 
     left, mid, right = st.columns([1.2, 3.8, 1.6], gap="large")
@@ -93,7 +157,7 @@ def render_product_page() -> None:
     with left:
         imgp = img_path_or_none(p["image_path"])
         if imgp:
-            show_image_with_zoom(imgp)
+            show_image_with_zoom(imgp, key=f"detail_{code}")
         else:
             st.info("无图片")
 
@@ -101,8 +165,10 @@ def render_product_page() -> None:
         st.markdown(f"## {p['code']} / {p['name']}")
         if p["category"]:
             st.caption(p["category"])
+        _reach_badge(code)
         st.markdown("### 详细介绍")
-        st.write(p["detail"] or "")
+        text = get_product_text(p["code"])
+        st.write((text["detail"] if text else None) or "")
 
     with right:
         st.markdown("### 存在该产品的产品线（点击跳回产品线）")
@@ -115,3 +181,35 @@ def render_product_page() -> None:
         for l in lines2:
             if st.button(f"↩ #{id2d.get(l['id'], l['id'])} {l['name']}", key=f"go_line_{l['id']}"):
                 go("产品线", line_id=l["id"])
+
+
+def _reach_badge(code: str) -> None:
+    """
+    可达性徽标：经有向关系（跨线、任意跳数）能到达 / 被到达的产品数，外加“A 是否在 B 上游”查询。
+
+    索引在后台构建：还没建好时只显示提示，不让页面等全库构建。
+    """
+    reach = ready_reachability()
+    if reach is None:
+        st.caption("上下游可达性统计准备中（后台正在建立全库关系索引）……")
+        return
+    n = reach.counts(code)
+    badge = f":blue[⬆ 上游可达 {n['ancestors']} 个产品]　:green[⬇ 下游可达 {n['descendants']} 个产品]"
+    if n["cycle"] > 1:
+        badge += f"　:red[⟳ 与另外 {n['cycle'] - 1} 个产品成环]"
+    st.markdown(badge)
+
+    with st.expander("上下游可达性查询"):
+        other = product_picker("另一个产品", key="reach_other")
+        if not other or other == code:
+            return
+        down = reach.reaches(code, other)
+        up = reach.reaches(other, code)
+        if down and up:
+            st.warning(f"{code} 与 {other} 互相可达（在同一个环里）")
+        elif down:
+            st.success(f"{code} 在 {other} 的上游（经有向关系一路可达）")
+        elif up:
+            st.success(f"{code} 在 {other} 的下游（{other} 经有向关系一路可达 {code}）")
+        else:
+            st.info(f"{code} 与 {other} 之间没有有向通路")